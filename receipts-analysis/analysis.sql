@@ -47,6 +47,8 @@ SELECT
     TRY_TO_DECIMAL(REPLACE(REPLACE(extracted_data:budget.total_budget::STRING, '$', ''), ',', ''), 10, 2) AS campaign_budget,
     extracted_data:targeting.frequency_cap::STRING AS frequency_cap,
     extracted_data:targeting.age_range::STRING AS age_range,
+    -- Date partition of the stage path (upload_receipts.py --partition-by date); NULL for unpartitioned files
+    TRY_TO_DATE(REGEXP_SUBSTR(relative_path, '^[0-9]{4}/[0-9]{2}/[0-9]{2}'), 'YYYY/MM/DD') AS stage_partition_date,
     CURRENT_TIMESTAMP() AS processed_at
 FROM extracted_receipt_data;
 
@@ -82,6 +84,8 @@ SELECT
     TRY_TO_DECIMAL(REPLACE(REPLACE(extracted_data:response.budget.daily_budget[0]::STRING, '$', ''), ',', ''), 10, 2) AS daily_budget,
     TRY_TO_DECIMAL(REPLACE(REPLACE(extracted_data:response.budget.total_budget[0]::STRING, '$', ''), ',', ''), 10, 2) AS campaign_budget,
     extracted_data:response.targeting.age_range[0]::STRING AS age_range,
+    -- Date partition of the stage path (upload_receipts.py --partition-by date); NULL for unpartitioned files
+    TRY_TO_DATE(REGEXP_SUBSTR(relative_path, '^[0-9]{4}/[0-9]{2}/[0-9]{2}'), 'YYYY/MM/DD') AS stage_partition_date,
     CURRENT_TIMESTAMP() AS processed_at
 FROM extracted_receipt_data_via_ai_extract;
 
@@ -327,6 +331,26 @@ WHERE transaction_date IS NULL
    OR total_amount = 0 
    OR campaign_name IS NULL;
 
+-- ============================================================================
+-- Recent Data (Date-Partitioned Stage)
+-- ============================================================================
+
+-- ----------------------------------------------------------------------------
+-- 14. Recent Partitions Only
+-- ----------------------------------------------------------------------------
+-- With date-partitioned uploads, report the receipts staged in the last days
+-- by partition. The filter is on the date parsed from each row's stage path:
+-- every extracted row is still read, and unpartitioned files (NULL date) drop out
+
+SELECT 
+    stage_partition_date,
+    COUNT(*) AS receipt_count,
+    SUM(total_amount) AS total_spending
+FROM receipt_analytics_ai_extract_vw
+WHERE stage_partition_date >= DATEADD(day, -1, CURRENT_DATE())
+GROUP BY stage_partition_date
+ORDER BY stage_partition_date DESC;
+
 -- ============================================================================
 -- End of Analytics Queries
 -- ============================================================================
@@ -2,7 +2,7 @@
 -- Receipt Analytics Queries for V2 Receipts (Pricing Tables)
 -- ============================================================================
 -- This script contains analytical queries for V2 receipt data with pricing tables
--- Extracted by receipts-extractor.ipynb using prompt_text_v2 and resp_schema_v2
+-- Extracted by the parse_and_complete pipeline (receipts_engine) using PROMPT_V2 and AI_COMPLETE_SCHEMA_V2
 -- ============================================================================
 
 USE ROLE SYSADMIN;
@@ -32,7 +32,9 @@ SELECT
     -- Flatten markets within each pricing table
     m.value:market::STRING AS market,
     TRY_TO_DECIMAL(REPLACE(REPLACE(m.value:minimum_usd::STRING, '$', ''), ',', ''), 10, 2) AS minimum_usd,
-    TRY_TO_DECIMAL(REPLACE(REPLACE(m.value:reach::STRING, ',', ''), ',', ''), 38, 0) AS reach
+    TRY_TO_DECIMAL(REPLACE(REPLACE(m.value:reach::STRING, ',', ''), ',', ''), 38, 0) AS reach,
+    -- Date partition of the stage path (upload_receipts.py --partition-by date); NULL for unpartitioned files
+    TRY_TO_DATE(REGEXP_SUBSTR(e.relative_path, '^[0-9]{4}/[0-9]{2}/[0-9]{2}'), 'YYYY/MM/DD') AS stage_partition_date
 FROM extracted_receipt_data e,
     LATERAL FLATTEN(input => e.extracted_data:pricing_tables) pt,
     LATERAL FLATTEN(input => pt.value:markets) m;
@@ -459,14 +461,34 @@ GROUP BY receipt_filename, vendor_name, campaign_name
 HAVING ABS(MAX(subtotal) - SUM(minimum_usd)) > 100
 ORDER BY ABS(difference) DESC;
 
+-- ============================================================================
+-- Recent Data (Date-Partitioned Stage)
+-- ============================================================================
+
+-- ----------------------------------------------------------------------------
+-- 22. Recent Partitions Only
+-- ----------------------------------------------------------------------------
+-- With date-partitioned uploads, report the V2 receipts staged in the last days
+-- by partition. The filter is on the date parsed from each row's stage path:
+-- every extracted row is still read, and unpartitioned files (NULL date) drop out
+
+SELECT 
+    stage_partition_date,
+    COUNT(DISTINCT receipt_filename) AS receipt_count,
+    SUM(minimum_usd) AS total_minimum_spend
+FROM v2_pricing_flattened
+WHERE stage_partition_date >= DATEADD(day, -1, CURRENT_DATE())
+GROUP BY stage_partition_date
+ORDER BY stage_partition_date DESC;
+
 -- ============================================================================
 -- End of V2 Analytics Queries
 -- ============================================================================
 
 /*
 NOTE: These queries assume V2 receipts have been processed with:
-  - prompt_text_v2
-  - resp_schema_v2 or resp_schema_v2b
+  - PROMPT_V2 (receipts_engine/prompts.py)
+  - AI_COMPLETE_SCHEMA_V2 (receipts_engine/schemas.py)
   
 The pricing_tables structure:
 {
@@ -37,31 +37,50 @@ DROP VIEW IF EXISTS receipt_analytics_vw;
 DROP VIEW IF EXISTS receipt_analytics_ai_extract_vw;
 
 -- ============================================================================
--- 4. Drop Tables (as SYSADMIN)
+-- 4. Drop Tasks (as SYSADMIN)
 -- ============================================================================
 
--- Drop extracted receipt data tables
-DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extracted_receipt_data;
-DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extracted_receipt_data_via_ai_extract;
+-- Suspend the tasks first (if they're running)
+ALTER TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS SUSPEND;
+ALTER TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE SUSPEND;
 
--- Drop parsed receipts table
-DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.parsed_receipts;
+-- Drop the tasks
+DROP TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS;
+DROP TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE;
 
 -- ============================================================================
--- 5. Drop Task (as SYSADMIN)
+-- 5. Drop Streams (as SYSADMIN)
 -- ============================================================================
 
--- Suspend task first (if it's running)
-ALTER TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS SUSPEND;
-
--- Drop the task
-DROP TASK IF EXISTS RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS;
+-- Before the stage and tables they are on
+DROP STREAM IF EXISTS RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM;
+DROP STREAM IF EXISTS RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_PARSE_STREAM;
+DROP STREAM IF EXISTS RECEIPTS_PROCESSING_DB.RAW.PARSED_RECEIPTS_STREAM;
 
 -- ============================================================================
--- 6. Drop Stream (as SYSADMIN)
+-- 6. Drop Tables (as SYSADMIN)
 -- ============================================================================
 
-DROP STREAM IF EXISTS RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM;
+-- Drop extracted receipt data tables
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extracted_receipt_data;
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extracted_receipt_data_via_ai_extract;
+
+-- Drop extraction queue, chunk checkpoints and dead letters tables
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extraction_queue;
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extraction_checkpoints;
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.extraction_dead_letters;
+
+-- Drop parsed receipts table
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.parsed_receipts;
+
+-- Drop receipt classifications table and classifier function
+DROP TABLE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.receipt_classifications;
+DROP FUNCTION IF EXISTS RECEIPTS_PROCESSING_DB.RAW.CLASSIFY_RECEIPT(STRING);
+
+-- Drop the extraction procedure (receipts_engine)
+DROP PROCEDURE IF EXISTS RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION(
+    STRING, BOOLEAN, NUMBER, NUMBER, NUMBER, BOOLEAN, NUMBER
+);
 
 -- ============================================================================
 -- 7. Drop Stages (as SYSADMIN)
@@ -120,6 +139,7 @@ REVOKE READ ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS FROM ROLE ETL_SERVICE_R
 REVOKE WRITE ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS FROM ROLE ETL_SERVICE_ROLE;
 REVOKE ALL PRIVILEGES ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS FROM ROLE ETL_SERVICE_ROLE;
 REVOKE SELECT ON STREAM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM FROM ROLE ETL_SERVICE_ROLE;
+REVOKE SELECT ON STREAM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_PARSE_STREAM FROM ROLE ETL_SERVICE_ROLE;
 
 -- ============================================================================
 -- 9. Verify Cleanup
@@ -156,12 +176,23 @@ OBJECTS REMOVED:
 - Notebooks:
   * receipts_extractor (AI_COMPLETE approach)
   * receipts_extractor_ai_extract (AI_EXTRACT approach)
-- Stream: RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM
-- Task: RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS
+- Streams:
+  * RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM (new PDFs for AI_EXTRACT)
+  * RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_PARSE_STREAM (new PDFs for AI_PARSE_DOCUMENT)
+  * RECEIPTS_PROCESSING_DB.RAW.PARSED_RECEIPTS_STREAM (new parsed receipts for AI_COMPLETE)
+- Tasks:
+  * RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS (runs the ai_extract pipeline)
+  * RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE (hourly directory refresh)
 - Tables:
   * parsed_receipts
   * extracted_receipt_data
   * extracted_receipt_data_via_ai_extract
+  * receipt_classifications
+  * extraction_queue (receipts waiting for extraction)
+  * extraction_checkpoints (one row per parse or extraction chunk)
+  * extraction_dead_letters (PDFs that could not be parsed)
+- Function: RECEIPTS_PROCESSING_DB.RAW.CLASSIFY_RECEIPT (receipt family classifier)
+- Procedure: RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION (receipts_engine)
 - Views:
   * receipt_analytics_vw
   * receipt_analytics_ai_extract_vw
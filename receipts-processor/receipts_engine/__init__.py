@@ -0,0 +1,17 @@
+"""
+Receipt extraction engine: the extraction logic of receipts-processor, the one
+copy run by the notebooks, the scheduled task and the command line.
+
+It holds the prompts and response schemas, the incremental selection of new
+receipts from the streams, the bounded micro-batches with checkpoints and the
+result writes of both pipelines, and runs them on a Snowpark session from three
+entry points:
+
+- the command line: python -m receipts_engine ai_extract --config config.json
+- the RUN_RECEIPTS_EXTRACTION stored procedure (procedure.run), called by the
+  AUTO_PROCESS_NEW_RECEIPTS task and by both notebooks
+- Python: run_ai_extract(session) / run_parse_and_complete(session)
+"""
+from .pipelines import PIPELINES, run_ai_extract, run_parse_and_complete
+
+__all__ = ['PIPELINES', 'run_ai_extract', 'run_parse_and_complete']
@@ -0,0 +1,4 @@
+"""python -m receipts_engine: run an extraction pipeline from the command line."""
+from .cli import main
+
+main()
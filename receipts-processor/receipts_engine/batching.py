@@ -0,0 +1,235 @@
+"""
+Bounded micro-batches with checkpoints.
+
+Queued receipts are parsed or extracted in chunks of at most max_files
+receipts and max_mb MB, one INSERT ALL per chunk, several chunks at a time as
+asynchronous queries of the session. Each chunk's INSERT ALL writes its
+results and its row in extraction_checkpoints in one statement, so they commit
+together; a failed chunk is checkpointed as FAILED with the error. The
+receipts of failed chunks are retried one per chunk, so a bad document only
+holds back itself. Whatever still fails stays in extraction_queue for the next
+run, or, with dead_letter, is moved to extraction_dead_letters with its error.
+"""
+import time
+import uuid
+from datetime import datetime, timezone
+
+from .selection import paths_values, sql_string
+
+
+# Receipts per parse or extraction statement
+DEFAULT_MAX_CHUNK_FILES = 100
+
+# Megabytes (PDF or parsed text) per parse or extraction statement
+DEFAULT_MAX_CHUNK_MB = 20
+
+# Parse or extraction statements run at once
+DEFAULT_CONCURRENT_CHUNKS = 4
+
+# Seconds between polls of the running chunks
+POLL_SECONDS = 0.5
+
+# Characters of a failed chunk's error kept in extraction_checkpoints and extraction_dead_letters
+MAX_ERROR_LENGTH = 1000
+
+# INTO clause of a chunk's INSERT ALL writing its checkpoint row (once, with the first result row)
+CHECKPOINT_INTO = """WHEN chunk_row = 1 THEN INTO extraction_checkpoints
+        (run_id, pipeline, chunk_id, files, bytes, status, started_at, finished_at)
+        VALUES (run_id, pipeline, chunk_id, files, bytes, status, started_at, finished_at)"""
+
+
+def create_batch_tables(session):
+    """Create extraction_queue, extraction_checkpoints and extraction_dead_letters."""
+    # Receipts waiting for parsing or extraction, per pipeline ('ai_parse', 'ai_extract', 'ai_complete'), filled
+    # from the streams; AI_COMPLETE receipts carry their parsed content and family, so chunks only read the queue
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS extraction_queue (
+        pipeline STRING,
+        relative_path STRING,
+        bytes INTEGER,
+        content STRING,
+        family STRING,
+        queued_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+    )
+    """).collect()
+
+    # One row per finished chunk: DONE rows are written by the chunk's INSERT itself, FAILED rows with the error
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS extraction_checkpoints (
+        run_id STRING,
+        pipeline STRING,
+        chunk_id INTEGER,
+        files INTEGER,
+        bytes INTEGER,
+        status STRING,
+        error STRING,
+        started_at TIMESTAMP_LTZ,
+        finished_at TIMESTAMP_LTZ
+    )
+    """).collect()
+
+    # Receipts that failed on their own and were taken out of the queue (run_batches with dead_letter)
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS extraction_dead_letters (
+        run_id STRING,
+        pipeline STRING,
+        relative_path STRING,
+        error STRING,
+        failed_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+    )
+    """).collect()
+
+
+def plan_chunks(pending, max_files=DEFAULT_MAX_CHUNK_FILES, max_mb=DEFAULT_MAX_CHUNK_MB):
+    """
+    Split the pending receipts into chunks within both bounds (a larger receipt is a chunk of its own).
+
+    Args:
+        pending: List of (relative_path, bytes)
+        max_files: Receipts per chunk
+        max_mb: Megabytes per chunk
+
+    Returns:
+        List of (paths, bytes)
+    """
+    max_bytes = max_mb * 1024 * 1024
+    chunks, paths, chunk_bytes = [], [], 0
+    for path, size in pending:
+        size = size or 0
+        if paths and (len(paths) >= max_files or chunk_bytes + size > max_bytes):
+            chunks.append((paths, chunk_bytes))
+            paths, chunk_bytes = [], 0
+        paths.append(path)
+        chunk_bytes += size
+    if paths:
+        chunks.append((paths, chunk_bytes))
+    return chunks
+
+
+def checkpoint_columns(run_id, pipeline, chunk_id, started_at, nbytes, files=None):
+    """Checkpoint columns of a chunk's SELECT, written by CHECKPOINT_INTO (files: default one per result row)."""
+    return (f"ROW_NUMBER() OVER (ORDER BY relative_path) AS chunk_row, "
+            f"{files if files is not None else 'COUNT(*) OVER ()'} AS files, "
+            f"{nbytes} AS bytes, {sql_string(run_id)} AS run_id, {sql_string(pipeline)} AS pipeline, "
+            f"{chunk_id} AS chunk_id, 'DONE' AS status, {sql_string(started_at)}::TIMESTAMP_LTZ AS started_at, "
+            f"CURRENT_TIMESTAMP() AS finished_at")
+
+
+def record_failure(session, run_id, pipeline, chunk_id, paths, nbytes, started_at, error):
+    """Checkpoint a failed chunk with its error."""
+    session.sql(f"""
+    INSERT INTO extraction_checkpoints
+        (run_id, pipeline, chunk_id, files, bytes, status, error, started_at, finished_at)
+    SELECT {sql_string(run_id)}, {sql_string(pipeline)}, {chunk_id}, {len(paths)}, {nbytes}, 'FAILED',
+           {sql_string(str(error)[:MAX_ERROR_LENGTH])}, {sql_string(started_at)}::TIMESTAMP_LTZ, CURRENT_TIMESTAMP()
+    """).collect()
+
+
+def dead_letter(session, run_id, pipeline, failed):
+    """Move the receipts of failed chunks from extraction_queue to extraction_dead_letters, with their error."""
+    paths = [path for chunk_paths, _, _ in failed for path in chunk_paths]
+    values = ', '.join(f"({sql_string(path)}, {sql_string(str(error)[:MAX_ERROR_LENGTH])})"
+                       for chunk_paths, _, error in failed for path in chunk_paths)
+    session.sql(f"""
+    INSERT INTO extraction_dead_letters (run_id, pipeline, relative_path, error)
+    SELECT {sql_string(run_id)}, {sql_string(pipeline)}, column1, column2
+    FROM VALUES {values}
+    """).collect()
+    session.sql(f"""
+    DELETE FROM extraction_queue
+    WHERE pipeline = {sql_string(pipeline)} AND relative_path IN ({paths_values(paths)})
+    """).collect()
+
+
+def run_chunks(session, chunks, chunk_query, pipeline, run_id, first_chunk_id=0,
+               concurrency=DEFAULT_CONCURRENT_CHUNKS):
+    """
+    Run one INSERT per chunk, concurrency of them at a time.
+
+    Args:
+        session: Snowpark session
+        chunks: List of (paths, bytes)
+        chunk_query: chunk_query(run_id, chunk_id, started_at, paths, nbytes) returning the chunk's INSERT ALL
+        pipeline: Pipeline name recorded in extraction_checkpoints
+        run_id: Run id recorded in extraction_checkpoints
+        first_chunk_id: Id of the first chunk
+        concurrency: Chunks run at once
+
+    Returns:
+        (receipts done, failed chunks as (paths, bytes, error))
+    """
+    waiting = list(enumerate(chunks, first_chunk_id))
+    running = []
+    extracted = 0
+    failed = []
+    while waiting or running:
+        while waiting and len(running) < concurrency:
+            chunk_id, (paths, nbytes) = waiting.pop(0)
+            started_at = datetime.now(timezone.utc).isoformat()
+            job = session.sql(chunk_query(run_id, chunk_id, started_at, paths, nbytes)).collect_nowait()
+            running.append((job, chunk_id, paths, nbytes, started_at))
+        time.sleep(POLL_SECONDS)
+        for entry in [entry for entry in running if entry[0].is_done()]:
+            running.remove(entry)
+            job, chunk_id, paths, nbytes, started_at = entry
+            try:
+                job.result()
+                extracted += len(paths)
+            except Exception as e:
+                failed.append((paths, nbytes, e))
+                record_failure(session, run_id, pipeline, chunk_id, paths, nbytes, started_at, e)
+                print(f"✗ Chunk {chunk_id} ({len(paths)} receipt(s)) failed: {e}")
+    return extracted, failed
+
+
+def run_batches(session, pending, chunk_query, pipeline, max_files=DEFAULT_MAX_CHUNK_FILES,
+                max_mb=DEFAULT_MAX_CHUNK_MB, concurrency=DEFAULT_CONCURRENT_CHUNKS, step='extraction',
+                dead_letter_failures=False):
+    """
+    Process the pending receipts in bounded chunks, then retry the receipts of failed chunks one per chunk.
+
+    Args:
+        session: Snowpark session
+        pending: List of (relative_path, bytes)
+        chunk_query: chunk_query(run_id, chunk_id, started_at, paths, nbytes) returning the chunk's INSERT ALL
+        pipeline: Pipeline name recorded in extraction_checkpoints
+        max_files: Receipts per chunk
+        max_mb: Megabytes per chunk
+        concurrency: Chunks run at once
+        step: Name of the step in the printed progress ('extraction', 'parsing')
+        dead_letter_failures: Move the receipts that still fail to extraction_dead_letters instead of leaving
+            them queued, so a document that can never be processed does not hold back later runs
+
+    Returns:
+        Dictionary with run_id, pending, chunks, extracted (receipts done), failed (receipts left queued),
+        dead_lettered and seconds
+    """
+    if not pending:
+        print(f"✓ No receipts pending {step}")
+        return {'run_id': None, 'pending': 0, 'chunks': 0, 'extracted': 0, 'failed': 0, 'dead_lettered': 0,
+                'seconds': 0.0}
+    run_id = str(uuid.uuid4())
+    start = time.perf_counter()
+    chunks = plan_chunks(pending, max_files, max_mb)
+    print(f"{len(pending)} pending receipt(s) in {len(chunks)} chunk(s) "
+          f"(at most {max_files} receipt(s) / {max_mb} MB, {concurrency} at a time)")
+    extracted, failed = run_chunks(session, chunks, chunk_query, pipeline, run_id, concurrency=concurrency)
+    retry = [([path], nbytes // len(paths)) for paths, nbytes, _ in failed if len(paths) > 1 for path in paths]
+    if retry:
+        print(f"Retrying the {len(retry)} receipt(s) of failed chunks one per chunk...")
+        retried, failed_again = run_chunks(session, retry, chunk_query, pipeline, run_id,
+                                           first_chunk_id=len(chunks), concurrency=concurrency)
+        extracted += retried
+        failed = [chunk for chunk in failed if len(chunk[0]) == 1] + failed_again
+    left = sum(len(paths) for paths, _, _ in failed)
+    dead_lettered = 0
+    if dead_letter_failures and failed:
+        dead_letter(session, run_id, pipeline, failed)
+        dead_lettered, left = left, 0
+    elapsed = time.perf_counter() - start
+    rate = extracted / max(elapsed, 0.001)
+    print(f"✓ {step.capitalize()} done for {extracted} receipt(s) in {elapsed:.1f}s ({rate:.2f} receipt(s)/sec)"
+          + (f"; {left} left queued after failures (see extraction_checkpoints, run {run_id})" if left else "")
+          + (f"; {dead_lettered} dead-lettered (see extraction_dead_letters, run {run_id})" if dead_lettered else ""))
+    return {'run_id': run_id, 'pending': len(pending), 'chunks': len(chunks), 'extracted': extracted,
+            'failed': left, 'dead_lettered': dead_lettered, 'seconds': round(elapsed, 3)}
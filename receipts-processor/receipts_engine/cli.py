@@ -0,0 +1,201 @@
+"""
+Command line of the extraction engine.
+
+Usage (from receipts-processor/):
+    python -m receipts_engine ai_extract
+    python -m receipts_engine parse_and_complete --catch-up --recent-days 7 --refresh
+    python -m receipts_engine ai_extract --max-chunk-files 50 --concurrent-chunks 8 --json
+    python -m receipts_engine parse_and_complete --dry-run
+
+It connects with the key-pair configuration of receipts-uploader (config.json and
+rsa_key.p8) through Snowpark; --dry-run prints the SQL of a run without connecting.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from .batching import DEFAULT_CONCURRENT_CHUNKS, DEFAULT_MAX_CHUNK_FILES, DEFAULT_MAX_CHUNK_MB
+from .pipelines import PIPELINES
+
+
+# Snowflake connection configuration (the one of receipts-uploader)
+CONFIG_PATH = Path(__file__).resolve().parent.parent.parent / 'receipts-uploader' / 'config.json'
+
+# Private key of the service user (relative to the repository root)
+PRIVATE_KEY_PATH = Path(__file__).resolve().parent.parent.parent / 'rsa_key.p8'
+
+
+class DryRunSession:
+    """Stand-in for a Snowpark session that prints each statement instead of running it (no rows, no receipts)."""
+
+    class _Statement:
+        def __init__(self, query):
+            self.query = query
+
+        def collect(self):
+            print(self.query.strip() + ';\n')
+            return []
+
+    def sql(self, query):
+        return self._Statement(query)
+
+
+def load_config(config_path):
+    """
+    Load the Snowflake configuration from a JSON file.
+
+    Args:
+        config_path: Path to the config.json file
+
+    Returns:
+        Dictionary with Snowflake connection parameters
+    """
+    if not config_path.exists():
+        print(f"Error: Config file not found at {config_path}")
+        sys.exit(1)
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error: Invalid JSON in config file: {e}")
+        sys.exit(1)
+    missing_fields = [field for field in ('account', 'user', 'warehouse', 'role') if field not in config]
+    if missing_fields:
+        print(f"Error: Missing required fields in {config_path.name}: {', '.join(missing_fields)}")
+        sys.exit(1)
+    return config
+
+
+def load_private_key(key_path):
+    """Load the private key for RSA authentication as DER bytes."""
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    with open(key_path, 'rb') as key_file:
+        private_key = serialization.load_pem_private_key(key_file.read(), password=None, backend=default_backend())
+    return private_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+
+def create_session(config, private_key):
+    """
+    Open a Snowpark session with key-pair authentication.
+
+    Args:
+        config: Dictionary with Snowflake connection parameters
+        private_key: Encoded private key bytes
+
+    Returns:
+        Snowpark session
+    """
+    try:
+        from snowflake.snowpark import Session
+    except ImportError:
+        print("Error: snowflake-snowpark-python is not installed (pip install -r requirements.txt)")
+        sys.exit(1)
+
+    return Session.builder.configs({
+        'account': config['account'],
+        'user': config['user'],
+        'private_key': private_key,
+        'warehouse': config['warehouse'],
+        'role': config['role'],
+    }).create()
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Run a receipt extraction pipeline on Snowflake"
+    )
+    parser.add_argument(
+        'pipeline',
+        choices=sorted(PIPELINES),
+        help='ai_extract: AI_EXTRACT from the PDFs; parse_and_complete: AI_PARSE_DOCUMENT, classification '
+             'and AI_COMPLETE'
+    )
+    parser.add_argument(
+        '--config',
+        type=Path,
+        default=CONFIG_PATH,
+        help=f'Snowflake configuration (default: {CONFIG_PATH})'
+    )
+    parser.add_argument(
+        '--private-key',
+        type=Path,
+        default=PRIVATE_KEY_PATH,
+        help=f'Private key of the service user (default: {PRIVATE_KEY_PATH})'
+    )
+    parser.add_argument(
+        '--catch-up',
+        action='store_true',
+        help='Also process the receipts already on the stage (once after creating or recreating the streams)'
+    )
+    parser.add_argument(
+        '--recent-days',
+        type=int,
+        help='Limit the stage refresh and the catch-up scan to this many recent date partitions'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Refresh the stage directory first (upload_receipts.py already refreshes after uploading)'
+    )
+    parser.add_argument(
+        '--max-chunk-files',
+        type=int,
+        default=DEFAULT_MAX_CHUNK_FILES,
+        help=f'Receipts per extraction statement (default: {DEFAULT_MAX_CHUNK_FILES})'
+    )
+    parser.add_argument(
+        '--max-chunk-mb',
+        type=int,
+        default=DEFAULT_MAX_CHUNK_MB,
+        help=f'Megabytes per extraction statement (default: {DEFAULT_MAX_CHUNK_MB})'
+    )
+    parser.add_argument(
+        '--concurrent-chunks',
+        type=int,
+        default=DEFAULT_CONCURRENT_CHUNKS,
+        help=f'Extraction statements run at once (default: {DEFAULT_CONCURRENT_CHUNKS})'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Print the SQL of the run instead of connecting'
+    )
+    parser.add_argument(
+        '--json',
+        action='store_true',
+        help='Print the run summary as JSON'
+    )
+    args = parser.parse_args()
+
+    if args.dry_run:
+        session = DryRunSession()
+    else:
+        config = load_config(args.config)
+        if not args.private_key.exists():
+            print(f"Error: Private key file not found at {args.private_key}")
+            sys.exit(1)
+        session = create_session(config, load_private_key(args.private_key))
+        print(f"✓ Connected to {config['account']} as {config['user']}")
+
+    try:
+        summary = PIPELINES[args.pipeline](
+            session, catch_up=args.catch_up, recent_days=args.recent_days, refresh=args.refresh,
+            max_chunk_files=args.max_chunk_files, max_chunk_mb=args.max_chunk_mb,
+            concurrent_chunks=args.concurrent_chunks
+        )
+    finally:
+        if not args.dry_run:
+            session.close()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    if summary['failed']:
+        sys.exit(1)
@@ -0,0 +1,299 @@
+"""
+The two extraction pipelines, each run by its notebook through RUN_RECEIPTS_EXTRACTION:
+
+- ai_extract (receipts-extractor_ai_extract.ipynb): AI_EXTRACT reads the PDFs
+  directly into extracted_receipt_data_via_ai_extract.
+- parse_and_complete (receipts-extractor.ipynb): AI_PARSE_DOCUMENT parses the
+  PDFs into parsed_receipts (in bounded chunks like the extraction, with the
+  files that cannot be parsed dead-lettered), CLASSIFY_RECEIPT tags them v1,
+  v2 or unknown, and AI_COMPLETE extracts each with the prompt and schema of
+  its family into extracted_receipt_data.
+
+Both take a Snowpark session and return a summary dictionary.
+"""
+from .batching import (
+    CHECKPOINT_INTO, DEFAULT_CONCURRENT_CHUNKS, DEFAULT_MAX_CHUNK_FILES, DEFAULT_MAX_CHUNK_MB, checkpoint_columns,
+    create_batch_tables, run_batches
+)
+from .prompts import MODEL, PROMPT_V1, PROMPT_V2
+from .schemas import AI_COMPLETE_SCHEMA_V1, AI_COMPLETE_SCHEMA_V2, AI_EXTRACT_SCHEMA
+from .selection import (
+    BUNDLE_CONDITION, PARSED_MATCH, SCHEMA, STAGE, classify_query, clear_queue_query, create_extract_stream,
+    create_parse_streams, enqueue_ai_complete_query, enqueue_ai_extract_query, enqueue_parse_query,
+    extract_work_set, parse_work_set, parsed_work, partition_filter, paths_values, pending_query, refresh_stage
+)
+
+
+# Result table of each extraction pipeline
+AI_EXTRACT_TABLE = 'extracted_receipt_data_via_ai_extract'
+AI_COMPLETE_TABLE = 'extracted_receipt_data'
+
+
+def rows_inserted(result):
+    """Number of rows inserted, from the result of an INSERT."""
+    return result[0]['number of rows inserted'] if result else 0
+
+
+def run_in_transaction(session, queries):
+    """
+    Run queries in one transaction (the streams they read only advance on COMMIT).
+
+    Returns:
+        List of the query results
+    """
+    session.sql("BEGIN").collect()
+    try:
+        results = [session.sql(query).collect() for query in queries]
+        session.sql("COMMIT").collect()
+    except Exception:
+        session.sql("ROLLBACK").collect()
+        raise
+    return results
+
+
+def ai_extract_chunk_query(run_id, chunk_id, started_at, paths, nbytes):
+    """INSERT ALL extracting one chunk directly from the PDF files with AI_EXTRACT, with its checkpoint row."""
+    return f"""
+    INSERT ALL
+        {CHECKPOINT_INTO}
+        WHEN TRUE THEN INTO {AI_EXTRACT_TABLE} (relative_path, extracted_data)
+            VALUES (relative_path, extracted_data)
+    SELECT
+        relative_path,
+        AI_EXTRACT(
+            file => TO_FILE('@{STAGE}', relative_path),
+            responseFormat => {AI_EXTRACT_SCHEMA}
+        ) AS extracted_data,
+        {checkpoint_columns(run_id, 'ai_extract', chunk_id, started_at, nbytes)}
+    FROM ({paths_values(paths)})
+    """
+
+
+def ai_complete_chunk_query(run_id, chunk_id, started_at, paths, nbytes):
+    """INSERT ALL extracting one chunk with AI_COMPLETE (prompt and schema by family), with its checkpoint row."""
+    # The chunk's receipts, with the content and family they were queued with
+    chunk = f"""
+        SELECT relative_path, content, family
+        FROM extraction_queue
+        WHERE pipeline = 'ai_complete' AND relative_path IN ({paths_values(paths)})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY relative_path ORDER BY queued_at DESC) = 1
+    """
+    return f"""
+    INSERT ALL
+        {CHECKPOINT_INTO}
+        WHEN TRUE THEN INTO {AI_COMPLETE_TABLE} (relative_path, content, extracted_data)
+            VALUES (relative_path, content, extracted_data)
+    SELECT
+        relative_path,
+        content,
+        extracted_data,
+        {checkpoint_columns(run_id, 'ai_complete', chunk_id, started_at, nbytes)}
+    FROM (
+        SELECT
+            relative_path,
+            content,
+            ai_complete(
+                model=>'{MODEL}',
+                prompt=>{PROMPT_V2.format('content')},
+                response_format=>{AI_COMPLETE_SCHEMA_V2}
+            ) as extracted_data
+        FROM ({chunk})
+        WHERE family = 'v2'
+        UNION ALL
+        SELECT
+            relative_path,
+            content,
+            ai_complete(
+                model=>'{MODEL}',
+                prompt=>{PROMPT_V1.format('content')},
+                response_format=>{AI_COMPLETE_SCHEMA_V1}
+            ) as extracted_data
+        FROM ({chunk})
+        WHERE family IS DISTINCT FROM 'v2'
+    )
+    """
+
+
+def extract_queued(session, pipeline, target, chunk_query, max_chunk_files, max_chunk_mb, concurrent_chunks):
+    """Extract the queued receipts of pipeline in bounded chunks, then drop the extracted ones from the queue."""
+    pending = [(row['RELATIVE_PATH'], row['BYTES']) for row in session.sql(pending_query(pipeline, target)).collect()]
+    summary = run_batches(session, pending, chunk_query, pipeline, max_chunk_files, max_chunk_mb, concurrent_chunks)
+    session.sql(clear_queue_query(pipeline, target)).collect()
+    return summary
+
+
+def run_ai_extract(session, catch_up=False, recent_days=None, refresh=False,
+                   max_chunk_files=DEFAULT_MAX_CHUNK_FILES, max_chunk_mb=DEFAULT_MAX_CHUNK_MB,
+                   concurrent_chunks=DEFAULT_CONCURRENT_CHUNKS):
+    """
+    Extract the new PDFs with AI_EXTRACT.
+
+    Args:
+        session: Snowpark session
+        catch_up: Also queue the PDFs already on the stage (once after (re)creating RECEIPTS_STREAM)
+        recent_days: Limit the refresh and the catch-up scan to this many recent date partitions
+        refresh: Refresh the stage's directory table first
+        max_chunk_files: Receipts per extraction statement
+        max_chunk_mb: PDF megabytes per extraction statement
+        concurrent_chunks: Extraction statements run at once
+
+    Returns:
+        Summary dictionary
+    """
+    session.sql(f"USE SCHEMA {SCHEMA}").collect()
+    if refresh:
+        refresh_stage(session, recent_days)
+    session.sql(f"""
+    CREATE TABLE IF NOT EXISTS {AI_EXTRACT_TABLE} (
+        relative_path STRING,
+        extracted_data VARIANT
+    )
+    """).collect()
+    create_batch_tables(session)
+    create_extract_stream(session)
+
+    # Move the new files from RECEIPTS_STREAM into the queue (one statement: the stream advances when it commits)
+    queued = rows_inserted(session.sql(
+        enqueue_ai_extract_query(extract_work_set(catch_up, partition_filter(recent_days)))
+    ).collect())
+    print(f"✓ Queued {queued} new receipt(s)")
+
+    summary = extract_queued(session, 'ai_extract', AI_EXTRACT_TABLE, ai_extract_chunk_query,
+                             max_chunk_files, max_chunk_mb, concurrent_chunks)
+    return {'pipeline': 'ai_extract', 'queued': queued, **summary}
+
+
+def ai_parse_chunk_query(run_id, chunk_id, started_at, paths, nbytes):
+    """INSERT ALL parsing one chunk of PDFs with AI_PARSE_DOCUMENT (bundles page by page), with its checkpoint row."""
+    return f"""
+    INSERT ALL
+        {CHECKPOINT_INTO}
+        WHEN TRUE THEN INTO parsed_receipts (relative_path, content)
+            VALUES (relative_path, content)
+    SELECT
+        relative_path,
+        content,
+        {checkpoint_columns(run_id, 'ai_parse', chunk_id, started_at, nbytes, files=len(paths))}
+    FROM (
+        SELECT
+            c.relative_path,
+            AI_PARSE_DOCUMENT(
+                to_file('@{STAGE}', c.relative_path),
+                {{'mode': 'layout'}}
+            ):content::STRING AS content
+        FROM ({paths_values(paths)}) c
+        WHERE NOT {BUNDLE_CONDITION.format('c.relative_path')}
+        UNION ALL
+        -- One row per bundle page; a bundle without pages keeps one empty '#page=1' marker row
+        SELECT
+            b.relative_path || '#page=' || COALESCE(page.value:index::INT + 1, 1) AS relative_path,
+            page.value:content::STRING AS content
+        FROM (
+            SELECT
+                c.relative_path,
+                AI_PARSE_DOCUMENT(
+                    to_file('@{STAGE}', c.relative_path),
+                    {{'mode': 'layout', 'page_split': true}}
+                ) AS parsed
+            FROM ({paths_values(paths)}) c
+            WHERE {BUNDLE_CONDITION.format('c.relative_path')}
+        ) b,
+            LATERAL FLATTEN(input => b.parsed:pages, OUTER => TRUE) page
+    )
+    """
+
+
+def parse_new_receipts(session, catch_up=False, partitions='TRUE', max_chunk_files=DEFAULT_MAX_CHUNK_FILES,
+                       max_chunk_mb=DEFAULT_MAX_CHUNK_MB, concurrent_chunks=DEFAULT_CONCURRENT_CHUNKS):
+    """
+    Parse the new PDFs with AI_PARSE_DOCUMENT into parsed_receipts, bundle PDFs page by page.
+
+    The new files are first moved from RECEIPTS_PARSE_STREAM into extraction_queue ('ai_parse') by one
+    INSERT, whose commit advances the stream. They are then parsed in bounded, checkpointed chunks; a
+    file that still fails on its own is dead-lettered (extraction_dead_letters), so one unparsable PDF
+    neither rolls back the others nor blocks later runs. Parses without text stay as empty marker rows
+    (see EMPTY_CONTENT): each file, and each bundle with all of its pages, is parsed once.
+
+    Returns:
+        (PDFs queued, summary of the parse chunks as returned by run_batches)
+    """
+    queued = rows_inserted(session.sql(enqueue_parse_query(parse_work_set(catch_up, partitions))).collect())
+    print(f"✓ Queued {queued} new PDF(s) for parsing")
+    pending = [(row['RELATIVE_PATH'], row['BYTES'])
+               for row in session.sql(pending_query('ai_parse', 'parsed_receipts', PARSED_MATCH)).collect()]
+    summary = run_batches(session, pending, ai_parse_chunk_query, 'ai_parse', max_chunk_files, max_chunk_mb,
+                          concurrent_chunks, step='parsing', dead_letter_failures=True)
+    session.sql(clear_queue_query('ai_parse', 'parsed_receipts', PARSED_MATCH)).collect()
+    return queued, summary
+
+
+def run_parse_and_complete(session, catch_up=False, recent_days=None, refresh=False,
+                           max_chunk_files=DEFAULT_MAX_CHUNK_FILES, max_chunk_mb=DEFAULT_MAX_CHUNK_MB,
+                           concurrent_chunks=DEFAULT_CONCURRENT_CHUNKS):
+    """
+    Parse the new PDFs, classify them and extract them with AI_COMPLETE.
+
+    Args:
+        session: Snowpark session
+        catch_up: Also process the PDFs already on the stage and in parsed_receipts
+            (once after (re)creating the streams)
+        recent_days: Limit the refresh and the catch-up scan to this many recent date partitions
+        refresh: Refresh the stage's directory table first
+        max_chunk_files: PDFs per parse statement and receipts per extraction statement
+        max_chunk_mb: PDF megabytes per parse statement and parsed-text megabytes per extraction statement
+        concurrent_chunks: Parse or extraction statements run at once
+
+    Returns:
+        Summary dictionary
+    """
+    session.sql(f"USE SCHEMA {SCHEMA}").collect()
+    if refresh:
+        refresh_stage(session, recent_days)
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS parsed_receipts (
+        relative_path STRING,
+        content STRING
+    )
+    """).collect()
+    session.sql("""
+    CREATE TABLE IF NOT EXISTS receipt_classifications (
+        relative_path STRING,
+        family STRING,
+        vendor_name STRING,
+        classified_by STRING,
+        classified_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+    )
+    """).collect()
+    session.sql(f"""
+    CREATE TABLE IF NOT EXISTS {AI_COMPLETE_TABLE} (
+        relative_path STRING,
+        content STRING,
+        extracted_data VARIANT
+    )
+    """).collect()
+    create_batch_tables(session)
+    create_parse_streams(session)
+
+    parse_queued, parse = parse_new_receipts(session, catch_up, partition_filter(recent_days), max_chunk_files,
+                                             max_chunk_mb, concurrent_chunks)
+
+    # Classify and queue in one transaction: both read PARSED_RECEIPTS_STREAM, which only advances on COMMIT
+    parsed_set = parsed_work(catch_up)
+    classified, queued = (rows_inserted(result) for result in run_in_transaction(
+        session, [classify_query(parsed_set), enqueue_ai_complete_query(parsed_set)]
+    ))
+    print(f"✓ Classified {classified} new receipt(s)")
+    print(f"✓ Queued {queued} new receipt(s) for extraction")
+
+    summary = extract_queued(session, 'ai_complete', AI_COMPLETE_TABLE, ai_complete_chunk_query,
+                             max_chunk_files, max_chunk_mb, concurrent_chunks)
+    return {'pipeline': 'parse_and_complete', 'parse_queued': parse_queued, 'parsed': parse['extracted'],
+            'parse_failed': parse['failed'], 'parse_dead_lettered': parse['dead_lettered'],
+            'classified': classified, 'queued': queued, **summary}
+
+
+# Pipelines by name (CLI and stored procedure)
+PIPELINES = {
+    'ai_extract': run_ai_extract,
+    'parse_and_complete': run_parse_and_complete,
+}
@@ -0,0 +1,45 @@
+"""
+Stored procedure entry point.
+
+setup.sql creates RUN_RECEIPTS_EXTRACTION from this package (uploaded as
+receipts_engine.zip) with run() as its handler. The AUTO_PROCESS_NEW_RECEIPTS
+task and both notebooks call it:
+
+    CALL RUN_RECEIPTS_EXTRACTION('ai_extract');  -- what the task runs
+    CALL RUN_RECEIPTS_EXTRACTION('parse_and_complete', catch_up => TRUE);  -- once after (re)creating the streams
+    CALL RUN_RECEIPTS_EXTRACTION('ai_extract', refresh => TRUE, recent_days => 2);  -- date-partitioned stage
+
+Files only reach the streams once the stage's directory table is refreshed.
+upload_receipts.py refreshes the prefixes it writes right after each PUT, and
+the hourly REFRESH_RECEIPTS_STAGE task picks up files uploaded with
+--no-refresh or by other tools; refresh => TRUE refreshes them at once.
+"""
+from .batching import DEFAULT_CONCURRENT_CHUNKS, DEFAULT_MAX_CHUNK_FILES, DEFAULT_MAX_CHUNK_MB
+from .pipelines import PIPELINES
+
+
+def run(session, pipeline='ai_extract', catch_up=False, max_chunk_files=DEFAULT_MAX_CHUNK_FILES,
+        max_chunk_mb=DEFAULT_MAX_CHUNK_MB, concurrent_chunks=DEFAULT_CONCURRENT_CHUNKS, refresh=False,
+        recent_days=None):
+    """
+    Run one extraction pipeline (handler of RUN_RECEIPTS_EXTRACTION).
+
+    Args:
+        session: Snowpark session of the procedure
+        pipeline: 'ai_extract' or 'parse_and_complete'
+        catch_up: Also process the receipts already on the stage
+        max_chunk_files: Receipts per extraction statement
+        max_chunk_mb: Megabytes per extraction statement
+        concurrent_chunks: Extraction statements run at once
+        refresh: Refresh the stage's directory table first (see selection.refresh_stage)
+        recent_days: Limit the refresh and the catch-up scan to this many recent date partitions
+            (None: the whole stage)
+
+    Returns:
+        Summary dictionary (the procedure's VARIANT result)
+    """
+    if pipeline not in PIPELINES:
+        raise ValueError(f"Unknown pipeline {pipeline!r}, expected one of: {', '.join(PIPELINES)}")
+    return PIPELINES[pipeline](session, catch_up=bool(catch_up), recent_days=int(recent_days) if recent_days else None,
+                               refresh=bool(refresh), max_chunk_files=int(max_chunk_files),
+                               max_chunk_mb=int(max_chunk_mb), concurrent_chunks=int(concurrent_chunks))
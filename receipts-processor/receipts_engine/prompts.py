@@ -0,0 +1,61 @@
+"""
+Extraction prompts of the AI_COMPLETE pipeline.
+
+Each prompt is a SQL expression: format() it with the column holding the parsed
+receipt text, e.g. PROMPT_V1.format('content').
+"""
+
+# Model of the AI_COMPLETE calls; try 'claude-sonnet-4-5' or 'claude-haiku-4-5' (in PuPr for cross-region availability)
+MODEL = 'claude-haiku-4-5'
+
+# Prompt for v1 receipts (line items, metrics and targeting) and receipts of unknown family
+PROMPT_V1 = """
+    CONCAT($$Analyze the ad-campaign receipt document provided and extract the following structured information:
+    
+    1. Vendor/Provider details (name, contact info)
+    2. Transaction information (ID, date, time, payment method)
+    3. Customer/Client information (name, company)
+    4. Campaign details (name, content types, ad formats, period start date, period end date)
+    5. Financial details (line items, subtotal, tax, total)
+    6. Campaign metrics (CPM, CTR, bounce rate %, targets)
+    7. Targeting information (geography, demographics, devices)
+    
+    <document-content>$$, {0}, $$
+    </document-content>
+
+    <output-format>
+    Provide JSON output in the exact format specified in the response schema.
+    For any fields not found in the document, use an empty string.
+    For numeric fields, use numbers (not strings).
+    For percentages, use whole numbers.
+    For arrays, provide empty arrays [] if no data is found.
+    </output-format>$$)
+"""
+
+# Prompt for v2 receipts (multiple pricing tables of markets)
+PROMPT_V2 = """
+    CONCAT($$Analyze the ad-campaign receipt document provided and extract the following structured information:
+    
+    1. Vendor/Provider details (name)
+    2. Transaction information (ID, date, payment method)
+    3. Customer/Client information (name, company)
+    4. Campaign name
+    5. PRICING section containing multiple pricing tables:
+       - Each table has a NAME (e.g., "Geographic Pricing", "Demographic Pricing", etc.)
+       - Each table contains MARKETS with at least the following columns:
+         * Market/Region name
+         * Minimum (USD) - minimum spend value
+         * Reach - reach number (impressions/audience size)
+    6. Financial totals (subtotal, tax, total)
+    
+    <document-content>$$, {0}, $$
+    </document-content>
+
+    <output-format>
+    Provide JSON output in the exact format specified in the response schema.
+    For the pricing_tables array, extract ALL tables found in the PRICING section.
+    Each table should include its name and all market rows.
+    For any fields not found in the document, use an empty string or empty array.
+    For numeric fields, preserve the values as strings to maintain formatting.
+    </output-format>$$)
+"""
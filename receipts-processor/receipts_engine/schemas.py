@@ -0,0 +1,332 @@
+"""
+Response schemas of the extraction calls.
+
+AI_COMPLETE_SCHEMA_V1 and AI_EXTRACT_SCHEMA are Snowflake object constants
+(SQL text). AI_COMPLETE_SCHEMA_V2 is generated from the ReceiptV2 pydantic
+model, the single definition of the v2 receipt structure:
+
+ReceiptV2
+├── vendor: Vendor (vendor_name)
+├── transaction: Transaction (transaction_id, date, payment_method)
+├── customer: Customer (customer_name, company_name)
+├── campaign: Campaign (name)
+├── pricing_tables: List[PricingTable]
+│   └── PricingTable (table_name, markets: List[Market (market, minimum_usd, reach)])
+└── financials: Financials (subtotal, tax, total)
+"""
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# AI_COMPLETE response format for v1 receipts and receipts of unknown family
+AI_COMPLETE_SCHEMA_V1 = """
+{
+    'type': 'json',
+    'schema': {
+        'type': 'object',
+        'properties': {
+            'vendor': {
+                'type': 'object',
+                'properties': {
+                    'vendor_name': {'type': 'string'}
+                },
+                'required': ['vendor_name']
+            },
+            'transaction': {
+                'type': 'object',
+                'properties': {
+                    'receipt_id': {'type': 'string'},
+                    'date': {'type': 'string'},
+                    'payment_method': {'type': 'string'}
+                },
+                'required': ['receipt_id', 'date', 'payment_method']
+            },
+            'customer': {
+                'type': 'object',
+                'properties': {
+                    'customer_name': {'type': 'string'},
+                    'company_name': {'type': 'string'}
+                },
+                'required': ['company_name']
+            },
+            'campaign': {
+                'type': 'object',
+                'properties': {
+                    'name': {'type': 'string'},
+                    'content_types': {'type': 'string'},
+                    'ad_formats': {'type': 'array'},
+                    'period_startdate': {'type': 'string'},
+                    'period_enddate': {'type': 'string'},
+                    'budget': {'type':'number'}
+                },
+                'required': ['name', 'content_types', 'ad_formats', 'period_startdate', 'period_enddate']
+            },
+            'financials': {
+                'type': 'object',
+                'properties': {
+                    'line_items': {'type': 'object'},
+                    'subtotal': {'type': 'number'},
+                    'tax': {'type': 'number'},
+                    'total': {'type': 'number'}
+                },
+                'required': ['total', 'line_items', 'subtotal', 'tax']
+            },
+            'metrics': {
+                'type': 'object',
+                'properties': {
+                    'cpm': {'type': 'string', 'description':'Cost Per Milli, abbreviated as CPM'},
+                    'ctr': {'type': 'string', 'description':'Click-through rate, abbreviated as CTR'},
+                    'bounce_rate': {'type': 'string', 'description':'Bounce Rate, sometimes just referred to as Bounce, a % value'},
+                    'targets': {'type': 'object'},
+                    'pricing_model': {'type': 'string'}
+                },
+                'required': ['cpm', 'ctr', 'bounce_rate', 'targets', 'pricing_model']
+            },
+            'budget':{
+                'type': 'object',
+                'properties': {
+                    'daily_budget': {'type': 'string'},
+                    'total_budget': {'type': 'string'}
+                },
+                'required': ['daily_budget', 'total_budget']
+            },
+            'targeting': {
+                'type': 'object',
+                'properties': {
+                    'geography': {'type': 'array'},
+                    'demographics': {'type': 'string'},
+                    'age_range': {'type': 'string'},
+                    'devices': {'type': 'string'}
+                },
+                'required': ['geography', 'demographics', 'age_range', 'devices']
+            }
+        },
+        'required': ['vendor', 'transaction', 'customer', 'campaign', 'financials', 'metrics', 'budget', 'targeting']
+    }
+}
+"""
+
+
+class Vendor(BaseModel):
+    """Vendor information."""
+    vendor_name: str = Field(description="Name of the vendor")
+
+
+class Transaction(BaseModel):
+    """Transaction details."""
+    transaction_id: str = Field(description="Transaction or invoice ID")
+    date: str = Field(description="Date of the transaction")
+    payment_method: str = Field(description="Payment method used")
+
+
+class Customer(BaseModel):
+    """Customer information."""
+    customer_name: str = Field(description="Name of the customer contact")
+    company_name: str = Field(description="Name of the customer company")
+
+
+class Campaign(BaseModel):
+    """Campaign details."""
+    name: str = Field(description="Name of the advertising campaign")
+
+
+class Market(BaseModel):
+    """Individual market within a pricing table."""
+    market: str = Field(description="Market or region name")
+    minimum_usd: str = Field(description="Minimum spend value in USD")
+    reach: str = Field(description="Reach number (impressions/audience)")
+
+
+class PricingTable(BaseModel):
+    """Single pricing table with name and markets."""
+    table_name: str = Field(description="Name of the pricing table (e.g., Geographic Pricing)")
+    markets: List[Market] = Field(description="List of markets in this pricing table")
+
+
+class Financials(BaseModel):
+    """Financial totals."""
+    subtotal: str = Field(description="Subtotal amount")
+    tax: str = Field(description="Tax amount")
+    total: str = Field(description="Total amount charged")
+
+
+class ReceiptV2(BaseModel):
+    """Complete V2 receipt with pricing tables."""
+    vendor: Vendor
+    transaction: Transaction
+    customer: Customer
+    campaign: Campaign
+    pricing_tables: List[PricingTable] = Field(description="Array of pricing tables found in the PRICING section")
+    financials: Financials
+
+
+# AI_COMPLETE response format for v2 receipts, generated from ReceiptV2 with $defs and $ref
+# (AI_COMPLETE supports both); its repr() is the SQL constant
+AI_COMPLETE_SCHEMA_V2 = {
+    'type': 'json',
+    'schema': ReceiptV2.model_json_schema()
+}
+
+
+# AI_EXTRACT response format, all fields as type 'array'
+AI_EXTRACT_SCHEMA = """
+{
+    'schema': {
+        'type': 'object',
+        'properties': {
+            'vendor': {
+                'description': 'Vendor or advertising service provider information',
+                'type': 'object',
+                'properties': {
+                    'vendor_name': {
+                        'description': 'Name of the vendor',
+                        'type': 'array'
+                    }
+                }
+            },
+            'transaction': {
+                'description': 'Transaction and receipt details',
+                'type': 'object',
+                'properties': {
+                    'receipt_id': {
+                        'description': 'Receipt or invoice ID number',
+                        'type': 'array'
+                    },
+                    'date': {
+                        'description': 'Date of the transaction',
+                        'type': 'array'
+                    },
+                    'payment_method': {
+                        'description': 'Payment method used',
+                        'type': 'array'
+                    }
+                }
+            },
+            'customer': {
+                'description': 'Customer or client information',
+                'type': 'object',
+                'properties': {
+                    'customer_name': {
+                        'description': 'Name of the customer contact',
+                        'type': 'array'
+                    },
+                    'company_name': {
+                        'description': 'Name of the customer company',
+                        'type': 'array'
+                    }
+                }
+            },
+            'campaign': {
+                'description': 'Advertising campaign details',
+                'type': 'object',
+                'properties': {
+                    'name': {
+                        'description': 'Name of the advertising campaign',
+                        'type': 'array'
+                    },
+                    'content_types': {
+                        'description': 'Types of content (Display, Video, etc.)',
+                        'type': 'array'
+                    },
+                    'ad_formats': {
+                        'description': 'Ad formats used in the campaign',
+                        'type': 'array'
+                    },
+                    'period_startdate': {
+                        'description': 'Campaign period start date',
+                        'type': 'array'
+                    },
+                    'period_enddate': {
+                        'description': 'Campaign period end date',
+                        'type': 'array'
+                    }
+                }
+            },
+            'financials': {
+                'description': 'Financial details from the receipt',
+                'type': 'object',
+                'properties': {
+                    'line_items': {
+                        'description': 'Individual line items on the receipt',
+                        'type': 'array'
+                    },
+                    'subtotal': {
+                        'description': 'Subtotal amount before tax',
+                        'type': 'array'
+                    },
+                    'tax': {
+                        'description': 'Tax amount',
+                        'type': 'array'
+                    },
+                    'total': {
+                        'description': 'Total amount charged',
+                        'type': 'array'
+                    }
+                }
+            },
+            'metrics': {
+                'description': 'Campaign performance metrics',
+                'type': 'object',
+                'properties': {
+                    'cpm': {
+                        'description': 'Cost per thousand impressions (CPM)',
+                        'type': 'array'
+                    },
+                    'ctr': {
+                        'description': 'Click-through rate (CTR)',
+                        'type': 'array'
+                    },
+                    'bounce_rate': {
+                        'description': 'Bounce rate percentage',
+                        'type': 'array'
+                    },
+                    'targets': {
+                        'description': 'Target impressions and clicks',
+                        'type': 'array'
+                    },
+                    'pricing_model': {
+                        'description': 'Pricing model used (CPM, CPC, etc.)',
+                        'type': 'array'
+                    }
+                }
+            },
+            'budget': {
+                'description': 'Budget information',
+                'type': 'object',
+                'properties': {
+                    'daily_budget': {
+                        'description': 'Daily budget amount',
+                        'type': 'array'
+                    },
+                    'total_budget': {
+                        'description': 'Total campaign budget',
+                        'type': 'array'
+                    }
+                }
+            },
+            'targeting': {
+                'description': 'Campaign targeting parameters',
+                'type': 'object',
+                'properties': {
+                    'geography': {
+                        'description': 'Geographic targeting locations',
+                        'type': 'array'
+                    },
+                    'demographics': {
+                        'description': 'Demographic targeting criteria',
+                        'type': 'array'
+                    },
+                    'age_range': {
+                        'description': 'Age range targeting',
+                        'type': 'array'
+                    },
+                    'devices': {
+                        'description': 'Device targeting',
+                        'type': 'array'
+                    }
+                }
+            }
+        }
+    }
+}
+"""
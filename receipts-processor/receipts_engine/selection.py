@@ -0,0 +1,210 @@
+"""
+Incremental selection of the receipts to parse and extract.
+
+Work sets come from streams instead of anti-joins over the whole stage listing
+or result tables, so a run costs O(new receipts):
+
+- RECEIPTS_STREAM (stage): new PDFs for the AI_EXTRACT pipeline
+- RECEIPTS_PARSE_STREAM (stage): new PDFs for AI_PARSE_DOCUMENT
+- PARSED_RECEIPTS_STREAM (parsed_receipts): new parsed receipts for AI_COMPLETE
+
+Each stream has one consumer, and its offset only advances when the
+transaction reading it commits. New receipts are moved from the streams into
+extraction_queue, where they wait until they are parsed ('ai_parse') or their
+results are written ('ai_extract', 'ai_complete').
+
+Streams only hold changes made after their creation: catch_up also selects the
+receipts already on the stage (in the partitions of partition_filter) and in
+parsed_receipts, for one run after (re)creating a stream.
+"""
+from datetime import datetime, timedelta, timezone
+
+
+# Schema of the tables, streams and stage below
+SCHEMA = 'RECEIPTS_PROCESSING_DB.RAW'
+
+# Stage holding the receipt PDFs
+STAGE = 'RECEIPTS_PROCESSING_DB.RAW.RECEIPTS'
+
+# Multi-receipt bundle PDFs (workload_generator.py --bundle): parsed page by page, skipped by AI_EXTRACT
+BUNDLE_CONDITION = "STARTSWITH(SPLIT_PART({0}, '/', -1), 'bundle_')"
+
+# Parse results without text: kept in parsed_receipts as markers, so their files are not parsed again,
+# and left out of classification and extraction
+EMPTY_CONTENT = "content IS NULL OR TRIM(content) = ''"
+
+# Match of a queued PDF (q) with its rows in parsed_receipts (t): bundles are parsed into '<path>#page=N' rows
+PARSED_MATCH = "SPLIT_PART(t.relative_path, '#', 1) = q.relative_path"
+
+
+def sql_string(value):
+    """SQL string literal of value."""
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+def paths_values(paths):
+    """Query returning the given relative paths as rows of one relative_path column."""
+    return "SELECT column1 AS relative_path FROM VALUES " + ', '.join(f"({sql_string(path)})" for path in paths)
+
+
+def recent_prefixes(recent_days):
+    """Date partitions (yyyy/mm/dd, UTC) of the last recent_days days, as written by upload_receipts.py."""
+    today = datetime.now(timezone.utc).date()
+    return [(today - timedelta(days=n)).strftime('%Y/%m/%d') for n in range(recent_days)]
+
+
+def partition_filter(recent_days=None):
+    """
+    Condition on relative_path limiting DIRECTORY() scans to recent date partitions.
+
+    Args:
+        recent_days: Number of recent daily partitions, or None for the whole stage
+
+    Returns:
+        SQL condition
+    """
+    if not recent_days:
+        return 'TRUE'
+    return '(' + ' OR '.join(f"STARTSWITH(relative_path, '{prefix}/')" for prefix in recent_prefixes(recent_days)) + ')'
+
+
+def refresh_stage(session, recent_days=None):
+    """
+    Refresh the stage's directory table: only the recent date partitions, or the whole stage.
+
+    Same statements as the uploader's StageRefresher: one REFRESH SUBPATH per yyyy/mm/dd
+    partition (UTC), and a full refresh for files at the stage root (upload_receipts.py
+    --partition-by none, the default), which subpath refreshes do not cover. The uploader
+    already refreshes the prefixes it writes, but files uploaded with --no-refresh or by
+    other tools only reach the streams after this.
+    """
+    if recent_days:
+        prefixes = recent_prefixes(recent_days)
+        for prefix in prefixes:
+            session.sql(f"ALTER STAGE {STAGE} REFRESH SUBPATH = '{prefix}/'").collect()
+        print(f"✓ Refreshed {len(prefixes)} recent partition(s): {', '.join(prefixes)}")
+    else:
+        session.sql(f"ALTER STAGE {STAGE} REFRESH").collect()
+        print("✓ Refreshed the whole stage")
+
+
+def create_extract_stream(session):
+    """Create RECEIPTS_STREAM, the work set of the AI_EXTRACT pipeline (setup.sql creates it too)."""
+    session.sql(f"CREATE STREAM IF NOT EXISTS RECEIPTS_STREAM ON STAGE {STAGE}").collect()
+
+
+def create_parse_streams(session):
+    """Create RECEIPTS_PARSE_STREAM and PARSED_RECEIPTS_STREAM (on parsed_receipts, which must exist)."""
+    session.sql(f"CREATE STREAM IF NOT EXISTS RECEIPTS_PARSE_STREAM ON STAGE {STAGE}").collect()
+    session.sql("""
+    CREATE STREAM IF NOT EXISTS PARSED_RECEIPTS_STREAM
+    ON TABLE parsed_receipts APPEND_ONLY = TRUE
+    """).collect()
+
+
+def extract_work_set(catch_up=False, partitions='TRUE'):
+    """Query of the new PDFs for AI_EXTRACT (relative_path, size), from RECEIPTS_STREAM."""
+    work_set = "SELECT relative_path, size FROM RECEIPTS_STREAM WHERE METADATA$ACTION = 'INSERT'"
+    if catch_up:
+        work_set += f"\nUNION\nSELECT relative_path, size FROM DIRECTORY(@{STAGE}) WHERE {partitions}"
+    return work_set
+
+
+def parse_work_set(catch_up=False, partitions='TRUE'):
+    """Query of the PDFs to parse (relative_path, size): RECEIPTS_PARSE_STREAM and, catching up, the stage."""
+    sources = ["SELECT relative_path, size FROM RECEIPTS_PARSE_STREAM WHERE METADATA$ACTION = 'INSERT'"]
+    if catch_up:
+        sources.append(f"SELECT relative_path, size FROM DIRECTORY(@{STAGE}) WHERE {partitions}")
+    return '\nUNION\n'.join(sources)
+
+
+def parsed_work(catch_up=False):
+    """Query of the receipts parsed since the last run (one row per receipt with content; empty markers left out)."""
+    sources = ["SELECT relative_path, content FROM PARSED_RECEIPTS_STREAM WHERE METADATA$ACTION = 'INSERT'"]
+    if catch_up:
+        sources.append("SELECT relative_path, content FROM parsed_receipts")
+    return f"""
+SELECT relative_path, content
+FROM ({' UNION ALL '.join(sources)})
+WHERE NOT ({EMPTY_CONTENT})
+QUALIFY ROW_NUMBER() OVER (PARTITION BY relative_path ORDER BY LENGTH(content) DESC) = 1
+"""
+
+
+def classify_query(parsed):
+    """INSERT classifying the parsed receipts that were not classified at upload time (CLASSIFY_RECEIPT)."""
+    return f"""
+INSERT INTO receipt_classifications (relative_path, family, vendor_name, classified_by)
+SELECT
+    relative_path,
+    classification:family::STRING,
+    classification:vendor_name::STRING,
+    'sql'
+FROM (
+    SELECT w.relative_path, CLASSIFY_RECEIPT(w.content) AS classification
+    FROM ({parsed}) w
+    WHERE NOT EXISTS (SELECT 1 FROM receipt_classifications c WHERE c.relative_path = w.relative_path)
+)
+"""
+
+
+def enqueue_ai_extract_query(work_set):
+    """INSERT queueing the new PDFs (except bundles) for AI_EXTRACT, with their size."""
+    return f"""
+INSERT INTO extraction_queue (pipeline, relative_path, bytes)
+SELECT 'ai_extract', relative_path, size
+FROM ({work_set})
+WHERE NOT {BUNDLE_CONDITION.format('relative_path')}
+"""
+
+
+def enqueue_parse_query(work_set):
+    """INSERT queueing the PDFs to parse that are not in parsed_receipts yet, with their size."""
+    return f"""
+INSERT INTO extraction_queue (pipeline, relative_path, bytes)
+SELECT 'ai_parse', q.relative_path, q.size
+FROM ({work_set}) q
+WHERE NOT EXISTS (SELECT 1 FROM parsed_receipts t WHERE {PARSED_MATCH})
+"""
+
+
+def enqueue_ai_complete_query(parsed):
+    """INSERT queueing the newly parsed receipts for AI_COMPLETE with their content and latest classification."""
+    return f"""
+INSERT INTO extraction_queue (pipeline, relative_path, bytes, content, family)
+WITH new_parsed AS ({parsed})
+SELECT 'ai_complete', w.relative_path, LENGTH(w.content), w.content, c.family
+FROM new_parsed w
+LEFT JOIN (
+    SELECT relative_path, family
+    FROM receipt_classifications
+    WHERE relative_path IN (SELECT relative_path FROM new_parsed)
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY relative_path ORDER BY classified_at DESC) = 1
+) c ON c.relative_path = w.relative_path
+WHERE NOT EXISTS (SELECT 1 FROM extracted_receipt_data e WHERE e.relative_path = w.relative_path)
+"""
+
+
+def pending_query(pipeline, target, match='t.relative_path = q.relative_path'):
+    """
+    Query of the queued receipts of pipeline that are not in its target table yet (relative_path, bytes).
+
+    match is the condition of a target row (t) holding the result of a queued receipt (q).
+    """
+    return f"""
+SELECT q.relative_path, MAX(q.bytes) AS bytes
+FROM extraction_queue q
+WHERE q.pipeline = {sql_string(pipeline)}
+  AND NOT EXISTS (SELECT 1 FROM {target} t WHERE {match})
+GROUP BY q.relative_path
+ORDER BY q.relative_path
+"""
+
+
+def clear_queue_query(pipeline, target, match='t.relative_path = q.relative_path'):
+    """DELETE of the queued receipts of pipeline whose results are in its target table (see pending_query)."""
+    return f"""
+DELETE FROM extraction_queue q
+USING {target} t
+WHERE q.pipeline = {sql_string(pipeline)} AND {match}
+"""
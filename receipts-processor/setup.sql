@@ -61,7 +61,10 @@ CREATE STAGE IF NOT EXISTS RECEIPTS
   ENCRYPTION = (TYPE = 'SNOWFLAKE_SSE')
   COMMENT = 'Stage for storing receipt PDF files with directory table enabled';
 
--- Refresh the stage metadata to initialize the directory table
+-- Refresh the stage metadata to initialize the directory table. The directory table
+-- has no auto-refresh: upload_receipts.py refreshes the prefixes it writes right after
+-- each upload, so RECEIPTS_STREAM sees new receipts without waiting for the hourly
+-- REFRESH_RECEIPTS_STAGE task (section 6)
 ALTER STAGE RECEIPTS REFRESH;
 
 -- Create stage for notebook files (in PUBLIC schema)
@@ -111,14 +114,30 @@ USE ROLE SYSADMIN;
 USE DATABASE RECEIPTS_PROCESSING_DB;
 USE SCHEMA RAW;
 
--- Create a stream to track new files added to the stage
+-- Create streams to track new files added to the stage. The pipelines read their work set
+-- from these streams instead of anti-joining the whole DIRECTORY() listing, so a run costs
+-- O(new files); a stream's offset only advances when the transaction consuming it commits.
+-- Each stream has one consumer, a pipeline of RUN_RECEIPTS_EXTRACTION (the receipts_engine
+-- package, section 7), run by the task, by its notebook or from the command line:
+--   RECEIPTS_STREAM       - 'ai_extract', receipts-extractor_ai_extract.ipynb (AI_EXTRACT)
+--   RECEIPTS_PARSE_STREAM - 'parse_and_complete', receipts-extractor.ipynb (AI_PARSE_DOCUMENT);
+--                           it also creates PARSED_RECEIPTS_STREAM on parsed_receipts for its extraction
+-- Streams only hold files added after their creation, and go stale if not consumed within the
+-- data retention period: after creating (or recreating) one, run its pipeline once with
+-- catch-up (CATCH_UP = True in the notebook, catch_up => TRUE for the procedure) to also
+-- process the files already on the stage.
 CREATE STREAM IF NOT EXISTS RECEIPTS_STREAM 
   ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS
-  COMMENT = 'Stream to track new receipt files uploaded to the stage';
+  COMMENT = 'Stream to track new receipt files uploaded to the stage (consumed by the ai_extract pipeline)';
 
--- Grant permissions on the stream (as ACCOUNTADMIN)
+CREATE STREAM IF NOT EXISTS RECEIPTS_PARSE_STREAM
+  ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS
+  COMMENT = 'Stream to track new receipt files uploaded to the stage (consumed by the parse_and_complete pipeline)';
+
+-- Grant permissions on the streams (as ACCOUNTADMIN)
 USE ROLE ACCOUNTADMIN;
 GRANT SELECT ON STREAM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM TO ROLE ETL_SERVICE_ROLE;
+GRANT SELECT ON STREAM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_PARSE_STREAM TO ROLE ETL_SERVICE_ROLE;
 
 -- Grant task execution permissions
 GRANT EXECUTE TASK ON ACCOUNT TO ROLE ETL_SERVICE_ROLE;
@@ -131,29 +150,46 @@ GRANT CREATE TASK ON SCHEMA RECEIPTS_PROCESSING_DB.RAW TO ROLE ETL_SERVICE_ROLE;
 -- ============================================================================
 -- 6. Create Automated Processing Task
 -- ============================================================================
--- This task automatically executes the AI_EXTRACT notebook when new files arrive
+-- AUTO_PROCESS_NEW_RECEIPTS runs the AI_EXTRACT pipeline when new files arrive, by calling the
+-- RUN_RECEIPTS_EXTRACTION procedure (the receipts_engine package, created in section 7,
+-- Step 4) instead of executing a notebook, so a run has no notebook startup overhead.
+-- Runs without new files are skipped by the WHEN condition, without resuming the warehouse.
+-- Files only reach RECEIPTS_STREAM once the stage's directory table is refreshed:
+-- upload_receipts.py refreshes the prefixes it writes right after each PUT, and
+-- REFRESH_RECEIPTS_STAGE refreshes the whole stage once an hour for files uploaded with
+-- --no-refresh or by other tools (a serverless task, so it does not resume a warehouse).
 
 USE ROLE SYSADMIN;
 USE DATABASE RECEIPTS_PROCESSING_DB;
 USE SCHEMA RAW;
 
 -- Create task to process new receipts automatically
--- Note: The notebook 'receipts-extractor_ai_extract' must exist in RECEIPTS_PROCESSING_DB.PUBLIC
+-- Note: The procedure RUN_RECEIPTS_EXTRACTION must exist in RECEIPTS_PROCESSING_DB.RAW before the task is resumed
 CREATE TASK IF NOT EXISTS AUTO_PROCESS_NEW_RECEIPTS
   WAREHOUSE = RECEIPTS_AI_EXTRACT_WH
   SCHEDULE = '1 MINUTE'
-  COMMENT = 'Automatically process new receipt files using AI_EXTRACT notebook'
+  COMMENT = 'Automatically process new receipt files using the AI_EXTRACT pipeline of receipts_engine'
   WHEN SYSTEM$STREAM_HAS_DATA('RECEIPTS_STREAM')
 AS
-  EXECUTE NOTEBOOK RECEIPTS_PROCESSING_DB.PUBLIC.receipts_extractor_ai_extract();
+  CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('ai_extract');
+
+-- Create task to pick up files the uploads did not refresh
+CREATE TASK IF NOT EXISTS REFRESH_RECEIPTS_STAGE
+  USER_TASK_MANAGED_INITIAL_WAREHOUSE_SIZE = 'XSMALL'
+  SCHEDULE = '60 MINUTE'
+  COMMENT = 'Refresh the directory table of the RECEIPTS stage for files uploaded without a refresh'
+AS
+  ALTER STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS REFRESH;
 
--- Grant permissions on the task (as ACCOUNTADMIN)
+-- Grant permissions on the tasks (as ACCOUNTADMIN)
 USE ROLE ACCOUNTADMIN;
 GRANT OWNERSHIP ON TASK RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS TO ROLE ETL_SERVICE_ROLE;
+GRANT OWNERSHIP ON TASK RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE TO ROLE ETL_SERVICE_ROLE;
 
--- Note: The task is created in SUSPENDED state by default
+-- Note: The tasks are created in SUSPENDED state by default
 -- To start automated processing, run:
 -- ALTER TASK RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS RESUME;
+-- ALTER TASK RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE RESUME;
 
 -- ============================================================================
 -- 7. Upload and Create Notebooks
@@ -176,6 +212,17 @@ PUT file://receipts-processor/ai.extract/receipts-extractor_ai_extract.ipynb
   @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/ai_extract/ 
   AUTO_COMPRESS=FALSE;
 
+-- Upload the receipt classifier (handler of the CLASSIFY_RECEIPT function) to udf/ directory
+PUT file://receipts.extraction/classifier.py 
+  @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/udf/ 
+  AUTO_COMPRESS=FALSE;
+
+-- Upload the extraction engine (handler of the RUN_RECEIPTS_EXTRACTION procedure) to engine/ directory,
+-- zipped first from receipts-processor/: zip -r receipts_engine.zip receipts_engine -x '*__pycache__*'
+PUT file://receipts-processor/receipts_engine.zip 
+  @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/engine/ 
+  AUTO_COMPRESS=FALSE OVERWRITE=TRUE;
+
 -- ========== Option 2: Using Snowflake CLI ==========
 -- From your terminal in the project root directory:
 
@@ -193,15 +240,29 @@ snow stage copy "receipts-processor/ai.extract/receipts-extractor_ai_extract.ipy
   @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/ai_extract/ \
   --connection <YOUR_CONNECTION_NAME>
 
+-- Upload the receipt classifier
+snow stage copy "receipts.extraction/classifier.py" \
+  @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/udf/ \
+  --connection <YOUR_CONNECTION_NAME>
+
+-- Upload the extraction engine (zipped as above)
+snow stage copy "receipts-processor/receipts_engine.zip" \
+  @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/engine/ \
+  --overwrite --connection <YOUR_CONNECTION_NAME>
+
 -- ========== Option 3: Using Snowsight UI ==========
 -- Navigate to Data » Databases » RECEIPTS_PROCESSING_DB » PUBLIC » Stages » NOTEBOOKS
 -- Click "+ Files" and upload to respective subdirectories:
 --   - parse_and_complete/: receipts-extractor.ipynb, environment.yml
 --   - ai_extract/: receipts-extractor_ai_extract.ipynb
+--   - udf/: classifier.py (from receipts.extraction/)
+--   - engine/: receipts_engine.zip (zipped from receipts-processor/receipts_engine/)
 
 -- ========== Verify Uploads ==========
 LIST @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/parse_and_complete/;
 LIST @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/ai_extract/;
+LIST @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/udf/;
+LIST @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/engine/;
 
 -- Or with Snowflake CLI:
 -- snow stage list @RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/parse_and_complete/ --connection <YOUR_CONNECTION_NAME>
@@ -232,6 +293,57 @@ USE ROLE ACCOUNTADMIN;
 GRANT OWNERSHIP ON NOTEBOOK RECEIPTS_PROCESSING_DB.PUBLIC.receipts_extractor TO ROLE ETL_SERVICE_ROLE;
 GRANT OWNERSHIP ON NOTEBOOK RECEIPTS_PROCESSING_DB.PUBLIC.receipts_extractor_ai_extract TO ROLE ETL_SERVICE_ROLE;
 
+-- Step 3: Create the receipt classifier function from the uploaded classifier.py
+-- CLASSIFY_RECEIPT(content) tags parsed receipt text as v1, v2 or unknown and names
+-- the vendor where known, e.g. {"family": "v2", "vendor_name": "Impact Advertising"}.
+-- receipts-extractor.ipynb uses it to pick the prompt and response schema per receipt.
+USE ROLE SYSADMIN;
+USE DATABASE RECEIPTS_PROCESSING_DB;
+USE SCHEMA RAW;
+
+CREATE OR REPLACE FUNCTION CLASSIFY_RECEIPT(content STRING)
+  RETURNS OBJECT
+  LANGUAGE PYTHON
+  RUNTIME_VERSION = '3.11'
+  IMPORTS = ('@RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/udf/classifier.py')
+  HANDLER = 'classifier.classify_text'
+  COMMENT = 'Classify parsed receipt text as v1, v2 or unknown and name its vendor';
+
+USE ROLE ACCOUNTADMIN;
+GRANT USAGE ON FUNCTION RECEIPTS_PROCESSING_DB.RAW.CLASSIFY_RECEIPT(STRING) TO ROLE ETL_SERVICE_ROLE;
+
+-- Step 4: Create the extraction procedure from the uploaded receipts_engine.zip
+-- RUN_RECEIPTS_EXTRACTION(pipeline, catch_up, max_chunk_files, max_chunk_mb, concurrent_chunks, refresh,
+-- recent_days) runs the 'ai_extract' or 'parse_and_complete' pipeline (stage refresh, streams, bounded micro-batches
+-- with checkpoints, result writes) and returns a summary of the run. It runs with the caller's rights,
+-- so the task (owned by ETL_SERVICE_ROLE) works on the tables of its own role.
+USE ROLE SYSADMIN;
+USE DATABASE RECEIPTS_PROCESSING_DB;
+USE SCHEMA RAW;
+
+CREATE OR REPLACE PROCEDURE RUN_RECEIPTS_EXTRACTION(
+    pipeline STRING DEFAULT 'ai_extract',
+    catch_up BOOLEAN DEFAULT FALSE,
+    max_chunk_files INTEGER DEFAULT 100,
+    max_chunk_mb INTEGER DEFAULT 20,
+    concurrent_chunks INTEGER DEFAULT 4,
+    refresh BOOLEAN DEFAULT FALSE,
+    recent_days INTEGER DEFAULT NULL
+)
+  RETURNS VARIANT
+  LANGUAGE PYTHON
+  RUNTIME_VERSION = '3.11'
+  PACKAGES = ('snowflake-snowpark-python', 'pydantic')
+  IMPORTS = ('@RECEIPTS_PROCESSING_DB.PUBLIC.NOTEBOOKS/engine/receipts_engine.zip')
+  HANDLER = 'receipts_engine.procedure.run'
+  EXECUTE AS CALLER
+  COMMENT = 'Run a receipt extraction pipeline (ai_extract or parse_and_complete) of receipts_engine';
+
+USE ROLE ACCOUNTADMIN;
+GRANT USAGE ON PROCEDURE RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION(
+    STRING, BOOLEAN, NUMBER, NUMBER, NUMBER, BOOLEAN, NUMBER
+) TO ROLE ETL_SERVICE_ROLE;
+
 -- ============================================================================
 -- 8. Verify Setup
 -- ============================================================================
@@ -247,6 +359,8 @@ SHOW STAGES IN SCHEMA RECEIPTS_PROCESSING_DB.PUBLIC;
 SHOW NOTEBOOKS IN SCHEMA RECEIPTS_PROCESSING_DB.PUBLIC;
 SHOW STREAMS IN SCHEMA RECEIPTS_PROCESSING_DB.RAW;
 SHOW TASKS IN SCHEMA RECEIPTS_PROCESSING_DB.RAW;
+SHOW USER FUNCTIONS LIKE 'CLASSIFY_RECEIPT' IN SCHEMA RECEIPTS_PROCESSING_DB.RAW;
+SHOW PROCEDURES LIKE 'RUN_RECEIPTS_EXTRACTION' IN SCHEMA RECEIPTS_PROCESSING_DB.RAW;
 
 -- Show grants for ETL_SERVICE_ROLE (requires ACCOUNTADMIN)
 USE ROLE ACCOUNTADMIN;
@@ -263,8 +377,10 @@ SELECT 'Setup complete!' AS status,
        'RAW, PUBLIC' AS schemas,
        'RECEIPTS (RAW), NOTEBOOKS (PUBLIC)' AS stages,
        'receipts_extractor, receipts_extractor_ai_extract' AS notebooks,
-       'RECEIPTS_STREAM' AS stream_name,
-       'AUTO_PROCESS_NEW_RECEIPTS' AS task_name,
+       'RECEIPTS_STREAM, RECEIPTS_PARSE_STREAM' AS stream_names,
+       'AUTO_PROCESS_NEW_RECEIPTS, REFRESH_RECEIPTS_STAGE' AS task_names,
+       'CLASSIFY_RECEIPT' AS function_name,
+       'RUN_RECEIPTS_EXTRACTION' AS procedure_name,
        'ETL_SERVICE_ROLE' AS role_with_access;
 
 -- ============================================================================
@@ -281,21 +397,39 @@ LIST @RECEIPTS_PROCESSING_DB.RAW.RECEIPTS;
 -- To query the directory table:
 SELECT * FROM DIRECTORY(@RECEIPTS_PROCESSING_DB.RAW.RECEIPTS);
 
--- To check for new files in the stream:
+-- With date-partitioned uploads (upload_receipts.py --partition-by date), list,
+-- refresh and scan only a recent partition instead of the whole stage:
+LIST @RECEIPTS_PROCESSING_DB.RAW.RECEIPTS/2026/10/19/;
+ALTER STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS REFRESH SUBPATH = '2026/10/19/';
+SELECT * FROM DIRECTORY(@RECEIPTS_PROCESSING_DB.RAW.RECEIPTS)
+WHERE STARTSWITH(relative_path, '2026/10/19/');
+
+-- To check for new files in the streams (a SELECT does not consume them):
 SELECT * FROM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM;
+SELECT * FROM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_PARSE_STREAM;
+
+-- To recreate a stale stream (then run its pipeline once with catch-up):
+CREATE OR REPLACE STREAM RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM
+  ON STAGE RECEIPTS_PROCESSING_DB.RAW.RECEIPTS;
 
 -- To remove a file from the stage:
 REMOVE @RECEIPTS_PROCESSING_DB.RAW.RECEIPTS/receipt_filename.pdf;
 
+-- To classify parsed receipts:
+SELECT relative_path, CLASSIFY_RECEIPT(content):family::STRING AS family
+FROM RECEIPTS_PROCESSING_DB.RAW.parsed_receipts;
+
 -- ============================================================================
 -- Task Management
 -- ============================================================================
 
--- Start automated processing (resume the task):
+-- Start automated processing (resume the tasks):
 ALTER TASK RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS RESUME;
+ALTER TASK RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE RESUME;
 
--- Stop automated processing (suspend the task):
+-- Stop automated processing (suspend the tasks):
 ALTER TASK RECEIPTS_PROCESSING_DB.RAW.AUTO_PROCESS_NEW_RECEIPTS SUSPEND;
+ALTER TASK RECEIPTS_PROCESSING_DB.RAW.REFRESH_RECEIPTS_STAGE SUSPEND;
 
 -- Check task status:
 SHOW TASKS LIKE 'AUTO_PROCESS_NEW_RECEIPTS' IN SCHEMA RECEIPTS_PROCESSING_DB.RAW;
@@ -308,8 +442,19 @@ FROM TABLE(INFORMATION_SCHEMA.TASK_HISTORY(
 ))
 ORDER BY SCHEDULED_TIME DESC;
 
--- Manually execute the notebook:
-EXECUTE NOTEBOOK RECEIPTS_PROCESSING_DB.RAW.receipts_extractor_ai_extract();
+-- Manually run a pipeline (the summary of the run is the result):
+CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('ai_extract', refresh => TRUE);
+CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('parse_and_complete', refresh => TRUE);
+
+-- Refresh only the recent date partitions (upload_receipts.py --partition-by date):
+CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('ai_extract', refresh => TRUE, recent_days => 2);
+
+-- Catch up once after (re)creating the streams, or tune the chunks (files, MB, concurrency):
+CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('ai_extract', catch_up => TRUE);
+CALL RECEIPTS_PROCESSING_DB.RAW.RUN_RECEIPTS_EXTRACTION('parse_and_complete', FALSE, 50, 10, 8);
+
+-- Or execute the notebook interactively:
+EXECUTE NOTEBOOK RECEIPTS_PROCESSING_DB.PUBLIC.receipts_extractor_ai_extract();
 
 -- Check if stream has data (new files):
 SELECT SYSTEM$STREAM_HAS_DATA('RECEIPTS_PROCESSING_DB.RAW.RECEIPTS_STREAM');
@@ -0,0 +1,202 @@
+"""
+Quick test script to verify the extraction engine's selection, batching and SQL without a Snowflake account.
+
+Needs the engine's requirements (pip install -r requirements.txt): importing receipts_engine builds
+the v2 response schema with pydantic.
+"""
+import receipts_engine.batching as batching
+from receipts_engine import PIPELINES, run_ai_extract, run_parse_and_complete
+from receipts_engine.pipelines import parse_new_receipts
+from receipts_engine.batching import plan_chunks
+from receipts_engine.procedure import run
+
+
+# A receipt whose extraction fails (and fails every chunk it is in)
+BAD_PATH = "2026/10/19/bad'receipt.pdf"
+
+
+class FakeJob:
+    """Asynchronous query that fails when it extracts BAD_PATH."""
+
+    def __init__(self, query):
+        self.query = query
+
+    def is_done(self):
+        return True
+
+    def result(self):
+        if BAD_PATH.replace("'", "''") in self.query:
+            raise RuntimeError("document could not be read")
+        return [{'number of rows inserted': 1}]
+
+
+class FakeSession:
+    """Records statements; the pending query returns the given receipts."""
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.statements = []
+
+    def sql(self, query):
+        session = self
+
+        class Statement:
+            def collect(self):
+                session.statements.append(query)
+                if 'MAX(q.bytes)' in query:
+                    return [{'RELATIVE_PATH': path, 'BYTES': size} for path, size in session.pending]
+                if query.lstrip().startswith('INSERT INTO extraction_queue'):
+                    return [{'number of rows inserted': len(session.pending)}]
+                return []
+
+            def collect_nowait(self):
+                session.statements.append(query)
+                return FakeJob(query)
+
+        return Statement()
+
+
+def test_plan_chunks():
+    """Chunks respect both bounds, and a receipt larger than the byte bound is a chunk of its own."""
+    print("Testing chunk planning...")
+    print("="*60)
+
+    mb = 1024 * 1024
+    pending = [(f"r{i}.pdf", mb) for i in range(7)] + [("large.pdf", 5 * mb), ("last.pdf", mb)]
+    chunks = plan_chunks(pending, max_files=3, max_mb=4)
+    sizes = [len(paths) for paths, _ in chunks]
+
+    print("\n" + "="*60)
+    if [path for paths, _ in chunks for path in paths] != [path for path, _ in pending]:
+        print("✗ Chunks lost or reordered receipts")
+        return False
+    if sizes != [3, 3, 1, 1, 1] or chunks[3] != (["large.pdf"], 5 * mb):
+        print(f"✗ Unexpected chunks: {sizes}")
+        return False
+    if plan_chunks([]) != []:
+        print("✗ No pending receipts must plan no chunks")
+        return False
+
+    print(f"✓ {len(pending)} receipts planned into chunks of {sizes} receipts")
+    return True
+
+
+def test_ai_extract_run():
+    """A failed chunk costs only its bad receipt: the others are retried one per chunk and checkpointed."""
+    print("\nTesting the AI_EXTRACT pipeline...")
+    print("="*60)
+
+    batching.POLL_SECONDS = 0
+    pending = [(f"2026/10/19/receipt_{i:03d}.pdf", 200_000) for i in range(9)] + [(BAD_PATH, 200_000)]
+    session = FakeSession(pending)
+    summary = run_ai_extract(session, max_chunk_files=4, concurrent_chunks=2)
+
+    chunk_queries = [query for query in session.statements if 'INSERT ALL' in query]
+    failures = [query for query in session.statements if "'FAILED'" in query]
+    enqueue = [query for query in session.statements if query.lstrip().startswith('INSERT INTO extraction_queue')]
+
+    print("\n" + "="*60)
+    if summary['extracted'] != 9 or summary['failed'] != 1 or summary['chunks'] != 3:
+        print(f"✗ Unexpected summary: {summary}")
+        return False
+    # 3 chunks, then the 2 receipts of the failed chunk one per chunk
+    if len(chunk_queries) != 5 or len(failures) != 2:
+        print(f"✗ Expected 5 chunk statements and 2 failed checkpoints, got {len(chunk_queries)} and {len(failures)}")
+        return False
+    if not all('INTO extraction_checkpoints' in q and 'INTO extracted_receipt_data_via_ai_extract' in q
+               for q in chunk_queries):
+        print("✗ Chunk statements must write their results and checkpoint together")
+        return False
+    if len(enqueue) != 1 or 'RECEIPTS_STREAM' not in enqueue[0] or 'DIRECTORY(' in enqueue[0]:
+        print("✗ New receipts must be queued from RECEIPTS_STREAM only (no catch-up)")
+        return False
+
+    print(f"✓ {summary['extracted']} receipts extracted in {summary['chunks']} chunks, 1 bad receipt left queued")
+    print("✓ Failed chunks checkpointed, their receipts retried one per chunk")
+    return True
+
+
+def test_parse_and_complete_run():
+    """The parse pipeline queues and parses in chunks, classifies in a transaction and routes v2 receipts."""
+    print("\nTesting the parse and AI_COMPLETE pipeline...")
+    print("="*60)
+
+    session = FakeSession([("2026/10/19/receipt_001.pdf", 4000)])
+    summary = run_parse_and_complete(session, catch_up=True, recent_days=2)
+
+    statements = [query.strip() for query in session.statements]
+    chunk = next(query for query in statements if query.startswith('INSERT ALL') and 'ai_complete(' in query)
+    parse_chunk = next(query for query in statements if query.startswith('INSERT ALL') and 'AI_PARSE_DOCUMENT' in query)
+    catch_up = next(query for query in statements if 'DIRECTORY(' in query)
+
+    print("\n" + "="*60)
+    if statements.count('BEGIN') != 1 or statements.count('COMMIT') != 1:
+        print("✗ Classifying and queueing must run in one transaction, parsing in its own chunks")
+        return False
+    if 'INTO extraction_checkpoints' not in parse_chunk or "'ai_parse'" not in parse_chunk:
+        print("✗ Parse chunks must write their checkpoint with their parsed receipts")
+        return False
+    if summary['extracted'] != 1 or "'title': 'ReceiptV2'" not in chunk or "family = 'v2'" not in chunk:
+        print("✗ AI_COMPLETE chunk must route v2 receipts to the ReceiptV2 schema")
+        return False
+    if any(query.startswith('DELETE FROM parsed_receipts') for query in statements):
+        print("✗ Parses without text must stay as marker rows, not be deleted and parsed again")
+        return False
+    if "STARTSWITH(relative_path, '" not in catch_up:
+        print("✗ Catch-up scan must be limited to the recent partitions")
+        return False
+    try:
+        run(session, pipeline='unknown')
+        print("✗ The procedure must reject unknown pipelines")
+        return False
+    except ValueError:
+        pass
+
+    # The task's call refreshes the recent partitions of the stage before reading the streams
+    session = FakeSession([])
+    run(session, pipeline='ai_extract', refresh=True, recent_days=2)
+    refreshes = [query for query in session.statements if 'REFRESH SUBPATH' in query]
+    if len(refreshes) != 2:
+        print(f"✗ refresh with recent_days=2 must refresh 2 partitions, got {len(refreshes)}")
+        return False
+
+    print(f"✓ Pipelines available: {', '.join(sorted(PIPELINES))}")
+    print("✓ Parsed in checkpointed chunks, classified and queued in one transaction, v2 routed to ReceiptV2")
+    print("✓ Procedure refreshes the recent stage partitions")
+    return True
+
+
+def test_parse_dead_letter():
+    """An unparsable PDF is dead-lettered after its own retry instead of blocking the chunk and later runs."""
+    print("\nTesting chunked parsing with a dead letter...")
+    print("="*60)
+
+    pending = [(f"2026/10/19/receipt_{i:03d}.pdf", 100_000) for i in range(5)] + [(BAD_PATH, 100_000)]
+    session = FakeSession(pending)
+    queued, summary = parse_new_receipts(session, max_chunk_files=3)
+
+    statements = [query.strip() for query in session.statements]
+    enqueue = [query for query in statements if query.startswith('INSERT INTO extraction_queue')]
+    dead_letters = [query for query in statements if query.startswith('INSERT INTO extraction_dead_letters')]
+    unqueued = [query for query in statements if query.startswith('DELETE FROM extraction_queue')
+                and 'relative_path IN' in query]
+
+    print("\n" + "="*60)
+    if len(enqueue) != 1 or 'RECEIPTS_PARSE_STREAM' not in enqueue[0] or 'BEGIN' in statements:
+        print("✗ New PDFs must be queued from RECEIPTS_PARSE_STREAM by one statement, outside a transaction")
+        return False
+    if summary['extracted'] != 5 or summary['dead_lettered'] != 1 or summary['failed'] != 0:
+        print(f"✗ Unexpected summary: {summary}")
+        return False
+    if len(dead_letters) != 1 or len(unqueued) != 1 or "bad''receipt" not in dead_letters[0] + unqueued[0]:
+        print("✗ The unparsable PDF must move from extraction_queue to extraction_dead_letters")
+        return False
+
+    print(f"✓ {queued} PDF(s) queued, {summary['extracted']} parsed in chunks, 1 unparsable PDF dead-lettered")
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_plan_chunks() and test_ai_extract_run() and test_parse_and_complete_run()
+               and test_parse_dead_letter())
+    exit(0 if success else 1)
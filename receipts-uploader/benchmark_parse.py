@@ -0,0 +1,219 @@
+"""
+Benchmark the local text-layer parser (upload_receipts.py --local-parse) against
+AI_PARSE_DOCUMENT layout mode.
+
+Runs on a workload directory written by receipts.synthesis/workload_generator.py,
+whose manifest.jsonl holds the ground truth of every receipt. For each parser it
+reports wall time, pages/sec and field recall: the share of the ground-truth
+values printed on a page (vendor, IDs, dates, line items, amounts, ...) that
+appear in the parsed text. Printed values are those found in the page's raw
+text layer; fields a template does not print are not counted.
+
+With --cortex the same PDFs are also parsed by AI_PARSE_DOCUMENT in Snowflake,
+and the token agreement between both renditions is reported.
+"""
+import sys
+import json
+import time
+import difflib
+from pathlib import Path
+
+from upload_receipts import (
+    CONFIG_PATH, EXTRACTION_DIR, load_config, connect_to_snowflake, _extraction_modules
+)
+
+# The field index used to label display lists (reportlab is needed to import it)
+sys.path.append(str(Path(__file__).parent.parent / 'receipts.synthesis'))
+
+# Temporary stage the --cortex benchmark uploads its PDFs to (dropped with the session)
+BENCHMARK_STAGE = 'RECEIPTS_PARSE_BENCHMARK'
+
+
+def load_ground_truth(workload_dir):
+    """
+    Map the relative path of every receipt page to its (data, vendor name).
+
+    Args:
+        workload_dir: Directory with the PDFs and manifest.jsonl
+
+    Returns:
+        Dictionary relative path -> (data, vendor_name); bundle pages are "<bundle>#page=N"
+    """
+    truth = {}
+    with open(Path(workload_dir) / 'manifest.jsonl') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'data' not in record:
+                continue
+            path = record['filename']
+            if 'page_start' in record:
+                path = f"{path}#page={record['page_start']}"
+            truth[path] = (record['data'], record['vendor_name'])
+    return truth
+
+
+def fields_in(content, field_index):
+    """
+    Ground-truth fields whose value appears in a text.
+
+    Args:
+        content: Parsed or raw page text
+        field_index: display_list.build_field_index() of the page's receipt
+
+    Returns:
+        Set of field paths
+    """
+    text = ' '.join((content or '').split())
+    return {
+        path
+        for rendering, paths in field_index if ' '.join(rendering.split()) in text
+        for path in paths
+    }
+
+
+def printed_fields(pdfs, truth):
+    """Map every receipt page to its field index and the fields its raw text layer shows."""
+    from display_list import build_field_index
+    from text_layer import read_pages
+
+    printed = {}
+    for pdf in pdfs:
+        pages = read_pages(str(pdf))
+        for number, spans in enumerate(pages, 1):
+            path = pdf.name if len(pages) == 1 else f"{pdf.name}#page={number}"
+            if path in truth:
+                index = build_field_index(*truth[path])
+                printed[path] = (index, fields_in(' '.join(span[0] for span in spans), index))
+    return printed
+
+
+def token_agreement(a, b):
+    """Similarity (0-1) of two texts compared token by token, ignoring whitespace layout."""
+    return difflib.SequenceMatcher(None, (a or '').split(), (b or '').split(), autojunk=False).ratio()
+
+
+def parse_local(pdfs, workers):
+    """Parse PDFs with the local text-layer parser; return ({relative path: content}, seconds)."""
+    from layout_text import parse_files
+
+    start = time.perf_counter()
+    records = parse_files([(str(pdf), pdf.name) for pdf in pdfs], workers)
+    return {r['relative_path']: r['content'] for r in records}, time.perf_counter() - start
+
+
+def parse_cortex(conn, pdfs):
+    """
+    Parse PDFs with AI_PARSE_DOCUMENT layout mode on a temporary stage.
+
+    Returns:
+        Tuple ({relative path: content}, seconds spent in AI_PARSE_DOCUMENT)
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE OR REPLACE TEMPORARY STAGE {BENCHMARK_STAGE}
+              DIRECTORY = (ENABLE = TRUE)
+              ENCRYPTION = (TYPE = 'SNOWFLAKE_SSE')
+        """)
+        for pdf in pdfs:
+            cursor.execute(f"PUT file://{pdf.resolve().as_posix()} @{BENCHMARK_STAGE} AUTO_COMPRESS=FALSE")
+        cursor.execute(f"ALTER STAGE {BENCHMARK_STAGE} REFRESH")
+
+        start = time.perf_counter()
+        cursor.execute(f"""
+            SELECT
+                relative_path,
+                AI_PARSE_DOCUMENT(
+                    to_file('@{BENCHMARK_STAGE}', relative_path),
+                    {{'mode': 'layout', 'page_split': true}}
+                ) AS parsed
+            FROM DIRECTORY(@{BENCHMARK_STAGE})
+        """)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+    finally:
+        cursor.close()
+
+    contents = {}
+    for relative_path, parsed in rows:
+        pages = json.loads(parsed).get('pages', []) if isinstance(parsed, str) else parsed.get('pages', [])
+        for page in pages:
+            path = relative_path if len(pages) == 1 else f"{relative_path}#page={page['index'] + 1}"
+            contents[path] = page.get('content', '')
+    return contents, elapsed
+
+
+def summarize(name, contents, elapsed, printed):
+    """Print one benchmark row and return the field recall."""
+    found = total = 0
+    for path, (index, fields) in printed.items():
+        found += len(fields & fields_in(contents.get(path), index))
+        total += len(fields)
+    recall = found / total if total else 0.0
+    rate = len(contents) / elapsed if elapsed else 0.0
+    print(f"{name:<22} {len(contents):>6} {elapsed:>10.2f}s {rate:>11.1f} {recall:>13.1%}")
+    return recall
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compare local text-layer parsing with AI_PARSE_DOCUMENT (fidelity and wall time)"
+    )
+    parser.add_argument(
+        'directory',
+        help='Workload directory with receipt PDFs and manifest.jsonl (workload_generator.py output)'
+    )
+    parser.add_argument(
+        '-n', '--sample',
+        type=int,
+        help='Only benchmark the first N PDFs (default: all)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of local parser processes (default: CPU count)'
+    )
+    parser.add_argument(
+        '--cortex',
+        action='store_true',
+        help='Also parse the PDFs with AI_PARSE_DOCUMENT (uses config.json; incurs Cortex cost)'
+    )
+
+    args = parser.parse_args()
+
+    pdfs = sorted(Path(args.directory).glob('*.pdf'))[:args.sample]
+    if not pdfs:
+        print(f"✗ No PDF files found in {args.directory}")
+        sys.exit(1)
+    _extraction_modules()
+    printed = printed_fields(pdfs, load_ground_truth(args.directory))
+    print(f"Benchmarking {len(pdfs)} PDF(s) from {args.directory} (local parser in {EXTRACTION_DIR.name})\n")
+
+    local, local_elapsed = parse_local(pdfs, args.workers)
+    cortex = None
+    if args.cortex:
+        conn = connect_to_snowflake(load_config(CONFIG_PATH))
+        try:
+            print("Parsing with AI_PARSE_DOCUMENT...")
+            cortex, cortex_elapsed = parse_cortex(conn, pdfs)
+        finally:
+            conn.close()
+        print()
+
+    print(f"{'Parser':<22} {'Pages':>6} {'Wall time':>11} {'Pages/sec':>11} {'Field recall':>13}")
+    print("-" * 67)
+    summarize(f"local (-j {args.workers or 'auto'})", local, local_elapsed, printed)
+    if cortex is not None:
+        summarize("AI_PARSE_DOCUMENT", cortex, cortex_elapsed, printed)
+        shared = [path for path in local if path in cortex]
+        if shared:
+            agreement = sum(token_agreement(local[p], cortex[p]) for p in shared) / len(shared)
+            print(f"\n✓ Token agreement local vs AI_PARSE_DOCUMENT: {agreement:.1%} over {len(shared)} page(s)")
+            print(f"✓ Local parsing was {cortex_elapsed / local_elapsed:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Benchmark the uploader offline against the local stage stand-in (local_stage.py).
+
+For each workload size (1k to 1M files) it generates small synthetic receipt
+files, then times the uploader's phases with the functions upload_receipts.py
+uses:
+
+- scan: list the receipts directory
+- hash (cold / warm): MD5 every file, then again from the digest cache
+- diff: compare the local files with the ledger (1% new, 1% changed)
+- upload: batch mode (concurrent wildcard PUTs, optionally with the adaptive
+  concurrency of --adaptive) and the asyncio pipeline
+- reconcile: paged LIST of the stage into the ledger
+
+The local stage adds the configured round-trip latency and bandwidth, so the
+results show how the uploader's own overhead scales with the file count
+rather than the speed of a real network. A shared uplink (--uplink) and
+throttling (--max-concurrent-puts) show how --adaptive settles on a number
+of PUTs in flight.
+"""
+import io
+import os
+import time
+import shutil
+import tempfile
+import contextlib
+from pathlib import Path
+
+from file_hashes import DEFAULT_HASH_WORKERS, hash_files
+from upload_ledger import UploadLedger
+from upload_receipts import (
+    DEFAULT_CONCURRENCY, DEFAULT_PARALLEL, DEFAULT_BATCH_SIZE, get_local_receipts, plan_changes, upload_files,
+    reconcile_ledger
+)
+from upload_concurrency import DEFAULT_MAX_CONCURRENCY, ConcurrencyController
+from local_stage import connect
+
+# Stage the benchmark uploads to, inside the local stage root
+BENCHMARK_STAGE = 'BENCH_DB.RAW.RECEIPTS'
+
+# Workload sizes benchmarked by default
+DEFAULT_SIZES = (1000, 10000)
+
+# Bytes per synthetic receipt (about the size of a generated one-page receipt)
+DEFAULT_FILE_SIZE = 2600
+
+
+def generate_files(directory, count, file_size=DEFAULT_FILE_SIZE):
+    """
+    Write synthetic receipt files (random content, unique per file) into a directory.
+
+    Existing files are kept, so the receipts of a kept --work-dir are reused.
+
+    Returns:
+        Seconds spent writing files
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    for number in range(count):
+        path = directory / f"receipt_bench_{number:07d}.pdf"
+        if not path.exists():
+            path.write_bytes(b'%PDF-1.4\n' + os.urandom(file_size - 9))
+    return time.perf_counter() - start
+
+
+def timed(function, *args, **kwargs):
+    """Call a function with its output suppressed; return (result, seconds)."""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_size(work_dir, count, stage_config, args):
+    """
+    Benchmark every phase on a workload of count files.
+
+    Returns:
+        List of (phase, seconds) tuples
+    """
+    receipts_dir = work_dir / f"receipts_{count}"
+    generate_files(receipts_dir, count, args.file_size)
+    stage_root = work_dir / f"stage_{count}"
+    shutil.rmtree(stage_root, ignore_errors=True)
+    config = {'local_stage': dict(stage_config, root=str(stage_root))}
+    for ledger_path in work_dir.glob(f"ledger_{count}*.db"):
+        ledger_path.unlink()
+    ledger = UploadLedger(work_dir / f"ledger_{count}.db")
+    results = []
+
+    files, seconds = timed(get_local_receipts, receipts_dir)
+    results.append(('scan', seconds))
+
+    cache = {}
+    (hashes, _), seconds = timed(hash_files, files, cache, args.hash_workers)
+    results.append(('hash (cold)', seconds))
+    _, seconds = timed(hash_files, files, cache, args.hash_workers)
+    results.append(('hash (warm)', seconds))
+
+    # Steady state: 98% of the files are on the stage, 1% new and 1% changed
+    stage_files = {Path(path).name: hashes[path] for path in list(hashes)[count // 100:]}
+    for name in list(stage_files)[:count // 100]:
+        stage_files[name] = (stage_files[name][0], '0' * 32)
+    _, seconds = timed(plan_changes, files, hashes, stage_files)
+    results.append(('diff', seconds))
+
+    conn = connect(**config['local_stage'])
+    try:
+        controller = ConcurrencyController(args.concurrency, args.adaptive, args.max_concurrency)
+        _, seconds = timed(upload_files, conn, files, BENCHMARK_STAGE, args.concurrency, args.parallel,
+                           args.batch_size, controller=controller)
+        results.append((f"upload (batch, c={controller.limit})" if args.adaptive else 'upload (batch)', seconds))
+
+        _, seconds = timed(reconcile_ledger, conn, ledger, BENCHMARK_STAGE)
+        results.append(('reconcile (LIST)', seconds))
+    finally:
+        conn.close()
+
+    if args.pipeline:
+        from upload_pipeline import DEFAULT_PIPELINE_BATCH_SIZE, run_pipeline
+
+        shutil.rmtree(stage_root, ignore_errors=True)
+        pipeline_ledger = UploadLedger(work_dir / f"ledger_{count}_pipeline.db")
+        try:
+            _, seconds = timed(run_pipeline, config, pipeline_ledger, receipts_dir, BENCHMARK_STAGE, {},
+                               args.concurrency, args.parallel, DEFAULT_PIPELINE_BATCH_SIZE, args.hash_workers)
+            results.append(('upload (pipeline)', seconds))
+        finally:
+            pipeline_ledger.close()
+    ledger.close()
+    return results
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark scan, diff and upload throughput against the offline local stage"
+    )
+    parser.add_argument(
+        'sizes',
+        type=int,
+        nargs='*',
+        default=list(DEFAULT_SIZES),
+        help=f'Workload sizes in files (default: {" ".join(map(str, DEFAULT_SIZES))}; up to 1000000)'
+    )
+    parser.add_argument(
+        '--work-dir',
+        type=str,
+        help='Directory for the synthetic receipts, local stages and ledgers (default: a temporary directory, '
+             'removed afterwards; a given directory is kept and its receipts reused)'
+    )
+    parser.add_argument(
+        '--file-size',
+        type=int,
+        default=DEFAULT_FILE_SIZE,
+        help=f'Bytes per synthetic receipt (default: {DEFAULT_FILE_SIZE})'
+    )
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Concurrent PUT statements (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('-p', '--parallel', type=int, default=DEFAULT_PARALLEL,
+                        help=f'PUT PARALLEL setting (default: {DEFAULT_PARALLEL})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Files per PUT batch in batch mode (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help=f'Hashing threads (default: {DEFAULT_HASH_WORKERS})')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='Simulated round trip per statement in seconds (default: 0.05)')
+    parser.add_argument('--bandwidth', type=float,
+                        help='Simulated MB/s per PUT thread (default: unlimited)')
+    parser.add_argument('--uplink', type=float,
+                        help='Simulated MB/s of an uplink shared by all PUTs (default: unlimited)')
+    parser.add_argument('--max-concurrent-puts', type=int,
+                        help='Simulated throttling of PUTs beyond this many in flight (default: none)')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Adapt the concurrent PUTs of batch mode (AIMD), starting at -c')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Highest number of concurrent PUTs with --adaptive (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Share of PUT/LIST statements failing transiently (default: 0)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Also benchmark the asyncio pipeline (--pipeline) upload')
+
+    args = parser.parse_args()
+
+    stage_config = {
+        'latency': args.latency,
+        'bandwidth_mbps': args.bandwidth,
+        'failure_rate': args.failure_rate,
+        'uplink_mbps': args.uplink,
+        'max_concurrent_puts': args.max_concurrent_puts,
+        'seed': 0,
+    }
+    work_dir = Path(args.work_dir or tempfile.mkdtemp(prefix='upload_benchmark_'))
+    print(f"Benchmarking the uploader against the local stage in {work_dir} "
+          f"(latency {args.latency}s, bandwidth {args.bandwidth or 'unlimited'} MB/s per thread, "
+          f"-c {args.concurrency} -p {args.parallel})\n")
+    print(f"{'Files':>9} {'Phase':<20} {'Time':>10} {'Files/sec':>12}")
+    print("-" * 54)
+    try:
+        for count in args.sizes:
+            for phase, seconds in benchmark_size(work_dir, count, stage_config, args):
+                rate = count / seconds if seconds else 0.0
+                print(f"{count:>9} {phase:<20} {seconds:>9.2f}s {rate:>12,.0f}")
+            print()
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print("✓ Benchmark complete")
+
+
+if __name__ == "__main__":
+    main()
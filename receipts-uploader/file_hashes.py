@@ -0,0 +1,79 @@
+"""
+Fast MD5 hashing of local receipt files for change detection.
+
+Files are read through memory maps in a thread pool (hashlib releases the GIL
+while digesting, so threads hash files concurrently). Digests are cached by
+(inode, mtime, size): a file that has not changed since the last run is not
+read again.
+"""
+import os
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Threads hashing files concurrently
+DEFAULT_HASH_WORKERS = 8
+
+
+def md5_file(path):
+    """
+    MD5 hex digest of a file, read through a memory map.
+
+    Args:
+        path: File path
+
+    Returns:
+        Hex digest string
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.md5(b'').hexdigest()  # empty files cannot be memory-mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.md5(mapped).hexdigest()
+
+
+def file_key(stat):
+    """Cache key of a file: (inode, mtime in ns, size)."""
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def hash_file(path, cache):
+    """
+    MD5 one file, reusing its cached digest if the file is unchanged.
+
+    Args:
+        path: File path
+        cache: Dictionary path string -> ((inode, mtime_ns, size), md5); updated in place
+
+    Returns:
+        Tuple (size, md5, whether the file was read)
+    """
+    path = str(path)
+    stat = os.stat(path)
+    key = file_key(stat)
+    cached = cache.get(path)
+    if cached and tuple(cached[0]) == key:
+        return stat.st_size, cached[1], False
+    md5 = md5_file(path)
+    cache[path] = (key, md5)
+    return stat.st_size, md5, True
+
+
+def hash_files(paths, cache, workers=DEFAULT_HASH_WORKERS):
+    """
+    MD5 every file, reusing cached digests of unchanged files.
+
+    Args:
+        paths: File paths
+        cache: Dictionary path string -> ((inode, mtime_ns, size), md5); updated in place
+        workers: Number of hashing threads
+
+    Returns:
+        Tuple ({path string: (size, md5)}, number of files actually read)
+    """
+    paths = [str(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda path: hash_file(path, cache), paths))
+    hashes = {path: (size, md5) for path, (size, md5, _) in zip(paths, results)}
+    return hashes, sum(read for _, _, read in results)
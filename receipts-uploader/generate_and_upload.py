@@ -0,0 +1,313 @@
+"""
+Generate receipts and upload them in one process, without writing them to disk.
+
+The generator (receipts.synthesis/receipt_generator.py) renders each receipt
+into memory and hands it to the uploader through a bounded queue. Upload
+threads, each with its own connection, PUT every receipt straight from memory
+with the connector's file_stream support while the next ones are rendered.
+Rendering and uploading overlap, so a cycle takes about as long as the slower
+of the two rather than their sum, and no receipt is written to ../receipts
+and read back. When uploads fall behind, the full queue makes the generator
+wait (backpressure), bounding the memory held by rendered receipts.
+
+Uploads are recorded in the upload ledger like those of upload_receipts.py,
+and the prefixes written are refreshed in the stage directory as they are
+uploaded (stage_refresh.py).
+Receipts that cannot be uploaded (after retries for transient errors) are
+written to the spill directory, where the next upload_receipts.py run picks
+them up.
+
+Used by scripts/generate_and_upload.sh.
+"""
+import io
+import sys
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path, PurePath
+
+from upload_ledger import UploadLedger
+from upload_receipts import (
+    CONFIG_PATH, LEDGER_PATH, PARTITION_SCHEMES, load_config, connect_to_snowflake, stage_target,
+    write_telemetry, _extraction_modules
+)
+from upload_retry import DEFAULT_MAX_ATTEMPTS, STATEMENT_ERROR_PREFIX, backoff_delay, final_message, should_retry
+from upload_telemetry import UploadTelemetry
+from stage_refresh import StageRefresher
+
+# The receipt generator
+SYNTHESIS_DIR = Path(__file__).parent.parent / 'receipts.synthesis'
+
+# Receipts that could not be uploaded are written here, for the next upload_receipts.py run
+DEFAULT_SPILL_DIR = Path(__file__).parent.parent / 'receipts'
+
+# Rendered receipts held in memory waiting for an upload thread
+DEFAULT_QUEUE_SIZE = 64
+
+# Upload threads, each with its own connection and one single-file PUT in flight
+DEFAULT_STREAM_CONCURRENCY = 8
+
+
+def upload_stream(conn, name, data, stage_name, prefix=None, overwrite=False):
+    """
+    Upload one file from memory with a single PUT using the connector's file_stream.
+
+    Args:
+        conn: Snowflake connection
+        name: File name on the stage
+        data: File content (bytes)
+        stage_name: Target stage
+        prefix: Path prefix in the stage, or None for the stage root
+        overwrite: PUT OVERWRITE setting
+
+    Returns:
+        Tuple (status, message), status being 'UPLOADED', 'SKIPPED' or 'FAILED'
+    """
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"PUT 'file://{name}' @{stage_target(stage_name, prefix)} "
+                f"AUTO_COMPRESS=FALSE OVERWRITE={'TRUE' if overwrite else 'FALSE'}",
+                file_stream=io.BytesIO(data)
+            )
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return 'FAILED', f"{STATEMENT_ERROR_PREFIX}{type(e).__name__}: {e}"
+    if row is None:
+        return 'FAILED', 'no PUT result row'
+    status = str(row[6]).upper()
+    return (status if status in ('UPLOADED', 'SKIPPED') else 'FAILED'), (row[7] if len(row) > 7 else '')
+
+
+def stream_prefix(name, data, scheme):
+    """Stage prefix of a rendered receipt: today's UTC date (yyyy/mm/dd), its family, or '' (see --partition-by)."""
+    if scheme == 'date':
+        return datetime.now(timezone.utc).strftime('%Y/%m/%d')
+    if scheme == 'family':
+        _extraction_modules()
+        from classifier import classify_pdf
+
+        return classify_pdf(data, name)[0]['family']
+    return ''
+
+
+def _upload_worker(conn, receipts, done, stage_name, partition_by, max_attempts, telemetry, refresher):
+    # Uploads receipts from the queue until it yields None; results go to the done queue
+    while (item := receipts.get()) is not None:
+        name, data = item
+        try:
+            prefix = stream_prefix(name, data, partition_by)
+        except Exception as e:
+            print(f"  Warning: Could not partition {name}, uploading it to the stage root: {e}")
+            prefix = ''
+        attempts = 0
+        first = time.perf_counter()
+        while True:
+            attempts += 1
+            started = time.perf_counter()
+            status, message = upload_stream(conn, name, data, stage_name, prefix)
+            telemetry.record_batch([PurePath(name)], {name: (status, message)}, started, time.perf_counter(),
+                                   sizes={name: len(data)})
+            if status != 'FAILED' or not should_retry(message, attempts, max_attempts):
+                break
+            delay = backoff_delay(attempts)
+            telemetry.record_retry(1, delay)
+            time.sleep(delay)
+        if status == 'FAILED':
+            message = final_message(message, attempts)
+        elif status == 'UPLOADED' and refresher:
+            refresher.add([prefix])
+        done.put((name, data, prefix, status, message, time.perf_counter() - first))
+
+
+def _record_done(ledger, done, stage_name, spill_dir, counts, total):
+    # Records the finished uploads in the ledger and spills failed receipts to disk
+    entries = []
+    while True:
+        try:
+            name, data, prefix, status, message, _ = done.get_nowait()
+        except queue.Empty:
+            break
+        counts[status] += 1
+        if status == 'FAILED':
+            spill_dir.mkdir(parents=True, exist_ok=True)
+            (spill_dir / name).write_bytes(data)
+            print(f"  ✗ FAILED {name}: {message} (written to {spill_dir})")
+            continue
+        path = f"{prefix}/{name}" if prefix else name
+        md5 = hashlib.md5(data).hexdigest() if status == 'UPLOADED' else None
+        entries.append((name, len(data) if md5 else None, md5, status, f"@{stage_name}/{path}"))
+        print(f"{'✓' if status == 'UPLOADED' else '⊘'} {status.capitalize()} "
+              f"({sum(counts.values())}/{total}): {path}")
+    ledger.record(stage_name, entries)
+
+
+def generate_and_upload(config, count, stage_name='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS', vendor_index=None,
+                        concurrency=DEFAULT_STREAM_CONCURRENCY, queue_size=DEFAULT_QUEUE_SIZE,
+                        max_attempts=DEFAULT_MAX_ATTEMPTS, partition_by='none', spill_dir=DEFAULT_SPILL_DIR,
+                        ledger_path=LEDGER_PATH, report_path=None, prometheus_path=None, record_run=False,
+                        refresh=True):
+    """
+    Render receipts and upload them from memory as they are rendered.
+
+    Args:
+        config: Connection configuration (config.json)
+        count: Number of receipts to generate
+        stage_name: Target stage
+        vendor_index: Vendor template of every receipt, or None for random vendors
+        concurrency: Upload threads (connections)
+        queue_size: Rendered receipts held in memory before the generator waits
+        max_attempts: Attempts per receipt for transient errors
+        partition_by: Stage prefix scheme ('none', 'date' or 'family')
+        spill_dir: Directory receipts that could not be uploaded are written to
+        ledger_path: SQLite upload ledger
+        report_path: JSON run report file, or None
+        prometheus_path: Prometheus textfile, or None
+        record_run: Insert a summary row into UPLOAD_RUNS
+        refresh: Refresh the stage directory of the prefixes written as receipts are uploaded
+
+    Returns:
+        Dictionary of receipt counts per final status
+    """
+    sys.path.append(str(SYNTHESIS_DIR))
+    from receipt_generator import ReceiptGenerator
+
+    print("=" * 70)
+    print("Receipt Generator and Uploader - Snowflake Stage (in memory)")
+    print("=" * 70)
+
+    telemetry = UploadTelemetry(stage_name, 'stream')
+
+    def connect():
+        start = time.perf_counter()
+        conn = connect_to_snowflake(config)
+        telemetry.record_connect(time.perf_counter() - start)
+        return conn
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        connections = list(executor.map(lambda _: connect(), range(concurrency)))
+    ledger = UploadLedger(ledger_path)
+    refresher = StageRefresher(connections[0], stage_name, telemetry) if refresh else None
+    generator = ReceiptGenerator(output_dir=str(spill_dir))
+    receipts = queue.Queue(queue_size)
+    done = queue.Queue()
+    counts = {'UPLOADED': 0, 'SKIPPED': 0, 'FAILED': 0}
+    workers = [
+        threading.Thread(target=_upload_worker,
+                         args=(conn, receipts, done, stage_name, partition_by, max_attempts, telemetry, refresher))
+        for conn in connections
+    ]
+    print(f"\nGenerating {count} receipt(s) and uploading them from memory "
+          f"({concurrency} upload threads, queue of {queue_size})...\n")
+    start = time.perf_counter()
+    render_seconds = wait_seconds = 0.0
+    try:
+        for worker in workers:
+            worker.start()
+        for _ in range(count):
+            render_start = time.perf_counter()
+            item = generator.render_single_receipt(vendor_index=vendor_index)
+            render_seconds += time.perf_counter() - render_start
+
+            # Blocks while the queue is full, i.e. while uploads are behind
+            wait_start = time.perf_counter()
+            receipts.put(item)
+            wait_seconds += time.perf_counter() - wait_start
+            _record_done(ledger, done, stage_name, Path(spill_dir), counts, count)
+    finally:
+        for _ in workers:
+            receipts.put(None)
+        for worker in workers:
+            worker.join()
+        _record_done(ledger, done, stage_name, Path(spill_dir), counts, count)
+        if refresher:
+            refresher.close()
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        for conn in connections:
+            conn.close()
+    telemetry.finish()
+
+    upload_seconds = telemetry.put_seconds.total / concurrency
+    print(f"\n{'=' * 70}")
+    print("Generate-and-Upload Summary:")
+    print(f"  Generated: {count} (rendering took {render_seconds:.1f}s)")
+    print(f"  Uploaded:  {counts['UPLOADED']}")
+    print(f"  Skipped:   {counts['SKIPPED']}")
+    print(f"  Failed:    {counts['FAILED']}"
+          + (f" (written to {spill_dir} for the next upload_receipts.py run)" if counts['FAILED'] else ''))
+    print(f"  Cycle:     {elapsed:.1f}s (render {render_seconds:.1f}s, upload {upload_seconds:.1f}s per thread, "
+          f"generator waited {wait_seconds:.1f}s for uploads)")
+    if refresher:
+        print(f"  Refreshed: {refresher.refreshes} directory refresh(es), {refresher.failures} failed")
+    print(f"  Rate:      {counts['UPLOADED'] / elapsed:.1f} receipts/sec")
+    telemetry.print_summary()
+    print(f"{'=' * 70}")
+
+    # The upload connections are closed by now; UPLOAD_RUNS is written over a new one
+    if record_run:
+        conn = connect_to_snowflake(config)
+        try:
+            write_telemetry(telemetry, conn, stage_name, report_path, prometheus_path, record_run)
+        finally:
+            conn.close()
+    else:
+        write_telemetry(telemetry, None, stage_name, report_path, prometheus_path)
+    ledger.close()
+    return counts
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate receipts and upload them to a Snowflake stage from memory, overlapping both"
+    )
+    parser.add_argument('-n', '--count', type=int, default=10,
+                        help='Number of receipts to generate (default: 10)')
+    parser.add_argument('-v', '--vendor', type=int,
+                        help='Specific vendor index to use. If not specified, random vendors are used.')
+    parser.add_argument('-s', '--stage', type=str, default='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS',
+                        help='Snowflake stage name (default: RECEIPTS_PROCESSING_DB.RAW.RECEIPTS)')
+    parser.add_argument('--config', type=str, default=str(CONFIG_PATH),
+                        help='Connection configuration (default: config.json next to this script)')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_STREAM_CONCURRENCY,
+                        help=f'Upload threads, each with its own connection (default: {DEFAULT_STREAM_CONCURRENCY})')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f'Rendered receipts held in memory before rendering waits (default: {DEFAULT_QUEUE_SIZE})')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Attempts per receipt for transient errors (default: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--partition-by', choices=PARTITION_SCHEMES, default='none',
+                        help='Upload to stage prefixes: date (yyyy/mm/dd/, today in UTC), family (v1/, v2/, '
+                             'unknown/; requires pymupdf) or none (stage root, default)')
+    parser.add_argument('--spill-dir', type=str, default=str(DEFAULT_SPILL_DIR),
+                        help='Directory receipts that could not be uploaded are written to (default: ../receipts)')
+    parser.add_argument('--ledger', type=str, default=str(LEDGER_PATH),
+                        help='SQLite upload ledger (default: upload_ledger.db next to this script)')
+    parser.add_argument('--no-refresh', action='store_true',
+                        help='Do not refresh the stage directory after uploading')
+    parser.add_argument('--report', type=str, help='Write a JSON run report to this file')
+    parser.add_argument('--prometheus', type=str, help='Write the run metrics to this Prometheus textfile')
+    parser.add_argument('--record-run', action='store_true',
+                        help='Insert a summary row of the run into UPLOAD_RUNS for the cost dashboard')
+
+    args = parser.parse_args()
+
+    print(f"Loading configuration from {Path(args.config).name}...")
+    config = load_config(args.config)
+    print("✓ Configuration loaded successfully\n")
+
+    counts = generate_and_upload(config, args.count, args.stage, args.vendor, args.concurrency, args.queue_size,
+                                 args.max_attempts, args.partition_by, Path(args.spill_dir), args.ledger,
+                                 args.report, args.prometheus, args.record_run, not args.no_refresh)
+    sys.exit(1 if counts['FAILED'] and not counts['UPLOADED'] else 0)
+
+
+if __name__ == "__main__":
+    main()
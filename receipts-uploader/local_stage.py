@@ -0,0 +1,331 @@
+"""
+Offline stand-in for the Snowflake connector, backed by a local directory.
+
+Implements the subset of the connector the uploader uses, so upload changes
+can be tested and benchmarked without an account:
+
+- connect() returns a connection with cursor() and close()
+- PUT 'file://<glob>' @<stage>[/<prefix>/] [OVERWRITE=TRUE|FALSE] [PARALLEL=n] copies the
+  files into <root>/<stage>/<prefix>/ and returns Snowflake's result rows
+  (source, target, source_size, target_size, source_compression,
+  target_compression, status, message); AUTO_COMPRESS is ignored. With
+  execute(..., file_stream=<file object>) the stream is uploaded under the
+  file name of the PUT, as the connector does
+- LIST @<stage>[/<prefix>/] [PATTERN='<regex>'] returns (name, size, md5, last_modified) rows,
+  names starting with the lower-case stage name as in Snowflake
+- REMOVE @<stage>[/<prefix>] [PATTERN='<regex>'] deletes files and returns (name, result) rows
+
+Other statements (CREATE TABLE, INSERT, ALTER STAGE ... REFRESH, ...) are
+accepted and ignored. Sizes and MD5s are kept in an SQLite index next to the
+files, so LIST does not read them.
+
+Latency and failures can be injected: a round trip per statement, a
+bandwidth per PUT thread, an uplink shared by all PUTs (which queue on it
+once it is saturated), throttling of PUTs beyond a number in flight,
+statements that raise a transient OperationalError and files that are
+rejected with an ERROR row. The uploader uses this module
+when config.json has a "local_stage" section (see config.local.template.json).
+"""
+import os
+import re
+import time
+import glob
+import random
+import hashlib
+import shutil
+import sqlite3
+import threading
+from email.utils import formatdate
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from snowflake.connector.errors import OperationalError
+
+from file_hashes import md5_file
+
+
+# SQLite index of the staged files, in the root directory
+INDEX_NAME = '.local_stage.db'
+
+# Message of files rejected by file_error_rate (a permanent failure for upload_retry)
+FILE_ERROR_MESSAGE = 'File is corrupt'
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    stage TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    md5 TEXT NOT NULL,
+    last_modified REAL NOT NULL,
+    PRIMARY KEY (stage, path)
+);
+"""
+
+PUT_RE = re.compile(r"^PUT\s+'?file://(.+?)'?\s+@(\S+)(.*)$", re.IGNORECASE | re.DOTALL)
+LIST_RE = re.compile(r"^(?:LIST|LS)\s+@(\S+)(?:\s+PATTERN\s*=\s*'(.*)')?\s*;?$", re.IGNORECASE | re.DOTALL)
+REMOVE_RE = re.compile(r"^(?:REMOVE|RM)\s+@(\S+)(?:\s+PATTERN\s*=\s*'(.*)')?\s*;?$", re.IGNORECASE | re.DOTALL)
+OPTION_RE = re.compile(r"(\w+)\s*=\s*'?(\w+)'?")
+
+
+def connect(root, latency=0.0, connect_latency=0.0, bandwidth_mbps=None, failure_rate=0.0,
+            file_error_rate=0.0, seed=None, uplink_mbps=None, max_concurrent_puts=None, **_):
+    """
+    Open a connection to a local stage directory.
+
+    Args:
+        root: Directory the stages are kept in (created if missing)
+        latency: Seconds added to every statement (network round trip)
+        connect_latency: Seconds a connection takes to open (login)
+        bandwidth_mbps: MB/s per PUT thread (PARALLEL), or None for no limit
+        failure_rate: Share of PUT/LIST statements that raise a transient OperationalError
+        file_error_rate: Share of files a PUT rejects with an ERROR row (permanent failure)
+        seed: Random seed of the failure injection
+        uplink_mbps: MB/s shared by all PUTs of the root (a saturated uplink), or None for no limit
+        max_concurrent_puts: PUTs in flight above which a PUT is throttled (transient error), or None
+
+    Other keyword arguments (account, user, ...) are ignored, so a config.json
+    section can be passed as is.
+
+    Returns:
+        LocalConnection
+    """
+    time.sleep(connect_latency)
+    return LocalConnection(root, latency, bandwidth_mbps, failure_rate, file_error_rate, seed, uplink_mbps,
+                           max_concurrent_puts)
+
+
+class _Uplink:
+    """PUTs in flight and uplink queue shared by the connections to one root (like one network link)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.free_at = time.monotonic()
+
+
+_uplinks = {}
+_uplinks_lock = threading.Lock()
+
+
+def _split_location(location):
+    """Stage name and path prefix of "<stage>[/<prefix>/]"."""
+    stage, _, prefix = location.rstrip(';').partition('/')
+    return stage, prefix.strip('/')
+
+
+class LocalConnection:
+    """Connection to a local stage directory; cursors may be used from several threads."""
+
+    def __init__(self, root, latency=0.0, bandwidth_mbps=None, failure_rate=0.0, file_error_rate=0.0, seed=None,
+                 uplink_mbps=None, max_concurrent_puts=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.latency = latency
+        self.bandwidth_mbps = bandwidth_mbps
+        self.failure_rate = failure_rate
+        self.file_error_rate = file_error_rate
+        self.random = random.Random(seed)
+        self.uplink_mbps = uplink_mbps
+        self.max_concurrent_puts = max_concurrent_puts
+        self.index = sqlite3.connect(str(self.root / INDEX_NAME), timeout=60, check_same_thread=False)
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.executescript(INDEX_SCHEMA)
+        self._lock = threading.Lock()
+        with _uplinks_lock:
+            self._uplink = _uplinks.setdefault(str(self.root.resolve()), _Uplink())
+
+    def cursor(self):
+        return LocalCursor(self)
+
+    def close(self):
+        self.index.close()
+
+    def stage_dir(self, stage):
+        return self.root / stage
+
+    def inject_failure(self, statement):
+        """Raise a transient OperationalError for a share failure_rate of the statements."""
+        with self._lock:
+            failed = self.random.random() < self.failure_rate
+        if failed:
+            raise OperationalError(f"Connection reset by peer (injected by local_stage during {statement})")
+
+    def begin_put(self):
+        """Count a PUT in flight; raise a transient throttling error beyond max_concurrent_puts."""
+        with self._uplink.lock:
+            if self.max_concurrent_puts and self._uplink.puts >= self.max_concurrent_puts:
+                raise OperationalError(f"429 Too Many Requests: throttled above {self.max_concurrent_puts} "
+                                       f"concurrent PUTs (injected by local_stage)")
+            self._uplink.puts += 1
+
+    def end_put(self):
+        with self._uplink.lock:
+            self._uplink.puts -= 1
+
+    def transmit(self, nbytes):
+        """Wait for nbytes to pass the shared uplink; transfers queue behind each other (first come, first served)."""
+        if not self.uplink_mbps or not nbytes:
+            return
+        with self._uplink.lock:
+            now = time.monotonic()
+            self._uplink.free_at = max(now, self._uplink.free_at) + nbytes / (self.uplink_mbps * 1024 * 1024)
+            done = self._uplink.free_at
+        time.sleep(done - now)
+
+    def reject_file(self):
+        with self._lock:
+            return self.random.random() < self.file_error_rate
+
+    def put(self, pattern, location, options, stream=None):
+        """
+        Copy local files matching a glob pattern (or one stream) to a stage location.
+
+        Args:
+            pattern: file:// path of the PUT, a glob pattern
+            location: Stage location "<stage>[/<prefix>/]"
+            options: Dictionary of PUT options (OVERWRITE, PARALLEL, ...)
+            stream: File object to upload as the file named by pattern, or None
+
+        Returns:
+            PUT result rows
+        """
+        stage, prefix = _split_location(location)
+        overwrite = options.get('OVERWRITE', 'FALSE').upper() == 'TRUE'
+        parallel = max(1, min(99, int(options.get('PARALLEL', 4))))
+        target_dir = self.stage_dir(stage) / prefix
+        target_dir.mkdir(parents=True, exist_ok=True)
+        if stream is not None:
+            sources = [pattern]
+            content = stream.read()
+        else:
+            sources = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+        paths = [f"{prefix}/{os.path.basename(source)}" if prefix else os.path.basename(source) for source in sources]
+        staged = set()
+        with self._lock:
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                staged.update(path for (path,) in self.index.execute(
+                    f"SELECT path FROM files WHERE stage = ? AND path IN ({','.join('?' * len(chunk))})",
+                    (stage, *chunk)
+                ))
+
+        def copy(source):
+            name = os.path.basename(source)
+            path = f"{prefix}/{name}" if prefix else name
+            size = len(content) if stream is not None else os.path.getsize(source)
+            row = [name, name, size, size, 'NONE', 'NONE']
+            if path in staged and not overwrite:
+                return row + ['SKIPPED', ''], None
+            if self.reject_file():
+                return row + ['ERROR', FILE_ERROR_MESSAGE], None
+            tmp = target_dir / f".{name}.{threading.get_ident()}.tmp"
+            if stream is not None:
+                tmp.write_bytes(content)
+                md5 = hashlib.md5(content).hexdigest()
+            else:
+                shutil.copyfile(source, tmp)
+                md5 = md5_file(source)
+            os.replace(tmp, target_dir / name)
+            return row + ['UPLOADED', ''], (stage, path, size, md5, time.time())
+
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            copied = list(executor.map(copy, sources))
+        with self._lock, self.index:
+            self.index.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                                   [entry for _, entry in copied if entry])
+
+        uploaded = sum(row[2] for row, entry in copied if entry)
+        if self.bandwidth_mbps:
+            time.sleep(uploaded / (self.bandwidth_mbps * 1024 * 1024) / min(parallel, max(1, len(sources))))
+        self.transmit(uploaded)
+        return [row for row, _ in copied]
+
+    def list(self, location, pattern=None):
+        """LIST rows of a stage location."""
+        stage, prefix = _split_location(location)
+        with self._lock:
+            rows = self.index.execute(
+                "SELECT path, size, md5, last_modified FROM files WHERE stage = ? AND path LIKE ? ORDER BY path",
+                (stage, f"{prefix}/%" if prefix else '%')
+            ).fetchall()
+        name = stage.rsplit('.', 1)[-1].lower()
+        matcher = re.compile(pattern) if pattern else None
+        return [
+            (f"{name}/{path}", size, md5, formatdate(modified, usegmt=True))
+            for path, size, md5, modified in rows
+            if matcher is None or matcher.fullmatch(f"{name}/{path}")
+        ]
+
+    def remove(self, location, pattern=None):
+        """Delete the files of a stage location; returns REMOVE rows."""
+        stage, _ = _split_location(location)
+        removed = []
+        for name, *_ in self.list(location, pattern):
+            path = name.split('/', 1)[1]
+            try:
+                os.remove(self.stage_dir(stage) / path)
+            except FileNotFoundError:
+                pass
+            removed.append((name, 'removed'))
+        with self._lock, self.index:
+            self.index.executemany("DELETE FROM files WHERE stage = ? AND path = ?",
+                                   [(stage, name.split('/', 1)[1]) for name, _ in removed])
+        return removed
+
+
+class LocalCursor:
+    """Cursor of a LocalConnection: execute() then fetchall/fetchmany/fetchone."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+        self._position = 0
+        self.rowcount = 0
+
+    def execute(self, sql, params=None, file_stream=None):
+        statement = ' '.join(sql.split())
+        time.sleep(self.conn.latency)
+        if match := PUT_RE.match(statement):
+            self.conn.inject_failure('PUT')
+            options = {key.upper(): value for key, value in OPTION_RE.findall(match.group(3))}
+            self.conn.begin_put()
+            try:
+                rows = self.conn.put(match.group(1), match.group(2), options, file_stream)
+            finally:
+                self.conn.end_put()
+        elif match := LIST_RE.match(statement):
+            self.conn.inject_failure('LIST')
+            rows = self.conn.list(match.group(1), match.group(2))
+        elif match := REMOVE_RE.match(statement):
+            rows = self.conn.remove(match.group(1), match.group(2))
+        else:
+            rows = [('Statement executed successfully.',)]
+        self._rows = rows
+        self._position = 0
+        self.rowcount = len(rows)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        time.sleep(self.conn.latency)
+        self._rows = []
+        self._position = 0
+        self.rowcount = len(list(seq_of_params))
+        return self
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        self._rows = []
@@ -0,0 +1,310 @@
+"""
+Retention of the local receipts directory, driven by the upload ledger.
+
+Receipts stay in ../receipts after their upload, so the directory (and every
+scan of it) grows forever. This script, run after the uploads (for example
+from the hourly automation script):
+
+- archives receipts uploaded more than --archive-after-hours ago: files the
+  upload ledger records as on the stage whose local content still matches
+  the ledger MD5 are compressed into a dated zip archive
+  (<archive dir>/yyyy/mm/receipts_yyyy-mm-dd.zip, by upload date), indexed in
+  the ledger and removed from the receipts directory, --batch-size files at
+  a time, so the directory only holds receipts not yet uploaded
+- deletes archives older than --delete-after-days; their index entries are
+  kept, marked as deleted
+- restores archived receipts into the receipts directory (--restore,
+  --restore-date); restored files match the ledger, so they are not uploaded
+  again
+
+Every batch is written and synced to its archive and recorded in the index
+before its files are removed, so an interrupted run loses nothing: files
+already in the archive with the same content are not written twice.
+"""
+import os
+import sys
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from file_hashes import DEFAULT_HASH_WORKERS, hash_files, md5_file
+from upload_ledger import UploadLedger
+
+
+# Local SQLite ledger of uploaded files and archive index (same as upload_receipts.py)
+LEDGER_PATH = Path(__file__).parent / 'upload_ledger.db'
+
+# Directory the dated archives are written to (relative to this script)
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent.parent / 'receipts_archive'
+
+# Receipts are archived once they were uploaded this many hours ago
+DEFAULT_ARCHIVE_AFTER_HOURS = 24
+
+# Archives are deleted once they are this many days old (by the upload date they are named after)
+DEFAULT_DELETE_AFTER_DAYS = 90
+
+# Receipts archived (and removed) per batch
+DEFAULT_ARCHIVE_BATCH_SIZE = 500
+
+
+def archive_path(uploaded_at):
+    """Archive of the receipts uploaded on a date, relative to the archive directory."""
+    day = uploaded_at.astimezone(timezone.utc)
+    return f"{day:%Y/%m}/receipts_{day:%Y-%m-%d}.zip"
+
+
+def archive_date(archive):
+    """Upload date an archive is named after (receipts_yyyy-mm-dd.zip), or None for other names."""
+    try:
+        return datetime.strptime(Path(archive).stem, 'receipts_%Y-%m-%d').replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def find_archivable(ledger, receipts_dir, stage_name, archive_after_hours, hash_workers=DEFAULT_HASH_WORKERS):
+    """
+    Local receipts that can be archived: on the stage according to the ledger, uploaded long enough ago and unchanged.
+
+    Args:
+        ledger: UploadLedger
+        receipts_dir: Local receipts directory
+        stage_name: Stage the receipts were uploaded to
+        archive_after_hours: Minimum age of the upload
+        hash_workers: Threads hashing local files
+
+    Returns:
+        Tuple (list of (path, size, md5, uploaded_at), number of files skipped because they changed since their upload)
+    """
+    with os.scandir(receipts_dir) as entries:
+        local = [Path(entry.path) for entry in entries if entry.name.endswith('.pdf') and entry.is_file()]
+    uploaded = ledger.archivable_files(stage_name)
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=archive_after_hours)
+    candidates = [path for path in local
+                  if path.name in uploaded and uploaded[path.name][0]
+                  and uploaded[path.name][1] is not None and uploaded[path.name][1] <= cutoff]
+
+    cache = ledger.load_hash_cache()
+    hashes, _ = hash_files(candidates, cache, hash_workers)
+    ledger.save_hash_cache(cache, candidates)
+    archivable = [(path, *hashes[str(path)], uploaded[path.name][1]) for path in candidates
+                  if hashes[str(path)][1] == uploaded[path.name][0]]
+    return sorted(archivable, key=lambda entry: (entry[3], entry[0].name)), len(candidates) - len(archivable)
+
+
+def archive_batch(ledger, batch, archive_dir, archive):
+    """
+    Write a batch of receipts to one archive, index them and remove them from the receipts directory.
+
+    Args:
+        ledger: UploadLedger
+        batch: List of (path, size, md5, uploaded_at)
+        archive_dir: Archive directory
+        archive: Archive path relative to archive_dir
+
+    Returns:
+        Number of bytes the archive grew by
+    """
+    target = Path(archive_dir) / archive
+    target.parent.mkdir(parents=True, exist_ok=True)
+    before = target.stat().st_size if target.exists() else 0
+    entries = []
+    with zipfile.ZipFile(target, 'a', compression=zipfile.ZIP_DEFLATED) as zf:
+        members = {info.filename: info for info in zf.infolist()}
+        for path, size, md5, _ in batch:
+            member = path.name
+            existing = members.get(member)
+            if existing is not None and (existing.file_size != size or zf.read(member) != path.read_bytes()):
+                # An older version of this receipt is already archived here
+                member = f"{path.stem}.{md5[:8]}{path.suffix}"
+            if member not in members:
+                zf.write(path, member)
+            entries.append((path.name, archive, member, size, md5))
+    with open(target, 'rb') as f:
+        os.fsync(f.fileno())
+
+    ledger.record_archived(entries)
+    ledger.forget_hash_cache([path for path, *_ in batch])
+    for path, *_ in batch:
+        path.unlink(missing_ok=True)
+    return target.stat().st_size - before
+
+
+def archive_receipts(ledger, receipts_dir, archive_dir, stage_name, archive_after_hours=DEFAULT_ARCHIVE_AFTER_HOURS,
+                     batch_size=DEFAULT_ARCHIVE_BATCH_SIZE, hash_workers=DEFAULT_HASH_WORKERS, dry_run=False):
+    """
+    Archive the uploaded receipts of the receipts directory, batch by batch.
+
+    Returns:
+        Number of receipts archived (or that would be, with dry_run)
+    """
+    archivable, changed = find_archivable(ledger, receipts_dir, stage_name, archive_after_hours, hash_workers)
+    print(f"\n✓ {len(archivable)} receipt(s) uploaded more than {archive_after_hours:g}h ago can be archived")
+    if changed:
+        print(f"  {changed} uploaded receipt(s) changed locally since their upload and are kept")
+    if dry_run or not archivable:
+        return len(archivable)
+
+    by_archive = {}
+    for entry in archivable:
+        by_archive.setdefault(archive_path(entry[3]), []).append(entry)
+    archived = 0
+    for archive, entries in sorted(by_archive.items()):
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            size = sum(entry[1] for entry in batch)
+            try:
+                grown = archive_batch(ledger, batch, archive_dir, archive)
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"✗ Could not archive {len(batch)} receipt(s) to {archive}: {e}")
+                continue
+            archived += len(batch)
+            print(f"  ✓ {len(batch)} receipt(s) ({size / 1024 / 1024:.1f} MB) -> {archive} "
+                  f"(+{grown / 1024 / 1024:.1f} MB)")
+    print(f"✓ Archived {archived} of {len(archivable)} receipt(s)")
+    return archived
+
+
+def delete_old_archives(ledger, archive_dir, delete_after_days=DEFAULT_DELETE_AFTER_DAYS, dry_run=False):
+    """
+    Delete the archives older than delete_after_days and mark their receipts as deleted in the index.
+
+    Returns:
+        Number of archives deleted (or that would be, with dry_run)
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=delete_after_days)
+    expired = [(archive, receipts) for archive, receipts in sorted(ledger.live_archives().items())
+               if archive_date(archive) is not None and archive_date(archive) < cutoff]
+    for archive, receipts in expired:
+        print(f"  {'Would delete' if dry_run else 'Deleting'} {archive} ({receipts} receipt(s))")
+        if not dry_run:
+            (Path(archive_dir) / archive).unlink(missing_ok=True)
+            ledger.expire_archive(archive)
+    if expired:
+        print(f"✓ {len(expired)} archive(s) older than {delete_after_days} days "
+              f"{'to delete' if dry_run else 'deleted'}")
+    return len(expired)
+
+
+def restore_receipts(ledger, archive_dir, receipts_dir, names=None, archive=None):
+    """
+    Extract archived receipts back into the receipts directory.
+
+    Args:
+        ledger: UploadLedger
+        archive_dir: Archive directory
+        receipts_dir: Directory the receipts are restored to
+        names: File names to restore, or None
+        archive: Restore every receipt of this archive (relative path), or None
+
+    Returns:
+        Number of receipts restored
+    """
+    index = ledger.archived_files(names=names, archive=archive)
+    for name in sorted(set(names or ()) - set(index)):
+        print(f"✗ {name}: not in the archive index")
+    restored = 0
+    receipts_dir = Path(receipts_dir)
+    receipts_dir.mkdir(parents=True, exist_ok=True)
+    by_archive = {}
+    for name, (archive_name, member, size, md5, deleted_at) in sorted(index.items()):
+        if deleted_at:
+            print(f"✗ {name}: its archive {archive_name} was deleted on {deleted_at}")
+        elif (receipts_dir / name).exists():
+            print(f"  {name} is already in {receipts_dir}")
+        else:
+            by_archive.setdefault(archive_name, []).append((name, member, md5))
+
+    for archive_name, entries in by_archive.items():
+        try:
+            with zipfile.ZipFile(Path(archive_dir) / archive_name) as zf:
+                for name, member, md5 in entries:
+                    target = receipts_dir / name
+                    partial = target.with_suffix('.restoring')
+                    partial.write_bytes(zf.read(member))
+                    if md5_file(partial) != md5:
+                        partial.unlink()
+                        print(f"✗ {name}: content in {archive_name} does not match its MD5")
+                        continue
+                    partial.replace(target)
+                    restored += 1
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            print(f"✗ Could not restore from {archive_name}: {e}")
+    print(f"✓ Restored {restored} receipt(s) to {receipts_dir}")
+    return restored
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Archive uploaded receipts, delete old archives and restore archived receipts',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Archive receipts uploaded more than 24 hours ago and delete archives older than 90 days
+  python receipt_retention.py
+
+  # Show what would be archived and deleted
+  python receipt_retention.py --dry-run
+
+  # Archive after 6 hours, keep archives for 30 days
+  python receipt_retention.py --archive-after-hours 6 --delete-after-days 30
+
+  # Restore receipts by name, or every receipt uploaded on a date
+  python receipt_retention.py --restore receipt_abc.pdf receipt_def.pdf
+  python receipt_retention.py --restore-date 2026-10-19
+        """
+    )
+    parser.add_argument('-d', '--receipts-dir', type=str, default='../receipts',
+                        help='Local receipts directory (default: ../receipts)')
+    parser.add_argument('--archive-dir', type=str, default=str(DEFAULT_ARCHIVE_DIR),
+                        help='Directory of the dated archives (default: ../receipts_archive)')
+    parser.add_argument('-s', '--stage', type=str, default='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS',
+                        help='Stage the receipts were uploaded to (default: RECEIPTS_PROCESSING_DB.RAW.RECEIPTS)')
+    parser.add_argument('--ledger', type=str, default=str(LEDGER_PATH),
+                        help='Upload ledger and archive index (default: upload_ledger.db next to this script)')
+    parser.add_argument('--archive-after-hours', type=float, default=DEFAULT_ARCHIVE_AFTER_HOURS,
+                        help=f'Archive receipts uploaded more than this many hours ago '
+                             f'(default: {DEFAULT_ARCHIVE_AFTER_HOURS})')
+    parser.add_argument('--delete-after-days', type=int, default=DEFAULT_DELETE_AFTER_DAYS,
+                        help=f'Delete archives older than this many days (default: {DEFAULT_DELETE_AFTER_DAYS})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_ARCHIVE_BATCH_SIZE,
+                        help=f'Receipts archived and removed per batch (default: {DEFAULT_ARCHIVE_BATCH_SIZE})')
+    parser.add_argument('--hash-workers', type=int, default=DEFAULT_HASH_WORKERS,
+                        help=f'Threads hashing local files (default: {DEFAULT_HASH_WORKERS})')
+    parser.add_argument('--dry-run', action='store_true', help='Print what would be archived and deleted')
+    restore = parser.add_mutually_exclusive_group()
+    restore.add_argument('--restore', type=str, nargs='+', metavar='NAME',
+                         help='Restore archived receipts by file name into the receipts directory')
+    restore.add_argument('--restore-date', type=str, metavar='YYYY-MM-DD',
+                         help='Restore every receipt of the archive of an upload date')
+
+    args = parser.parse_args()
+
+    if not Path(args.ledger).exists():
+        print(f"✗ Upload ledger not found: {args.ledger}")
+        sys.exit(1)
+
+    with UploadLedger(args.ledger) as ledger:
+        if args.restore or args.restore_date:
+            archive = None
+            if args.restore_date:
+                try:
+                    day = datetime.strptime(args.restore_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                except ValueError:
+                    parser.error(f"--restore-date must be YYYY-MM-DD, not {args.restore_date}")
+                archive = archive_path(day)
+            restore_receipts(ledger, args.archive_dir, args.receipts_dir, names=args.restore, archive=archive)
+            return
+
+        if not Path(args.receipts_dir).is_dir():
+            print(f"✗ Receipts directory not found: {args.receipts_dir}")
+            sys.exit(1)
+        archive_receipts(ledger, args.receipts_dir, args.archive_dir, args.stage, args.archive_after_hours,
+                         args.batch_size, args.hash_workers, args.dry_run)
+        delete_old_archives(ledger, args.archive_dir, args.delete_after_days, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
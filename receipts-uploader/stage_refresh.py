@@ -0,0 +1,94 @@
+"""
+Directory table refresh of the stage prefixes an upload has just written to.
+
+The RECEIPTS stage has a directory table without auto-refresh, so
+RECEIPTS_STREAM (and the task consuming it) only sees new files after an
+ALTER STAGE ... REFRESH. Instead of waiting for the hourly
+REFRESH_RECEIPTS_STAGE task, the uploaders hand the prefixes of every
+finished PUT to a StageRefresher, which refreshes only those prefixes
+(REFRESH SUBPATH = '<prefix>/'; files at the stage root need a full REFRESH)
+in a background thread. Prefixes written while a refresh runs are coalesced
+into the next one, so at most one refresh is in flight however many PUTs
+finish, and new receipts reach the stream seconds after their PUT.
+"""
+import time
+import threading
+
+
+class StageRefresher:
+    """Refreshes the directory table of the prefixes uploads wrote to, one coalesced refresh at a time."""
+
+    def __init__(self, conn, stage_name, telemetry=None):
+        """
+        Args:
+            conn: Snowflake connection (may be shared; refreshes use their own cursor)
+            stage_name: Stage whose directory table is refreshed
+            telemetry: UploadTelemetry the refresh times and file visibility latencies are recorded in, or None
+        """
+        self.conn = conn
+        self.stage_name = stage_name
+        self.telemetry = telemetry
+        self.refreshes = 0
+        self.failures = 0
+        self._pending = {}  # prefix -> PUT end times (perf_counter) of the files uploaded to it
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add(self, prefixes, finished=None):
+        """
+        Queue a refresh of the prefixes files were uploaded to; returns immediately.
+
+        Args:
+            prefixes: Stage prefix of each uploaded file ('' for the stage root)
+            finished: time.perf_counter() at the end of the PUT (default: now)
+        """
+        finished = finished or time.perf_counter()
+        with self._lock:
+            for prefix in prefixes:
+                self._pending.setdefault(prefix.strip('/'), []).append(finished)
+            if self._pending and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stage-refresh', daemon=True)
+                self._thread.start()
+
+    def close(self):
+        """Wait until the queued refreshes are done."""
+        while True:
+            with self._lock:
+                thread = self._thread
+            if thread is None:
+                return
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if not pending:
+                    self._thread = None
+                    return
+            self._refresh(pending)
+
+    def _refresh(self, pending):
+        # Files at the stage root are only picked up by a full refresh, which covers every prefix too
+        if '' in pending:
+            statements = [(f"ALTER STAGE {self.stage_name} REFRESH", list(pending))]
+        else:
+            statements = [(f"ALTER STAGE {self.stage_name} REFRESH SUBPATH = '{prefix}/'", [prefix])
+                          for prefix in sorted(pending)]
+        for statement, prefixes in statements:
+            started = time.perf_counter()
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(statement)
+            except Exception as e:
+                self.failures += 1
+                print(f"  Warning: Could not refresh the directory of {self.stage_name} "
+                      f"({', '.join(prefix + '/' for prefix in prefixes if prefix) or 'stage root'}): {e}")
+                continue
+            finally:
+                cursor.close()
+            finished = time.perf_counter()
+            self.refreshes += 1
+            if self.telemetry:
+                self.telemetry.record_refresh(finished - started,
+                                              [finished - put for prefix in prefixes for put in pending[prefix]])
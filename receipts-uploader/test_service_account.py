@@ -5,10 +5,26 @@ This script verifies:
 1. RSA key authentication works
 2. Service account can create tables
 3. Service account can insert and query data
+
+With --benchmark it measures the connection instead: connect and
+authentication time, single-query round-trip latency, small-query
+throughput across thread counts and PUT throughput across a matrix of file
+sizes and PARALLEL levels. The results are written as a JSON report
+(--report) that can be compared with an earlier one (--compare), e.g. from
+another network location or connector version. A config with a
+"local_stage" section benchmarks the offline stand-in (local_stage.py).
 """
 
+import os
 import sys
 import json
+import time
+import socket
+import platform
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
@@ -21,6 +37,28 @@ CONFIG_PATH = Path(__file__).parent / 'config.json'
 # Path to the private key file (relative to this script)
 PRIVATE_KEY_PATH = Path(__file__).parent.parent / 'rsa_key.p8'
 
+# Defaults of the --benchmark measurements
+DEFAULT_CONNECTS = 3
+DEFAULT_QUERIES = 50
+DEFAULT_QUERY_THREADS = (1, 4, 8)
+DEFAULT_PUT_SIZES_KB = (4, 64, 1024)
+DEFAULT_PUT_PARALLEL = (1, 4, 8)
+DEFAULT_PUT_FILES = 16
+DEFAULT_PUT_REPEATS = 2
+
+# Stage the PUT benchmark writes to: the user stage, so no stream or task sees the files
+DEFAULT_BENCHMARK_STAGE = '~'
+
+# Prefix (in the benchmark stage) of the PUT benchmark files; removed after the run
+BENCHMARK_PREFIX = 'connection_benchmark'
+
+# Relative changes below this are treated as noise by --compare (not marked better or worse)
+COMPARE_NOISE = 0.05
+
+# Upper bounds (seconds) of the connect and round-trip histograms
+CONNECT_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30)
+ROUND_TRIP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
 
 def load_config(config_path):
     """
@@ -43,6 +81,10 @@ def load_config(config_path):
         with open(config_path, 'r') as f:
             config = json.load(f)
         
+        # The offline local stage needs no account fields
+        if config.get('local_stage'):
+            return config
+
         # Validate required fields
         required_fields = ['account', 'user', 'warehouse', 'database', 'schema', 'role']
         missing_fields = [field for field in required_fields if field not in config]
@@ -109,15 +151,7 @@ def test_connection(config):
     # Establish connection
     print("\n2. Connecting to Snowflake...")
     try:
-        conn = snowflake.connector.connect(
-            account=config['account'],
-            user=config['user'],
-            private_key=private_key_bytes,
-            warehouse=config['warehouse'],
-            database=config['database'],
-            schema=config['schema'],
-            role=config['role']
-        )
+        conn = open_connection(config, private_key_bytes)
         print("   ✓ Connected successfully!")
         print(f"   Account: {config['account']}")
         print(f"   User: {config['user']}")
@@ -215,26 +249,346 @@ def test_connection(config):
     return True
 
 
-if __name__ == '__main__':
-    # Load configuration from config.json
-    print("Loading configuration from config.json...")
-    config = load_config(CONFIG_PATH)
-    
-    # Check if private key file exists
-    if not PRIVATE_KEY_PATH.exists():
-        print(f"Error: Private key file not found at {PRIVATE_KEY_PATH}")
-        print("Please ensure rsa_key.p8 exists in the parent directory")
-        sys.exit(1)
-    
-    # Check if account is configured
-    if config['account'] == 'YOUR_ACCOUNT_IDENTIFIER':
-        print("Error: Please update the 'account' value in config.json")
-        print("Replace 'YOUR_ACCOUNT_IDENTIFIER' with your actual Snowflake account identifier")
+def open_connection(config, private_key=None):
+    """
+    Open a connection: to Snowflake with the private key, or to the offline local stage of a local_stage config.
+
+    Args:
+        config: Dictionary with Snowflake connection parameters (or a "local_stage" section)
+        private_key: Encoded private key bytes (not used for the local stage)
+
+    Returns:
+        Connection
+    """
+    if config.get('local_stage'):
+        from local_stage import connect
+
+        return connect(**config['local_stage'])
+    return snowflake.connector.connect(
+        account=config['account'],
+        user=config['user'],
+        private_key=private_key,
+        warehouse=config['warehouse'],
+        database=config['database'],
+        schema=config['schema'],
+        role=config['role']
+    )
+
+
+def run_query(conn, sql='SELECT 1'):
+    """Run a query on a new cursor and fetch its rows; returns the wall time in seconds."""
+    start = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql)
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    return time.perf_counter() - start
+
+
+def _summary(histogram):
+    """Histogram summary without its buckets (count, sum, min, p50, p95, p99, max)."""
+    return {key: value for key, value in histogram.summary().items() if key != 'buckets'}
+
+
+def benchmark_connect(config, count):
+    """
+    Time key loading and count connections (each one authenticates).
+
+    Returns:
+        Tuple (connect results dictionary, the last connection, left open)
+    """
+    from upload_telemetry import Histogram
+
+    private_key = None
+    key_seconds = None
+    if not config.get('local_stage'):
+        start = time.perf_counter()
+        private_key = load_private_key(PRIVATE_KEY_PATH)
+        key_seconds = time.perf_counter() - start
+
+    seconds = Histogram(CONNECT_BUCKETS)
+    conn = None
+    for attempt in range(count):
+        if conn is not None:
+            conn.close()
+        start = time.perf_counter()
+        conn = open_connection(config, private_key)
+        seconds.observe(time.perf_counter() - start)
+        print(f"   Connection {attempt + 1}: {seconds.values[-1]:.3f}s")
+    return {'key_load_seconds': key_seconds, 'seconds': _summary(seconds)}, conn
+
+
+def benchmark_round_trip(conn, count):
+    """Latency of count sequential SELECT 1 round trips (after one warm-up query)."""
+    from upload_telemetry import Histogram
+
+    run_query(conn)
+    seconds = Histogram(ROUND_TRIP_BUCKETS)
+    for _ in range(count):
+        seconds.observe(run_query(conn))
+    return _summary(seconds)
+
+
+def benchmark_query_throughput(conn, count, thread_counts):
+    """
+    Small-query throughput: count SELECT 1 queries spread over threads, each on its own cursor.
+
+    Returns:
+        List of {threads, queries, seconds, queries_per_sec}, one per thread count
+    """
+    results = []
+    for threads in thread_counts:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(lambda _: run_query(conn), range(count)))
+        seconds = time.perf_counter() - start
+        results.append({'threads': threads, 'queries': count, 'seconds': seconds, 'queries_per_sec': count / seconds})
+        print(f"   {threads} thread(s): {count / seconds:.1f} queries/sec")
+    return results
+
+
+def benchmark_puts(conn, stage, run_id, sizes_kb, parallels, files, repeats):
+    """
+    PUT throughput of a wildcard PUT of files files per (file size, PARALLEL) combination.
+
+    Every combination is repeated and the median time is reported; the files
+    are PUT under <stage>/<BENCHMARK_PREFIX>/<run id>/ and removed afterwards.
+
+    Returns:
+        List of {size_kb, parallel, files, seconds, mb_per_sec, files_per_sec, failed}
+    """
+    results = []
+    location = f"@{stage}/{BENCHMARK_PREFIX}/{run_id}"
+    try:
+        with tempfile.TemporaryDirectory(prefix='put_benchmark_') as work_dir:
+            for size_kb in sizes_kb:
+                source_dir = Path(work_dir) / f"{size_kb}kb"
+                source_dir.mkdir()
+                for number in range(files):
+                    (source_dir / f"benchmark_{number:04d}.bin").write_bytes(os.urandom(size_kb * 1024))
+                for parallel in parallels:
+                    times = []
+                    failed = 0
+                    for repeat in range(repeats):
+                        cursor = conn.cursor()
+                        start = time.perf_counter()
+                        try:
+                            cursor.execute(
+                                f"PUT 'file://{source_dir}/*' {location}/{size_kb}kb_p{parallel}_r{repeat}/ "
+                                f"PARALLEL={parallel} OVERWRITE=TRUE AUTO_COMPRESS=FALSE"
+                            )
+                            failed += sum(1 for row in cursor.fetchall() if row[6] != 'UPLOADED')
+                        finally:
+                            cursor.close()
+                        times.append(time.perf_counter() - start)
+                    seconds = statistics.median(times)
+                    mb = size_kb * files / 1024
+                    results.append({'size_kb': size_kb, 'parallel': parallel, 'files': files, 'seconds': seconds,
+                                    'mb_per_sec': mb / seconds, 'files_per_sec': files / seconds, 'failed': failed})
+                    print(f"   {files} x {size_kb} KB, PARALLEL={parallel}: {mb / seconds:.2f} MB/sec, "
+                          f"{files / seconds:.1f} files/sec" + (f" ({failed} failed)" if failed else ""))
+    finally:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"REMOVE {location}/")
+        except Exception as e:
+            print(f"   ⚠ Warning: Could not remove the benchmark files from {location}/: {e}")
+        finally:
+            cursor.close()
+    return results
+
+
+def run_benchmark(config, label=None, connects=DEFAULT_CONNECTS, queries=DEFAULT_QUERIES,
+                  query_threads=DEFAULT_QUERY_THREADS, sizes_kb=DEFAULT_PUT_SIZES_KB, parallels=DEFAULT_PUT_PARALLEL,
+                  files=DEFAULT_PUT_FILES, repeats=DEFAULT_PUT_REPEATS, stage=DEFAULT_BENCHMARK_STAGE):
+    """
+    Benchmark the connection: connect/auth, round trips, small-query throughput and PUT throughput.
+
+    Args:
+        config: Dictionary with Snowflake connection parameters (or a "local_stage" section)
+        label: Free-text label of the run (network location, connector version, ...)
+        connects: Connections opened to time connect and authentication
+        queries: Round trips timed, and queries per thread count of the throughput test
+        query_threads: Thread counts of the small-query throughput test
+        sizes_kb: File sizes (KB) of the PUT matrix
+        parallels: PARALLEL levels of the PUT matrix
+        files: Files per PUT
+        repeats: PUTs per combination (the median is reported)
+        stage: Stage the PUT benchmark writes to
+
+    Returns:
+        Report dictionary
+    """
+    local = config.get('local_stage')
+    started_at = datetime.now(timezone.utc)
+    run_id = started_at.strftime('%Y%m%d_%H%M%S')
+    print("=" * 60)
+    print("ETL Service Account Connection Benchmark")
+    print("=" * 60)
+    print(f"Target: {'local stage ' + local['root'] if local else config['account']}")
+
+    print("\n1. Connect and authenticate...")
+    connect, conn = benchmark_connect(config, connects)
+    try:
+        print("\n2. Single-query round trips...")
+        round_trip = benchmark_round_trip(conn, queries)
+        print(f"   SELECT 1: p50 {round_trip['p50'] * 1000:.1f} ms, p95 {round_trip['p95'] * 1000:.1f} ms")
+
+        print("\n3. Small-query throughput...")
+        throughput = benchmark_query_throughput(conn, queries, query_threads)
+
+        print(f"\n4. PUT throughput (@{stage}/{BENCHMARK_PREFIX}/{run_id}/)...")
+        puts = benchmark_puts(conn, stage, run_id, sizes_kb, parallels, files, repeats)
+    finally:
+        conn.close()
+
+    return {
+        'label': label,
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'environment': {
+            'host': socket.gethostname(),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'connector': 'local_stage' if local else snowflake.connector.__version__,
+            'target': local['root'] if local else config['account'],
+        },
+        'parameters': {'connects': connects, 'queries': queries, 'query_threads': list(query_threads),
+                       'sizes_kb': list(sizes_kb), 'parallel': list(parallels), 'files': files,
+                       'repeats': repeats, 'stage': stage},
+        'connect': connect,
+        'round_trip_seconds': round_trip,
+        'query_throughput': throughput,
+        'put_throughput': puts,
+    }
+
+
+def headline_metrics(report):
+    """Main numbers of a benchmark report: {name: (value, whether higher is better)}."""
+    metrics = {
+        'connect p50 (s)': (report['connect']['seconds']['p50'], False),
+        'round trip p50 (ms)': (report['round_trip_seconds']['p50'] * 1000, False),
+        'round trip p95 (ms)': (report['round_trip_seconds']['p95'] * 1000, False),
+    }
+    for row in report['query_throughput']:
+        metrics[f"queries/sec, {row['threads']} thread(s)"] = (row['queries_per_sec'], True)
+    for row in report['put_throughput']:
+        metrics[f"PUT MB/sec, {row['size_kb']} KB, PARALLEL={row['parallel']}"] = (row['mb_per_sec'], True)
+    return metrics
+
+
+def compare_reports(previous, current):
+    """Print the headline metrics of two benchmark reports side by side."""
+    before, after = headline_metrics(previous), headline_metrics(current)
+    print(f"\nComparison with {previous.get('label') or previous['started_at']} "
+          f"({previous['environment']['connector']} on {previous['environment']['host']}):")
+    print(f"   {'Metric':<38} {'Before':>10} {'After':>10} {'Change':>8}")
+    for name, (value, higher_is_better) in after.items():
+        if name not in before or not before[name][0] or value is None:
+            continue
+        ratio = value / before[name][0]
+        if abs(ratio - 1) < COMPARE_NOISE:
+            mark = ''
+        else:
+            mark = '✓' if (ratio > 1) == higher_is_better else '✗'
+        print(f"   {name:<38} {before[name][0]:>10.2f} {value:>10.2f} {ratio:>7.2f}x {mark}".rstrip())
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Test (or benchmark) the ETL service account connection',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Test connectivity and a table round trip
+  python test_service_account.py
+
+  # Benchmark connect, round trips, query and PUT throughput, and save the report
+  python test_service_account.py --benchmark --label office --report bench_office.json
+
+  # Compare with an earlier report (other network location or connector version)
+  python test_service_account.py --benchmark --label vpn --compare bench_office.json
+
+  # Benchmark the offline local stage
+  python test_service_account.py --benchmark --config config.local.json
+        """
+    )
+    parser.add_argument('--config', type=str, default=str(CONFIG_PATH),
+                        help='Configuration file (default: config.json next to this script)')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark the connection instead of testing it')
+    parser.add_argument('--report', type=str, help='With --benchmark, write the JSON report to this file')
+    parser.add_argument('--compare', type=str, metavar='REPORT',
+                        help='With --benchmark, compare the results with an earlier JSON report')
+    parser.add_argument('--label', type=str, help='With --benchmark, label of the run in the report')
+    parser.add_argument('--connects', type=int, default=DEFAULT_CONNECTS,
+                        help=f'Connections opened to time connect and authentication (default: {DEFAULT_CONNECTS})')
+    parser.add_argument('--queries', type=int, default=DEFAULT_QUERIES,
+                        help=f'Round trips timed and queries per thread count (default: {DEFAULT_QUERIES})')
+    parser.add_argument('--query-threads', type=int, nargs='+', default=list(DEFAULT_QUERY_THREADS),
+                        help='Thread counts of the small-query throughput test (default: 1 4 8)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_PUT_SIZES_KB), metavar='KB',
+                        help='File sizes in KB of the PUT matrix (default: 4 64 1024)')
+    parser.add_argument('--parallel', type=int, nargs='+', default=list(DEFAULT_PUT_PARALLEL),
+                        help='PARALLEL levels of the PUT matrix (default: 1 4 8)')
+    parser.add_argument('--files', type=int, default=DEFAULT_PUT_FILES,
+                        help=f'Files per PUT (default: {DEFAULT_PUT_FILES})')
+    parser.add_argument('--repeats', type=int, default=DEFAULT_PUT_REPEATS,
+                        help=f'PUTs per size and PARALLEL level, the median is reported '
+                             f'(default: {DEFAULT_PUT_REPEATS})')
+    parser.add_argument('--stage', type=str, default=DEFAULT_BENCHMARK_STAGE,
+                        help='Stage the PUT benchmark writes to and cleans up (default: ~, the user stage)')
+
+    args = parser.parse_args()
+
+    # Load configuration
+    print(f"Loading configuration from {args.config}...")
+    config = load_config(Path(args.config))
+
+    if not config.get('local_stage'):
+        # Check if private key file exists
+        if not PRIVATE_KEY_PATH.exists():
+            print(f"Error: Private key file not found at {PRIVATE_KEY_PATH}")
+            print("Please ensure rsa_key.p8 exists in the parent directory")
+            sys.exit(1)
+
+        # Check if account is configured
+        if config['account'] == 'YOUR_ACCOUNT_IDENTIFIER':
+            print("Error: Please update the 'account' value in config.json")
+            print("Replace 'YOUR_ACCOUNT_IDENTIFIER' with your actual Snowflake account identifier")
+            sys.exit(1)
+    elif not args.benchmark:
+        print("Error: The connection test needs a Snowflake account; use --benchmark with a local stage config")
         sys.exit(1)
-    
+
     print("✓ Configuration loaded successfully\n")
-    
-    # Run the test
-    success = test_connection(config)
-    sys.exit(0 if success else 1)
 
+    if not args.benchmark:
+        # Run the test
+        success = test_connection(config)
+        sys.exit(0 if success else 1)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    report = run_benchmark(config, args.label, args.connects, args.queries, args.query_threads, args.sizes,
+                           args.parallel, args.files, args.repeats, args.stage)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Benchmark report written to {args.report}")
+    if previous:
+        compare_reports(previous, report)
+
+    print("\n" + "=" * 60)
+    print("✓ Benchmark complete")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Quick test script to verify the uploader against the offline local stage."""
+import filecmp
+import re
+import shutil
+import sqlite3
+from pathlib import Path
+from reportlab.pdfgen import canvas
+
+from upload_receipts import upload_receipts
+
+STAGE_NAME = 'RECEIPTS_PROCESSING_DB.RAW.RECEIPTS'
+OUTPUT_DIR = Path('../receipts_test_upload')
+
+
+def make_receipts(directory, count, start=0):
+    """Write small receipt PDFs with distinct content; returns their paths."""
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(start, start + count):
+        path = directory / f"receipt_{i:04d}.pdf"
+        write_receipt(path, f"Receipt #{i:04d}  Total: ${i * 3.25:.2f}")
+        paths.append(path)
+    return paths
+
+
+def write_receipt(path, text):
+    """Write a one-page receipt PDF with the given text."""
+    pdf = canvas.Canvas(str(path))
+    pdf.drawString(72, 720, text)
+    pdf.save()
+
+
+def setup(name):
+    """Fresh receipts directory, stage root and ledger for one test; returns (receipts_dir, stage_root, ledger)."""
+    work_dir = OUTPUT_DIR / name
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return work_dir / 'receipts', work_dir / 'stage', work_dir / 'upload_ledger.db'
+
+
+def run(receipts_dir, stage_root, ledger_path, failure_rate=0.0, file_error_rate=0.0, **kwargs):
+    """Upload receipts_dir to the local stage at stage_root."""
+    config = {'local_stage': {'root': str(stage_root), 'failure_rate': failure_rate,
+                              'file_error_rate': file_error_rate, 'seed': 7}}
+    upload_receipts(config, str(receipts_dir), STAGE_NAME, ledger_path=ledger_path, **kwargs)
+
+
+def ledger_rows(ledger_path):
+    """Ledger rows of the stage as {name: (status, md5, stage_path, uploaded_at)}."""
+    with sqlite3.connect(ledger_path) as db:
+        rows = db.execute("SELECT name, status, md5, stage_path, uploaded_at FROM uploads WHERE stage = ?",
+                          (STAGE_NAME,)).fetchall()
+    return {name: rest for name, *rest in rows}
+
+
+def status_counts(ledger_path):
+    """Number of ledger rows per status."""
+    counts = {}
+    for status, *_ in ledger_rows(ledger_path).values():
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def dead_letter_names(ledger_path):
+    """Names in the dead_letters table."""
+    with sqlite3.connect(ledger_path) as db:
+        return {name for name, in db.execute("SELECT name FROM dead_letters WHERE stage = ?", (STAGE_NAME,))}
+
+
+def staged_files(stage_root):
+    """Staged PDFs by file name."""
+    return {path.name: path for path in Path(stage_root).rglob('*.pdf')}
+
+
+def check(condition, message):
+    """Print a ✓/✗ line for a check and return whether it passed."""
+    print(f"{'✓' if condition else '✗'} {message}")
+    return condition
+
+
+def test_failures_and_retries():
+    """Upload with injected failures: transient failures are retried next run, permanent ones dead-lettered."""
+    print("Testing Failures and Retries...")
+    print("="*60)
+
+    receipts_dir, stage_root, ledger_path = setup('retries')
+    count = 20
+    make_receipts(receipts_dir, count)
+
+    # One file per PUT and a single attempt, so each injected failure hits one file and is given up this run
+    run(receipts_dir, stage_root, ledger_path, failure_rate=0.3, file_error_rate=0.2,
+        concurrency=1, parallel=1, batch_size=1, max_attempts=1)
+    counts = status_counts(ledger_path)
+    uploaded, failed, dead = counts.get('UPLOADED', 0), counts.get('FAILED', 0), counts.get('DEAD_LETTER', 0)
+    dead_letters = dead_letter_names(ledger_path)
+    staged = staged_files(stage_root)
+    print(f"\nFirst run: {uploaded} uploaded, {failed} retried next run, {dead} dead-lettered")
+
+    ok = check(uploaded + failed + dead == count, f"All {count} files recorded in the ledger")
+    ok &= check(uploaded > 0 and failed > 0 and dead > 0, "Uploads, transient and permanent failures all occurred")
+    ok &= check(len(staged) == uploaded, f"{len(staged)} staged file(s) match the uploaded count")
+    ok &= check(len(dead_letters) == dead, f"{len(dead_letters)} dead letter(s) recorded with a reason")
+    ok &= check(not dead_letters & set(staged), "Dead-lettered files are not staged")
+
+    # Without failures the transient ones are uploaded; dead-lettered files stay skipped until changed
+    run(receipts_dir, stage_root, ledger_path)
+    counts = status_counts(ledger_path)
+    staged = staged_files(stage_root)
+    print(f"\nSecond run: {counts}")
+    ok &= check(counts.get('UPLOADED', 0) == uploaded + failed, f"{failed} transient failure(s) uploaded on retry")
+    ok &= check(counts.get('DEAD_LETTER', 0) == dead, f"{dead} dead-lettered file(s) still skipped")
+    ok &= check(len(staged) == count - dead, f"{len(staged)} file(s) staged")
+
+    # --retry-dead-letters uploads them again
+    run(receipts_dir, stage_root, ledger_path, retry_dead_letters=True)
+    counts = status_counts(ledger_path)
+    ok &= check(counts == {'UPLOADED': count}, f"All {count} files uploaded with retry_dead_letters")
+    ok &= check(not dead_letter_names(ledger_path), "Dead letters cleared")
+    ok &= check(len(staged_files(stage_root)) == count, f"{count} file(s) staged")
+
+    if not ok:
+        print("\n✗ Failure handling test failed!")
+    return ok
+
+
+def test_changed_and_duplicates():
+    """Changed files are re-uploaded in place; copies of staged content are skipped."""
+    print("\nTesting Changed Files and Duplicate Content...")
+    print("="*60)
+
+    receipts_dir, stage_root, ledger_path = setup('changes')
+    paths = make_receipts(receipts_dir, 5)
+    run(receipts_dir, stage_root, ledger_path, partition_by='date')
+    before = ledger_rows(ledger_path)
+    ok = check(status_counts(ledger_path) == {'UPLOADED': 5}, "5 files uploaded")
+    ok &= check(all(re.search(r'/\d{4}/\d{2}/\d{2}/[^/]+$', row[2]) for row in before.values()),
+                "Files staged under yyyy/mm/dd/ partitions")
+
+    # Change one receipt and copy another under a new name
+    changed, original = paths[0], paths[1]
+    write_receipt(changed, "Receipt #0000  Total: $999.99 (corrected)")
+    duplicate = receipts_dir / 'receipt_copy.pdf'
+    shutil.copyfile(original, duplicate)
+    run(receipts_dir, stage_root, ledger_path, partition_by='date')
+    after = ledger_rows(ledger_path)
+    staged = staged_files(stage_root)
+
+    status, md5, stage_path, _ = after[changed.name]
+    ok &= check(status == 'UPLOADED' and md5 != before[changed.name][1], "Changed file re-uploaded with its new MD5")
+    ok &= check(stage_path == before[changed.name][2], f"Changed file kept its partition ({stage_path})")
+    ok &= check(filecmp.cmp(changed, staged[changed.name], shallow=False), "Staged copy has the new content")
+    ok &= check(after[duplicate.name][0] == 'DUPLICATE', "Copy of staged content recorded as DUPLICATE")
+    ok &= check(duplicate.name not in staged, "Duplicate content not uploaded")
+    ok &= check(all(after[path.name] == before[path.name] for path in paths[1:]), "Unchanged files left as they were")
+
+    # Nothing left to upload
+    run(receipts_dir, stage_root, ledger_path, partition_by='date')
+    ok &= check(ledger_rows(ledger_path) == after, "Re-run uploads nothing")
+
+    if not ok:
+        print("\n✗ Changed/duplicate test failed!")
+    return ok
+
+
+def test_pipeline_mode():
+    """Pipeline mode uploads and dead-letters like batch mode."""
+    print("\nTesting Pipeline Mode...")
+    print("="*60)
+
+    receipts_dir, stage_root, ledger_path = setup('pipeline')
+    count = 20
+    make_receipts(receipts_dir, count)
+    run(receipts_dir, stage_root, ledger_path, file_error_rate=0.2, pipeline=True, batch_size=5)
+    counts = status_counts(ledger_path)
+    uploaded, dead = counts.get('UPLOADED', 0), counts.get('DEAD_LETTER', 0)
+    staged = staged_files(stage_root)
+    print(f"\nPipeline run: {counts}")
+
+    ok = check(uploaded + dead == count and dead > 0, f"{uploaded} uploaded, {dead} dead-lettered")
+    ok &= check(len(staged) == uploaded, f"{len(staged)} staged file(s) match the uploaded count")
+    ok &= check(len(dead_letter_names(ledger_path)) == dead, "Dead letters recorded")
+
+    make_receipts(receipts_dir, 3, start=count)
+    run(receipts_dir, stage_root, ledger_path, pipeline=True, batch_size=5)
+    counts = status_counts(ledger_path)
+    ok &= check(counts.get('UPLOADED', 0) == uploaded + 3, "Only the 3 new files uploaded on the next run")
+
+    if not ok:
+        print("\n✗ Pipeline test failed!")
+    return ok
+
+
+if __name__ == "__main__":
+    success = test_failures_and_retries() and test_changed_and_duplicates() and test_pipeline_mode()
+    if success:
+        print("\n✓ All uploader tests passed!")
+    exit(0 if success else 1)
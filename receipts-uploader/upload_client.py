@@ -0,0 +1,106 @@
+"""
+Client of the upload daemon (upload_daemon.py): submit upload jobs and query it.
+
+Only the standard library is imported, so a generator or script can hand
+receipts to the warm daemon in milliseconds, without loading the Snowflake
+connector or logging in:
+
+    from upload_client import submit
+    submit('../receipts')                      # queue the new receipts of a directory
+    submit(['a.pdf', 'b.pdf'], wait=True)      # upload two files and wait for the result
+"""
+import os
+import sys
+import json
+import socket
+from pathlib import Path
+
+# Socket the daemon listens on
+SOCKET_PATH = Path(__file__).parent / 'upload_daemon.sock'
+
+
+def request(message, socket_path=SOCKET_PATH, timeout=None):
+    """
+    Send one request to a running daemon and return its response.
+
+    Args:
+        message: Request dictionary (see the module docstring)
+        socket_path: Socket of the daemon
+        timeout: Seconds to wait for the response, or None to wait indefinitely
+
+    Returns:
+        Response dictionary
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(message).encode() + b'\n')
+        with client.makefile('rb') as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f"No response from the upload daemon at {socket_path}")
+    return json.loads(line)
+
+
+def submit(paths, socket_path=SOCKET_PATH, wait=False, **options):
+    """
+    Submit an upload job: a receipts directory or a list of files.
+
+    Args:
+        paths: Directory path, or list of PDF file paths
+        socket_path: Socket of the daemon
+        wait: Return once the job is done (with its result) instead of once it is queued
+        options: Other job fields ("stage", "partition_by")
+
+    Returns:
+        Response dictionary with the job id
+    """
+    message = dict(options, op='upload', wait=wait)
+    if isinstance(paths, (str, os.PathLike)):
+        message['directory'] = str(Path(paths).resolve())
+    else:
+        message['files'] = [str(Path(path).resolve()) for path in paths]
+    return request(message, socket_path)
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Submit upload jobs to the upload daemon, or query it")
+    parser.add_argument('--socket', type=str, default=str(SOCKET_PATH),
+                        help='Unix socket of the daemon (default: upload_daemon.sock next to this script)')
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--submit', type=str, nargs='+', metavar='PATH',
+                        help='Submit an upload job for a receipts directory or PDF files')
+    action.add_argument('--status', type=int, metavar='JOB', help='Print the status of a job')
+    action.add_argument('--ping', action='store_true', help='Print the state of the daemon')
+    action.add_argument('--stop', action='store_true', help='Stop the daemon once its queued jobs are done')
+    parser.add_argument('--wait', action='store_true', help='With --submit, wait for the job and print its result')
+    parser.add_argument('-s', '--stage', type=str, help='With --submit, the target stage (default: the daemon\'s)')
+    parser.add_argument('--partition-by', choices=('none', 'date', 'family'),
+                        help='With --submit, the stage prefix scheme of new files (default: the daemon\'s)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.submit:
+            options = {key: value for key, value in (('stage', args.stage), ('partition_by', args.partition_by))
+                       if value}
+            paths = args.submit[0] if len(args.submit) == 1 and Path(args.submit[0]).is_dir() else args.submit
+            response = submit(paths, args.socket, args.wait, **options)
+        elif args.status is not None:
+            response = request({'op': 'status', 'job': args.status}, args.socket)
+        elif args.ping:
+            response = request({'op': 'ping'}, args.socket)
+        else:
+            response = request({'op': 'shutdown'}, args.socket)
+    except OSError as e:
+        print(f"Error: Could not reach the upload daemon at {args.socket}: {e}")
+        sys.exit(1)
+    print(json.dumps(response, indent=2))
+    sys.exit(0 if response.get('ok') else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Adaptive limit of the PUT statements in flight, and an optional bandwidth cap.
+
+The limit follows AIMD (additive increase, multiplicative decrease), as TCP
+congestion control does:
+
+- slow start: until the first sign of trouble, every PUT that finishes
+  without trouble allows one more PUT in flight, doubling the limit per round
+- increase: after that, every <limit> PUTs that finished without trouble
+  (about one round of the PUTs in flight) allow one more PUT in flight
+- decrease: a PUT with transient failures (network errors, throttling; see
+  upload_retry.classify_failure) or one that took much longer per byte than
+  the fastest recent PUTs (the uplink is saturated, so more PUTs only queue)
+  halves the limit; further decreases wait until the PUTs started at the old
+  limit have finished
+
+On a fast link the limit grows until PUTs start queueing on the uplink or
+getting throttled and then hovers below that point, so throughput is found
+without tuning -c per network. The bandwidth cap paces PUT starts so that
+the bytes put per second stay below --max-bandwidth whatever the limit.
+"""
+import time
+import threading
+from collections import deque
+
+
+# Limit range of --adaptive: the limit starts at -c and stays between these
+MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 32
+
+# A PUT slower per byte than this many times the fastest recent PUT counts as congestion
+LATENCY_TOLERANCE = 2.0
+
+# The limit is multiplied by this on congestion or transient failures
+DECREASE_FACTOR = 0.5
+
+# PUTs the fastest-PUT baseline is taken over
+BASELINE_WINDOW = 100
+
+# Seconds of finished PUTs the current throughput is computed over
+THROUGHPUT_WINDOW_SECONDS = 5.0
+
+
+class ConcurrencyController:
+    """Thread-safe AIMD limit of the PUTs in flight, with optional pacing to a bandwidth cap."""
+
+    def __init__(self, initial, adaptive=False, maximum=DEFAULT_MAX_CONCURRENCY, minimum=MIN_CONCURRENCY,
+                 max_bytes_per_sec=None, telemetry=None):
+        """
+        Args:
+            initial: PUTs in flight at the start (-c); the fixed limit unless adaptive
+            adaptive: Adjust the limit with AIMD from PUT latency and transient failures
+            maximum: Highest limit when adaptive
+            minimum: Lowest limit when adaptive
+            max_bytes_per_sec: Bytes per second the PUTs may start, or None for no cap
+            telemetry: UploadTelemetry the limit changes and throughput are recorded in, or None
+        """
+        self.adaptive = adaptive
+        self.minimum = minimum
+        self.maximum = max(maximum, initial) if adaptive else initial
+        self.limit = max(minimum, initial)
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.telemetry = telemetry
+        self.increases = 0
+        self.decreases = 0
+        self._successes = 0
+        self._slow_start = adaptive
+        self._recover_after = 0  # PUTs to finish before another decrease
+        self._costs = deque(maxlen=BASELINE_WINDOW)  # seconds per byte of recent PUTs
+        self._finished = deque()  # (time, bytes) of the PUTs finished in the throughput window
+        self._paced_until = time.monotonic()
+        self._lock = threading.Lock()
+        if telemetry:
+            telemetry.record_concurrency(self.limit, 0.0)
+
+    def reserve(self, nbytes):
+        """
+        Reserve bandwidth for a PUT of nbytes under the cap.
+
+        Returns:
+            Seconds to wait before starting the PUT (0 without a cap)
+        """
+        if not self.max_bytes_per_sec:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paced_until)
+            self._paced_until = start + nbytes / self.max_bytes_per_sec
+            return start - now
+
+    def throughput(self):
+        """Bytes per second of the PUTs finished in the last THROUGHPUT_WINDOW_SECONDS."""
+        with self._lock:
+            return self._throughput(time.monotonic())
+
+    def _throughput(self, now):
+        while self._finished and self._finished[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._finished.popleft()
+        return sum(nbytes for _, nbytes in self._finished) / THROUGHPUT_WINDOW_SECONDS
+
+    def record(self, seconds, nbytes, transient_failures=0):
+        """
+        Record a finished PUT and adjust the limit.
+
+        Args:
+            seconds: Wall time of the PUT
+            nbytes: Bytes uploaded by the PUT
+            transient_failures: Files of the PUT that failed transiently (to be retried)
+
+        Returns:
+            The limit after the adjustment
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._finished.append((now, nbytes))
+            cost = seconds / nbytes if nbytes else None
+            congested = cost is not None and self._costs and cost > LATENCY_TOLERANCE * min(self._costs)
+            if cost is not None:
+                self._costs.append(cost)
+            if not self.adaptive:
+                return self.limit
+
+            limit = self.limit
+            self._recover_after = max(0, self._recover_after - 1)
+            if transient_failures or congested:
+                self._successes = 0
+                self._slow_start = False
+                if not self._recover_after:
+                    limit = max(self.minimum, int(self.limit * DECREASE_FACTOR))
+                    self._recover_after = self.limit
+            else:
+                self._successes += 1
+                if self._slow_start or self._successes >= self.limit:
+                    self._successes = 0
+                    limit = min(self.maximum, self.limit + 1)
+            if limit != self.limit:
+                if limit > self.limit:
+                    self.increases += 1
+                else:
+                    self.decreases += 1
+                self.limit = limit
+                if self.telemetry:
+                    self.telemetry.record_concurrency(limit, self._throughput(now))
+            return self.limit
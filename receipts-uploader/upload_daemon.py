@@ -0,0 +1,440 @@
+"""
+Long-running uploader service that takes upload jobs over a local Unix socket.
+
+Every cron run of upload_receipts.py pays for the interpreter start, the
+snowflake.connector and cryptography imports, the private key parsing and a
+login before its first PUT. The daemon pays for them once: it keeps an
+authenticated session open (client_session_keep_alive renews its token
+while idle, and a health check reconnects when the session was dropped
+anyway) and accepts jobs from generators and other tools over a Unix socket,
+so submitting a job takes milliseconds.
+
+Protocol: one JSON request per line on the socket, answered by one JSON line.
+
+    {"op": "upload", "directory": "../receipts"}          -> {"ok": true, "job": 3, "status": "queued"}
+    {"op": "upload", "files": ["a.pdf", ...], "wait": true} -> {"ok": true, "job": 4, "status": "done", "result": {...}}
+    {"op": "status", "job": 3}                            -> {"ok": true, "job": 3, "status": "running"}
+    {"op": "ping"}                                        -> {"ok": true, "uptime_seconds": ..., "queued": ..., ...}
+    {"op": "shutdown"}                                    -> {"ok": true}
+
+Upload jobs may also set "stage" and "partition_by". They run one at a time
+in submission order, each like an upload_receipts.py run over its files:
+diffed against the upload ledger, uploaded in concurrent batches with
+retries, recorded in the ledger and refreshed in the stage directory.
+
+Jobs are submitted with upload_client.py, which only needs the standard
+library, so a submission does not import the connector either:
+
+    python upload_daemon.py                           # serve until SIGINT/SIGTERM
+    python upload_client.py --submit ../receipts --wait
+    python upload_client.py --ping
+    python upload_client.py --stop                    # finish the queued jobs and exit
+"""
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import threading
+import socketserver
+from pathlib import Path
+
+from file_hashes import DEFAULT_HASH_WORKERS, hash_files
+from upload_ledger import UploadLedger
+from upload_receipts import (
+    CONFIG_PATH, LEDGER_PATH, DEFAULT_CONCURRENCY, DEFAULT_PARALLEL, DEFAULT_BATCH_SIZE, DEFAULT_RECONCILE_HOURS,
+    DEFAULT_RECONCILE_DAYS, PARTITION_SCHEMES, load_config, connect_to_snowflake, reconcile_ledger,
+    recent_date_prefixes, plan_changes, assign_prefixes, upload_files, record_results, duplicate_entries,
+    write_telemetry
+)
+from upload_retry import DEFAULT_MAX_ATTEMPTS
+from upload_telemetry import UploadTelemetry
+from stage_refresh import StageRefresher
+from upload_concurrency import DEFAULT_MAX_CONCURRENCY, ConcurrencyController
+from upload_client import SOCKET_PATH, request
+
+# A session idle for longer than this is checked (SELECT 1) before the next job and reconnected if dropped
+HEALTH_CHECK_SECONDS = 300
+
+# Finished jobs whose status can still be queried
+MAX_FINISHED_JOBS = 1000
+
+
+class UploadJob:
+    """One submitted upload job and its outcome."""
+
+    def __init__(self, job_id, message):
+        self.id = job_id
+        self.message = message
+        self.status = 'queued'
+        self.result = None
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+
+    def response(self):
+        response = {'ok': True, 'job': self.id, 'status': self.status}
+        if self.result is not None:
+            response['result'] = self.result
+        return response
+
+
+class UploadDaemon:
+    """Keeps a Snowflake session warm and runs queued upload jobs on it, one at a time."""
+
+    def __init__(self, config, stage_name='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS', ledger_path=LEDGER_PATH,
+                 concurrency=DEFAULT_CONCURRENCY, parallel=DEFAULT_PARALLEL, batch_size=DEFAULT_BATCH_SIZE,
+                 hash_workers=DEFAULT_HASH_WORKERS, max_attempts=DEFAULT_MAX_ATTEMPTS, partition_by='none',
+                 reconcile_hours=DEFAULT_RECONCILE_HOURS, reconcile_days=DEFAULT_RECONCILE_DAYS, refresh=True,
+                 prometheus_path=None, record_run=False, adaptive=False, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_bandwidth=None):
+        """
+        Args:
+            config: Connection configuration (config.json)
+            stage_name: Default target stage of jobs
+            ledger_path: SQLite upload ledger
+            concurrency: Concurrent PUT statements per job
+            parallel: PUT PARALLEL setting
+            batch_size: Files per PUT batch above which more batches are used
+            hash_workers: Hashing threads
+            max_attempts: Attempts per file for transient failures
+            partition_by: Default stage prefix scheme of jobs
+            reconcile_hours: Reconcile the ledger when its last reconciliation is older than this
+            reconcile_days: With date partitions, the periodic reconciliation lists this many recent days
+            refresh: Refresh the stage directory of the prefixes written
+            prometheus_path: Prometheus textfile rewritten after every job, or None
+            record_run: Insert a summary row per job into UPLOAD_RUNS
+            adaptive: Adapt the concurrent PUTs between 1 and max_concurrency (AIMD); the limit carries over
+                from job to job
+            max_concurrency: Highest number of concurrent PUTs when adaptive
+            max_bandwidth: Upload bandwidth cap in MB/s, or None
+        """
+        self.config = config
+        self.stage_name = stage_name
+        self.ledger_path = ledger_path
+        self.concurrency = concurrency
+        self.parallel = parallel
+        self.batch_size = batch_size
+        self.hash_workers = hash_workers
+        self.max_attempts = max_attempts
+        self.partition_by = partition_by
+        self.reconcile_hours = reconcile_hours
+        self.reconcile_days = reconcile_days
+        self.refresh = refresh
+        self.prometheus_path = prometheus_path
+        self.record_run = record_run
+        max_bytes_per_sec = max_bandwidth * 1024 * 1024 if max_bandwidth else None
+        self.controller = ConcurrencyController(concurrency, adaptive, max_concurrency,
+                                                max_bytes_per_sec=max_bytes_per_sec)
+
+        self.conn = None
+        self.jobs = {}
+        self.jobs_done = 0
+        self.reconnects = 0
+        self.started = time.monotonic()
+        self._last_used = self.started
+        self._queue = queue.Queue()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def connect(self):
+        """Open the session (or a new one); the private key is parsed only once."""
+        start = time.perf_counter()
+        conn = connect_to_snowflake(self.config, keep_alive=True)
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = conn
+        self._last_used = time.monotonic()
+        return time.perf_counter() - start
+
+    def start(self):
+        """Connect and start the job worker."""
+        print(f"✓ Session opened in {self.connect():.2f}s")
+        self._worker = threading.Thread(target=self._run, name='upload-jobs')
+        self._worker.start()
+
+    def stop(self):
+        """Run the jobs already queued, then close the session."""
+        self._queue.put(None)
+        self._worker.join()
+        self.conn.close()
+
+    def submit(self, message):
+        """Queue an upload job; returns the UploadJob."""
+        with self._lock:
+            self._next_id += 1
+            job = self.jobs[self._next_id] = UploadJob(self._next_id, message)
+            finished = [job_id for job_id, other in self.jobs.items() if other.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
+        self._queue.put(job)
+        return job
+
+    def stats(self):
+        """Daemon state for ping requests."""
+        with self._lock:
+            running = [job.id for job in self.jobs.values() if job.status == 'running']
+        return {
+            'ok': True,
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+            'session_idle_seconds': round(time.monotonic() - self._last_used, 1),
+            'queued': self._queue.qsize(),
+            'running': running,
+            'jobs_done': self.jobs_done,
+            'reconnects': self.reconnects,
+            'concurrency': self.controller.limit,
+            'mb_per_sec': round(self.controller.throughput() / (1024 * 1024), 3),
+        }
+
+    def _ensure_session(self):
+        # Keep-alive heartbeats renew the session token; this catches sessions dropped anyway
+        try:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception as e:
+            print(f"  Session check failed ({e}); reconnecting...")
+            try:
+                self.connect()
+                self.reconnects += 1
+            except (Exception, SystemExit) as e:
+                # connect_to_snowflake exits on errors; keep serving and check again before the next job
+                print(f"  Warning: Could not reconnect: {e}")
+                return
+        self._last_used = time.monotonic()
+
+    def _maybe_reconcile(self, ledger, stage_name, partition_by):
+        if ledger.last_reconciled(stage_name) is None:
+            reconcile_ledger(self.conn, ledger, stage_name)
+        elif ledger.needs_reconcile(stage_name, self.reconcile_hours):
+            reconcile_ledger(self.conn, ledger, stage_name,
+                             recent_date_prefixes(self.reconcile_days) if partition_by == 'date' else None)
+
+    def _run(self):
+        # The ledger's SQLite connection belongs to this thread, which runs every job
+        ledger = UploadLedger(self.ledger_path)
+        hash_cache = ledger.load_hash_cache()
+        try:
+            while True:
+                try:
+                    job = self._queue.get(timeout=HEALTH_CHECK_SECONDS)
+                except queue.Empty:
+                    self._ensure_session()
+                    continue
+                if job is None:
+                    break
+                if time.monotonic() - self._last_used > HEALTH_CHECK_SECONDS:
+                    self._ensure_session()
+                job.status = 'running'
+                try:
+                    job.result = self._run_job(ledger, hash_cache, job)
+                    job.status = 'done'
+                except (Exception, SystemExit) as e:
+                    job.result = {'error': f"{type(e).__name__}: {e}"}
+                    job.status = 'failed'
+                    print(f"✗ Job {job.id} failed: {job.result['error']}")
+                self._last_used = time.monotonic()
+                self.jobs_done += 1
+                job.done.set()
+        finally:
+            ledger.close()
+
+    def _run_job(self, ledger, hash_cache, job):
+        message = job.message
+        stage_name = message.get('stage') or self.stage_name
+        partition_by = message.get('partition_by') or self.partition_by
+        if partition_by not in PARTITION_SCHEMES:
+            raise ValueError(f"Unknown partition scheme {partition_by!r} (one of {', '.join(PARTITION_SCHEMES)})")
+        if 'directory' in message:
+            files = sorted(Path(message['directory']).glob('*.pdf'))
+        else:
+            files = [Path(path) for path in message.get('files', []) if Path(path).is_file()]
+        print(f"\nJob {job.id}: {len(files)} file(s) for {stage_name} "
+              f"(queued {time.monotonic() - job.submitted:.2f}s)")
+
+        start = time.perf_counter()
+        self._maybe_reconcile(ledger, stage_name, partition_by)
+        hashes, _ = hash_files(files, hash_cache, self.hash_workers)
+        ledger.save_hash_cache(hash_cache, files)
+        plan = plan_changes(files, hashes, ledger.present_files(stage_name), ledger.dead_letters(stage_name))
+        files_to_upload = plan['new'] + plan['changed']
+
+        telemetry = UploadTelemetry(stage_name, 'daemon')
+        self.controller.telemetry = telemetry
+        telemetry.record_concurrency(self.controller.limit, self.controller.throughput())
+        refresher = StageRefresher(self.conn, stage_name, telemetry) if self.refresh else None
+        results = {}
+        try:
+            prefixes = assign_prefixes(files_to_upload, partition_by, stage_name, ledger.stage_paths(stage_name))
+            for overwrite, group in ((False, plan['new']), (True, plan['changed'])):
+                if group:
+                    results.update(upload_files(self.conn, group, stage_name, self.concurrency, self.parallel,
+                                                self.batch_size, overwrite, self.max_attempts, prefixes, telemetry,
+                                                refresher, self.controller))
+            record_results(ledger, stage_name, files_to_upload, hashes, results, prefixes)
+            ledger.record(stage_name, duplicate_entries(stage_name, plan['duplicate'], hashes, results,
+                                                        ledger.stage_paths(stage_name)))
+        finally:
+            if refresher:
+                refresher.close()
+        write_telemetry(telemetry, self.conn, stage_name, None, self.prometheus_path, self.record_run)
+
+        statuses = [status for status, _ in results.values()]
+        result = {
+            'files': len(files),
+            'uploaded': statuses.count('UPLOADED'),
+            'skipped': statuses.count('SKIPPED'),
+            'failed': statuses.count('FAILED'),
+            'changed': len(plan['changed']),
+            'unchanged': len(plan['unchanged']),
+            'duplicate': len(plan['duplicate']),
+            'dead_letter': len(plan['dead_letter']),
+            'seconds': round(time.perf_counter() - start, 3),
+            'failures': {name: message for name, (status, message) in results.items() if status == 'FAILED'},
+        }
+        print(f"✓ Job {job.id}: {result['uploaded']} uploaded, {result['skipped']} skipped, "
+              f"{result['failed']} failed, {result['unchanged']} unchanged in {result['seconds']:.1f}s")
+        return result
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers the JSON requests of one client connection, one per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, uploader):
+        self.uploader = uploader
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def dispatch(self, message):
+        op = message.get('op')
+        if op == 'upload':
+            if 'directory' not in message and 'files' not in message:
+                return {'ok': False, 'error': 'upload needs "directory" or "files"'}
+            job = self.uploader.submit(message)
+            if message.get('wait'):
+                job.done.wait()
+            return job.response()
+        if op == 'status':
+            job = self.uploader.jobs.get(message.get('job'))
+            return job.response() if job else {'ok': False, 'error': f"Unknown job {message.get('job')}"}
+        if op == 'ping':
+            return self.uploader.stats()
+        if op == 'shutdown':
+            threading.Thread(target=self.shutdown).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unknown op {op!r}"}
+
+
+def _claim_socket(socket_path):
+    """Remove a stale socket file; exit if another daemon is listening on it."""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        request({'op': 'ping'}, socket_path, timeout=2)
+    except OSError:
+        os.unlink(socket_path)
+        return
+    print(f"Error: An upload daemon is already listening on {socket_path}")
+    sys.exit(1)
+
+
+def serve(daemon, socket_path=SOCKET_PATH):
+    """
+    Run the daemon until SIGINT/SIGTERM or a shutdown request; queued jobs are finished first.
+
+    Args:
+        daemon: UploadDaemon (not started)
+        socket_path: Unix socket to listen on (readable and writable by the owner only)
+    """
+    _claim_socket(socket_path)
+    daemon.start()
+    server = _UnixServer(socket_path, daemon)
+    os.chmod(socket_path, 0o600)
+
+    def stop(signum, frame):
+        print(f"\nReceived {signal.Signals(signum).name}, finishing queued jobs...")
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"✓ Listening for upload jobs on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+        daemon.stop()
+        print(f"\n✓ Upload daemon stopped after {daemon.jobs_done} job(s)")
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run the uploader as a daemon with a warm Snowflake session (submit jobs with upload_client.py)"
+    )
+    parser.add_argument('--socket', type=str, default=str(SOCKET_PATH),
+                        help='Unix socket to listen on (default: upload_daemon.sock next to this script)')
+    parser.add_argument('-s', '--stage', type=str, default='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS',
+                        help='Default target stage of jobs (default: RECEIPTS_PROCESSING_DB.RAW.RECEIPTS)')
+    parser.add_argument('--partition-by', choices=PARTITION_SCHEMES, default='none',
+                        help='Default stage prefix scheme of new files (default: none)')
+    parser.add_argument('--config', type=str, default=str(CONFIG_PATH),
+                        help='Connection configuration (default: config.json next to this script)')
+    parser.add_argument('--ledger', type=str, default=str(LEDGER_PATH),
+                        help='SQLite upload ledger (default: upload_ledger.db next to this script)')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Concurrent PUT statements per job (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('-p', '--parallel', type=int, default=DEFAULT_PARALLEL,
+                        help=f'PUT PARALLEL setting (default: {DEFAULT_PARALLEL})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Files per PUT batch above which more batches are used (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Adapt the concurrent PUTs to the observed latency and failures (AIMD), starting at -c')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Highest number of concurrent PUTs with --adaptive (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--max-bandwidth', type=float,
+                        help='Cap the upload bandwidth at this many MB/s by pacing PUTs (default: no cap)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Attempts per file for transient errors (default: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--no-refresh', action='store_true',
+                        help='Do not refresh the stage directory after uploading')
+    parser.add_argument('--prometheus', type=str, help='Rewrite this Prometheus textfile after every job')
+    parser.add_argument('--record-run', action='store_true',
+                        help='Insert a summary row per job into UPLOAD_RUNS for the cost dashboard')
+
+    args = parser.parse_args()
+
+    print(f"Loading configuration from {Path(args.config).name}...")
+    config = load_config(args.config)
+    print("✓ Configuration loaded successfully\n")
+
+    serve(UploadDaemon(config, args.stage, args.ledger, args.concurrency, args.parallel, args.batch_size,
+                       max_attempts=args.max_attempts, partition_by=args.partition_by, refresh=not args.no_refresh,
+                       prometheus_path=args.prometheus, record_run=args.record_run, adaptive=args.adaptive,
+                       max_concurrency=args.max_concurrency, max_bandwidth=args.max_bandwidth), args.socket)
+
+
+if __name__ == "__main__":
+    main()
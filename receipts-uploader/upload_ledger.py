@@ -0,0 +1,362 @@
+"""
+Local SQLite ledger of the receipt files uploaded to each Snowflake stage.
+
+The uploader diffs local files (by name, size and MD5) against the ledger
+instead of running LIST @stage on every invocation. The ledger is reconciled with a full
+LIST (read page by page) on its first use for a stage, when it is older
+than the reconcile interval, and on demand (upload_receipts.py --reconcile).
+With date-partitioned stages the periodic reconciliation lists only the
+recent partitions (LIST @stage/<yyyy/mm/dd>/).
+
+Stage paths are recorded as "@<stage>/<path in the stage>", for example
+"@RECEIPTS_PROCESSING_DB.RAW.RECEIPTS/2026/10/19/receipt_x.pdf".
+
+The ledger also holds the index of the uploaded receipts archived by
+receipt_retention.py (which archive each one is in, to restore it).
+"""
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+
+# Statuses of ledger entries; UPLOADED and SKIPPED (already on the stage) count as present
+STATUS_UPLOADED = 'UPLOADED'
+STATUS_SKIPPED = 'SKIPPED'
+STATUS_FAILED = 'FAILED'
+STATUS_MISSING = 'MISSING'  # recorded as uploaded, but absent from the last LIST
+STATUS_DUPLICATE = 'DUPLICATE'  # not uploaded: identical content is on the stage under another name
+STATUS_DEAD_LETTER = 'DEAD_LETTER'  # failed permanently; see dead_letters for the reason
+PRESENT_STATUSES = (STATUS_UPLOADED, STATUS_SKIPPED)
+# Statuses of local files whose content is on the stage, so the local copy may be archived
+ARCHIVABLE_STATUSES = (STATUS_UPLOADED, STATUS_SKIPPED, STATUS_DUPLICATE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    md5 TEXT,
+    stage_path TEXT,
+    uploaded_at TEXT,
+    status TEXT NOT NULL,
+    PRIMARY KEY (stage, name)
+);
+CREATE TABLE IF NOT EXISTS reconciliations (
+    stage TEXT PRIMARY KEY,
+    reconciled_at TEXT NOT NULL,
+    files INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER,
+    md5 TEXT,
+    reason TEXT NOT NULL,
+    failed_at TEXT NOT NULL,
+    PRIMARY KEY (stage, name)
+);
+CREATE TABLE IF NOT EXISTS hash_cache (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    md5 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archived_files (
+    name TEXT PRIMARY KEY,
+    archive TEXT NOT NULL,
+    member TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    md5 TEXT NOT NULL,
+    archived_at TEXT NOT NULL,
+    deleted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS archived_files_archive ON archived_files (archive);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def _parse_time(value):
+    """
+    Parse an upload time: ISO 8601 (recorded uploads), an RFC 2822 date or epoch seconds (LIST last_modified).
+
+    Returns:
+        Timezone-aware datetime, or None if the value cannot be parsed
+    """
+    if not value:
+        return None
+    for parse in (datetime.fromisoformat, parsedate_to_datetime,
+                  lambda text: datetime.fromtimestamp(float(text), timezone.utc)):
+        try:
+            parsed = parse(value)
+        except (TypeError, ValueError, OverflowError):
+            continue
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return None
+
+
+class UploadLedger:
+    """SQLite ledger of uploaded files, keyed by (stage, file name)."""
+
+    def __init__(self, path):
+        """
+        Open (or create) a ledger.
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = str(path)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def present_files(self, stage):
+        """
+        Files the ledger records as present on a stage.
+
+        Returns:
+            Dictionary name -> (size, md5); size and md5 are None when unknown
+        """
+        rows = self.conn.execute(
+            f"SELECT name, size, md5 FROM uploads "
+            f"WHERE stage = ? AND status IN ({','.join('?' * len(PRESENT_STATUSES))})",
+            (stage, *PRESENT_STATUSES)
+        )
+        return {name: (size, md5) for name, size, md5 in rows}
+
+    def stage_paths(self, stage):
+        """Stage paths of the files the ledger records as present on a stage: {name: stage_path}."""
+        rows = self.conn.execute(
+            f"SELECT name, stage_path FROM uploads "
+            f"WHERE stage = ? AND status IN ({','.join('?' * len(PRESENT_STATUSES))})",
+            (stage, *PRESENT_STATUSES)
+        )
+        return dict(rows)
+
+    def present_names(self, stage):
+        """Names of the files the ledger records as present on a stage."""
+        return set(self.present_files(stage))
+
+    def record(self, stage, entries):
+        """
+        Record upload results.
+
+        Args:
+            stage: Stage name
+            entries: Iterable of (name, size, md5, status) or (name, size, md5, status, stage_path);
+                size and md5 may be None (unknown, e.g. a file PUT skipped as already staged),
+                stage_path defaults to @<stage>/<name>
+        """
+        now = _now()
+        rows = []
+        for entry in entries:
+            name, size, md5, status = entry[:4]
+            stage_path = entry[4] if len(entry) > 4 else f"@{stage}/{name}"
+            rows.append((stage, name, size, md5, stage_path, now, status))
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO uploads (stage, name, size, md5, stage_path, uploaded_at, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (stage, name) DO UPDATE SET
+                    size = excluded.size,
+                    md5 = excluded.md5,
+                    stage_path = excluded.stage_path,
+                    uploaded_at = CASE WHEN excluded.status = 'UPLOADED'
+                                       THEN excluded.uploaded_at ELSE uploads.uploaded_at END,
+                    status = excluded.status
+                """,
+                rows
+            )
+            self.conn.executemany(
+                "DELETE FROM dead_letters WHERE stage = ? AND name = ?",
+                [(stage, row[1]) for row in rows if row[6] in PRESENT_STATUSES]
+            )
+
+    def dead_letter(self, stage, entries):
+        """
+        Record files that failed permanently, so they are not uploaded again until their content changes.
+
+        Args:
+            stage: Stage name
+            entries: Iterable of (name, size, md5, reason)
+        """
+        entries = list(entries)
+        now = _now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dead_letters (stage, name, size, md5, reason, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(stage, name, size, md5, reason, now) for name, size, md5, reason in entries]
+            )
+        self.record(stage, [(name, size, md5, STATUS_DEAD_LETTER) for name, size, md5, _ in entries])
+
+    def dead_letters(self, stage):
+        """Dead-lettered files of a stage: {name: (md5, reason, failed_at)}."""
+        rows = self.conn.execute("SELECT name, md5, reason, failed_at FROM dead_letters WHERE stage = ?", (stage,))
+        return {name: (md5, reason, failed_at) for name, md5, reason, failed_at in rows}
+
+    def clear_dead_letters(self, stage):
+        """Forget the dead-lettered files of a stage, so they are uploaded again; returns how many there were."""
+        with self.conn:
+            return self.conn.execute("DELETE FROM dead_letters WHERE stage = ?", (stage,)).rowcount
+
+    def load_hash_cache(self):
+        """Cached local file digests: {path: ((inode, mtime_ns, size), md5)} (see file_hashes.hash_files)."""
+        rows = self.conn.execute("SELECT path, inode, mtime_ns, size, md5 FROM hash_cache")
+        return {path: ((inode, mtime_ns, size), md5) for path, inode, mtime_ns, size, md5 in rows}
+
+    def save_hash_cache(self, cache, paths):
+        """Store the cached digests of the given paths."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hash_cache (path, inode, mtime_ns, size, md5) VALUES (?, ?, ?, ?, ?)",
+                [(path, *cache[path][0], cache[path][1]) for path in map(str, paths) if path in cache]
+            )
+
+    def forget_hash_cache(self, paths):
+        """Drop the cached digests of the given paths (files that were removed)."""
+        with self.conn:
+            self.conn.executemany("DELETE FROM hash_cache WHERE path = ?", [(str(path),) for path in paths])
+
+    def archivable_files(self, stage):
+        """
+        Files whose content the ledger records as on a stage, with their upload time.
+
+        Returns:
+            Dictionary name -> (md5, uploaded_at as an aware datetime or None when unknown);
+            md5 is None when unknown
+        """
+        rows = self.conn.execute(
+            f"SELECT name, md5, uploaded_at FROM uploads "
+            f"WHERE stage = ? AND status IN ({','.join('?' * len(ARCHIVABLE_STATUSES))})",
+            (stage, *ARCHIVABLE_STATUSES)
+        )
+        return {name: (md5, _parse_time(uploaded_at)) for name, md5, uploaded_at in rows}
+
+    def record_archived(self, entries):
+        """
+        Record receipts written to an archive.
+
+        Args:
+            entries: Iterable of (name, archive, member, size, md5); archive is relative to the archive directory
+        """
+        now = _now()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO archived_files (name, archive, member, size, md5, archived_at, deleted_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, NULL)",
+                [(*entry, now) for entry in entries]
+            )
+
+    def archived_files(self, names=None, archive=None):
+        """
+        Index entries of archived receipts, by name or by archive.
+
+        Args:
+            names: File names to look up, or None for all
+            archive: Only the receipts of this archive, or None
+
+        Returns:
+            Dictionary name -> (archive, member, size, md5, deleted_at); deleted_at is None while the archive exists
+        """
+        query = "SELECT name, archive, member, size, md5, deleted_at FROM archived_files"
+        params = ()
+        if archive is not None:
+            query += " WHERE archive = ?"
+            params = (archive,)
+        rows = self.conn.execute(query, params)
+        wanted = set(names) if names is not None else None
+        return {row[0]: row[1:] for row in rows if wanted is None or row[0] in wanted}
+
+    def live_archives(self):
+        """Archives the index has receipts in that were not deleted: {archive: receipts}."""
+        rows = self.conn.execute(
+            "SELECT archive, COUNT(*) FROM archived_files WHERE deleted_at IS NULL GROUP BY archive"
+        )
+        return dict(rows)
+
+    def expire_archive(self, archive):
+        """Mark the receipts of a deleted archive as no longer restorable; returns how many there were."""
+        with self.conn:
+            return self.conn.execute(
+                "UPDATE archived_files SET deleted_at = ? WHERE archive = ? AND deleted_at IS NULL",
+                (_now(), archive)
+            ).rowcount
+
+    def reconcile(self, stage, pages, prefix=None):
+        """
+        Replace what the ledger knows about a stage (or one prefix of it) with a listing.
+
+        Files listed are marked present (keeping their upload time); files the
+        ledger had as present but the listing does not contain are marked
+        MISSING so they are uploaded again. With a prefix only files recorded
+        under that prefix can be marked missing.
+
+        Args:
+            stage: Stage name
+            pages: Iterable of lists of LIST rows (name, size, md5, last_modified);
+                names are "<stage name>/<path in the stage>"
+            prefix: Path prefix in the stage that was listed (e.g. "2026/10/19"), or None for all of it
+
+        Returns:
+            Tuple (files listed, ledger entries marked missing)
+        """
+        listed = 0
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed (name TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM listed")
+            for page in pages:
+                rows = [(row[0].split('/')[-1], row[1], row[2], f"@{stage}/{row[0].split('/', 1)[-1]}", str(row[3]))
+                        for row in page]
+                self.conn.executemany(
+                    """
+                    INSERT INTO uploads (stage, name, size, md5, stage_path, uploaded_at, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'UPLOADED')
+                    ON CONFLICT (stage, name) DO UPDATE SET
+                        size = excluded.size,
+                        md5 = excluded.md5,
+                        stage_path = excluded.stage_path,
+                        uploaded_at = COALESCE(uploads.uploaded_at, excluded.uploaded_at),
+                        status = 'UPLOADED'
+                    """,
+                    [(stage, *row) for row in rows]
+                )
+                self.conn.executemany("INSERT OR IGNORE INTO listed VALUES (?)", [(row[0],) for row in rows])
+                listed += len(rows)
+
+            scope = f"@{stage}/{prefix.strip('/')}/%" if prefix else '%'
+            missing = self.conn.execute(
+                f"""
+                UPDATE uploads SET status = 'MISSING'
+                WHERE stage = ? AND status IN ({','.join('?' * len(PRESENT_STATUSES))})
+                  AND stage_path LIKE ? AND name NOT IN (SELECT name FROM listed)
+                """,
+                (stage, *PRESENT_STATUSES, scope)
+            ).rowcount
+            self.conn.execute(
+                "INSERT OR REPLACE INTO reconciliations (stage, reconciled_at, files) VALUES (?, ?, ?)",
+                (stage, _now(), listed)
+            )
+        return listed, missing
+
+    def last_reconciled(self, stage):
+        """Time of the last reconciliation of a stage (full or of recent partitions), or None."""
+        row = self.conn.execute("SELECT reconciled_at FROM reconciliations WHERE stage = ?", (stage,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    def needs_reconcile(self, stage, max_age_hours):
+        """Whether a stage was never reconciled or its last reconciliation is older than max_age_hours."""
+        reconciled_at = self.last_reconciled(stage)
+        return reconciled_at is None or datetime.now(timezone.utc) - reconciled_at > timedelta(hours=max_age_hours)
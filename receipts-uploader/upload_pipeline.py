@@ -0,0 +1,494 @@
+"""
+Asyncio upload pipeline: scan -> hash -> upload, connected by bounded queues.
+
+The scan stage lists the receipts directory, the hash stage MD5s files in
+worker threads (file_hashes.py) and compares them with the upload ledger, and
+the upload stage groups new and changed files into batches that are PUT
+through a pool of Snowflake connections, each PUT running in a worker thread.
+Scanning and hashing continue while PUTs are in flight; once every connection
+is busy the queues fill up and the earlier stages wait (backpressure).
+Files are batched per stage prefix (--partition-by), which the hash stage
+assigns in its worker threads. The prefixes of each finished batch are queued
+for a directory refresh (stage_refresh.py). With --adaptive the PUTs in
+flight are limited to the concurrency controller's limit (at most the pool
+size; see upload_concurrency.py), and --max-bandwidth paces PUT starts.
+
+With --watch the scan stage lists the directory once and then follows
+inotify events (via watchdog) for PDFs that are finished: closed after
+writing, or atomically renamed into place. The PUT sessions stay open, so a
+file is staged within about --flush-seconds of landing.
+
+Used by upload_receipts.py --pipeline and --watch.
+"""
+import os
+import time
+import shutil
+import signal
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from file_hashes import DEFAULT_HASH_WORKERS, hash_file
+from upload_receipts import (
+    DEFAULT_CONCURRENCY, DEFAULT_PARALLEL, connect_to_snowflake, classify_change, md5_index,
+    upload_batch, record_results, duplicate_entries, assign_prefixes
+)
+from upload_retry import DEFAULT_MAX_ATTEMPTS, backoff_delay, final_message, should_retry
+from upload_concurrency import ConcurrencyController
+
+
+# Files per PUT batch; small, so the first PUT starts while later files are still being hashed
+DEFAULT_PIPELINE_BATCH_SIZE = 50
+
+# A partial batch is uploaded once no file has arrived for this many seconds
+DEFAULT_FLUSH_SECONDS = 2.0
+
+# Capacity of each queue between stages
+DEFAULT_QUEUE_SIZE = 1000
+
+# Directory entries read per scandir step
+SCAN_CHUNK = 1000
+
+
+class ConnectionPool:
+    """Fixed-size pool of Snowflake connections shared by the upload workers."""
+
+    def __init__(self, config, size, keep_alive=False, telemetry=None):
+        """
+        Args:
+            config: Connection configuration (config.json)
+            size: Number of connections
+            keep_alive: Keep the sessions alive while idle (long-running watch mode)
+            telemetry: UploadTelemetry the connection setup times are recorded in, or None
+        """
+        self.config = config
+        self.size = size
+        self.keep_alive = keep_alive
+        self.telemetry = telemetry
+        self._connections = []
+        self._idle = asyncio.Queue()
+
+    def _connect(self):
+        start = time.perf_counter()
+        conn = connect_to_snowflake(self.config, self.keep_alive, quiet=True)
+        if self.telemetry:
+            self.telemetry.record_connect(time.perf_counter() - start)
+        return conn
+
+    async def open(self):
+        """Open all connections concurrently, each in a worker thread, and report them on one line."""
+        print(f"Opening {self.size} connection(s)...")
+        opened = await asyncio.gather(
+            *(asyncio.to_thread(self._connect) for _ in range(self.size)),
+            return_exceptions=True
+        )
+        self._connections = [conn for conn in opened if not isinstance(conn, BaseException)]
+        errors = [conn for conn in opened if isinstance(conn, BaseException)]
+        if errors:
+            self.close()
+            raise errors[0]
+        for conn in self._connections:
+            self._idle.put_nowait(conn)
+        target = f"to local stage {self.config['local_stage']['root']}" if self.config.get('local_stage') \
+            else f"as {self.config['user']} using key-pair authentication"
+        print(f"✓ Opened {len(self._connections)} connection(s) {target}")
+
+    async def acquire(self):
+        """Borrow a connection, waiting while all of them are busy."""
+        return await self._idle.get()
+
+    def release(self, conn):
+        """Return a borrowed connection."""
+        self._idle.put_nowait(conn)
+
+    def close(self):
+        for conn in self._connections:
+            conn.close()
+        self._connections = []
+
+
+def _is_receipt(path):
+    name = os.path.basename(path)
+    return name.endswith('.pdf') and not name.startswith('.')
+
+
+async def scan_directory(receipts_dir):
+    """
+    Yield the receipt PDFs of a directory, listing it in chunks off the event loop.
+
+    Args:
+        receipts_dir: Directory containing receipt PDFs
+
+    Yields:
+        Paths of PDF files (hidden files, such as batch directories, are skipped)
+    """
+    with os.scandir(receipts_dir) as entries:
+        while True:
+            chunk = await asyncio.to_thread(lambda: list(islice(entries, SCAN_CHUNK)))
+            if not chunk:
+                break
+            for entry in chunk:
+                if _is_receipt(entry.name) and entry.is_file():
+                    yield Path(entry.path)
+
+
+class _ReceiptEvents:
+    """watchdog event handler queueing finished receipt PDFs on the event loop."""
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+
+    def dispatch(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == 'closed':  # IN_CLOSE_WRITE: the writer is done with the file
+            path = event.src_path
+        elif event.event_type == 'moved':  # atomic rename into place
+            path = event.dest_path
+        else:
+            return
+        path = os.fsdecode(path)
+        if _is_receipt(path):
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, Path(path))
+
+
+async def watch_directory(receipts_dir):
+    """
+    Yield the receipt PDFs of a directory, then every PDF finished in it until SIGINT/SIGTERM.
+
+    Files already present are scanned first (events are collected meanwhile).
+    On the first SIGINT or SIGTERM the directory is scanned once more, so files
+    finished just before the signal are not missed, and the source ends; the
+    pipeline then uploads what is pending and returns.
+
+    Args:
+        receipts_dir: Directory containing receipt PDFs
+
+    Yields:
+        Paths of PDF files
+    """
+    from watchdog.observers import Observer  # only needed in watch mode
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    observer = Observer()
+    observer.schedule(_ReceiptEvents(loop, events), str(receipts_dir), recursive=False)
+    observer.start()
+
+    handlers_installed = False
+
+    def remove_handlers():
+        if handlers_installed:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+    def stop():
+        remove_handlers()  # a second signal stops at once
+        events.put_nowait(None)
+
+    try:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop)
+        handlers_installed = True
+    except NotImplementedError:  # Windows: Ctrl+C stops without draining
+        pass
+
+    try:
+        async for path in scan_directory(receipts_dir):
+            yield path
+        print(f"\nWatching {receipts_dir} for new receipts (Ctrl+C or SIGTERM to stop)...")
+        while (path := await events.get()) is not None:
+            yield path
+        print("\nStopping: uploading pending receipts...")
+        async for path in scan_directory(receipts_dir):
+            yield path
+    finally:
+        remove_handlers()
+        observer.stop()
+        observer.join()
+
+
+class UploadPipeline:
+    """Scan, hash and upload stages of one pipeline run, with their queues and results."""
+
+    def __init__(self, pool, ledger, stage_name, stage_files, hash_cache, batch_root,
+                 hash_workers=DEFAULT_HASH_WORKERS, batch_size=DEFAULT_PIPELINE_BATCH_SIZE,
+                 parallel=DEFAULT_PARALLEL, flush_seconds=DEFAULT_FLUSH_SECONDS, queue_size=DEFAULT_QUEUE_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, dead_letters=None, partition_by='none', telemetry=None,
+                 refresher=None, controller=None):
+        """
+        Args:
+            pool: Open ConnectionPool; its size bounds the PUTs in flight
+            ledger: UploadLedger the results are recorded in
+            stage_name: Target stage
+            stage_files: Dictionary name -> (size, md5) of the files on the stage (from the ledger)
+            hash_cache: Digest cache (see file_hashes.hash_files); updated in place
+            batch_root: Directory the batch directories are created in (on the receipts' file system)
+            hash_workers: Number of hashing threads
+            batch_size: Files per PUT
+            parallel: PUT PARALLEL setting
+            flush_seconds: Upload a partial batch after this long without new files
+            queue_size: Capacity of each queue between stages
+            max_attempts: Attempts per file before a transient failure is given up for this run
+            dead_letters: Dead-lettered files from the ledger, skipped unless changed
+            partition_by: Stage prefix scheme of new files (see upload_receipts.partition_prefix)
+            telemetry: UploadTelemetry the PUTs and retries are recorded in, or None
+            refresher: StageRefresher the prefixes of uploaded files are queued in, or None
+            controller: ConcurrencyController limiting the PUTs in flight, or None for the pool size
+        """
+        self.pool = pool
+        self.ledger = ledger
+        self.stage_name = stage_name
+        self.stage_files = stage_files
+        self.hash_cache = hash_cache
+        self.batch_root = Path(batch_root)
+        self.hash_workers = hash_workers
+        self.batch_size = batch_size
+        self.parallel = parallel
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        self.dead_letters = dead_letters or {}
+        self.partition_by = partition_by
+        self.telemetry = telemetry
+        self.refresher = refresher
+        self.controller = controller or ConcurrencyController(pool.size)
+
+        self.hash_queue = asyncio.Queue(queue_size)
+        self.upload_queue = asyncio.Queue(queue_size)
+        self.plan = {'new': [], 'changed': [], 'unchanged': [], 'duplicate': [], 'dead_letter': []}
+        self.results = {}
+        self.hashes = {}
+        self.hashed_count = 0
+        self.prefixes = {}
+        self._stage_paths = ledger.stage_paths(stage_name)
+        self._by_md5 = md5_index(stage_files)
+        self._batch_count = 0
+        self._attempts = {}
+        self._uploads = set()
+        self._in_flight = 0
+        self._slots = asyncio.Condition()
+        self._hash_executor = ThreadPoolExecutor(max_workers=hash_workers)
+        self._put_executor = ThreadPoolExecutor(max_workers=pool.size)
+
+    async def scan(self, source):
+        """Scan stage: feed the paths of an async iterable to the hash stage."""
+        async for path in source:
+            await self.hash_queue.put(path)
+        for _ in range(self.hash_workers):
+            await self.hash_queue.put(None)
+
+    async def _hash_worker(self):
+        loop = asyncio.get_running_loop()
+        while (path := await self.hash_queue.get()) is not None:
+            try:
+                size, md5, read = await loop.run_in_executor(self._hash_executor, hash_file, path, self.hash_cache)
+            except OSError as e:
+                print(f"  Warning: Could not read {path.name}: {e}")
+                continue
+            seen = str(path) in self.hashes
+            self.hashes[str(path)] = (size, md5)
+            self.hashed_count += read
+            kind, original = classify_change(path, size, md5, self.stage_files, self._by_md5, self.dead_letters)
+            if kind in ('unchanged', 'dead_letter') and seen:
+                continue  # another event for a file this run already handled
+            self.plan[kind].append((path, original) if kind == 'duplicate' else path)
+            if kind in ('new', 'changed'):
+                # Assume it is staged, so a later event for the same content is unchanged (undone on failure)
+                self.stage_files[path.name] = (size, md5)
+                try:
+                    prefixes = await loop.run_in_executor(
+                        self._hash_executor, assign_prefixes, [path], self.partition_by, self.stage_name,
+                        self._stage_paths
+                    )
+                except Exception as e:
+                    print(f"  Warning: Could not partition {path.name}, uploading it to the stage root: {e}")
+                    prefixes = {path.name: ''}
+                self.prefixes.update(prefixes)
+                await self.upload_queue.put((path, kind == 'changed', prefixes[path.name]))
+
+    async def hash_stage(self):
+        """Hash stage: hash files with hash_workers threads and queue new and changed ones for upload."""
+        await asyncio.gather(*(self._hash_worker() for _ in range(self.hash_workers)))
+        await self.upload_queue.put(None)
+
+    async def upload_stage(self):
+        """Upload stage: batch queued files by count or time and PUT each batch on a pooled connection."""
+        pending = {}  # (OVERWRITE setting, stage prefix) -> files
+        while True:
+            timeout = self.flush_seconds if pending else None
+            try:
+                item = await asyncio.wait_for(self.upload_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                item = ()
+            if not item:
+                for (overwrite, prefix), files in pending.items():
+                    await self._start_upload(files, overwrite, prefix)
+                pending = {}
+                if item is None:
+                    break
+                continue
+            path, overwrite, prefix = item
+            files = pending.setdefault((overwrite, prefix), [])
+            files.append(path)
+            if len(files) >= self.batch_size:
+                await self._start_upload(pending.pop((overwrite, prefix)), overwrite, prefix)
+        while self._uploads:  # including retries scheduled meanwhile
+            await asyncio.gather(*list(self._uploads))
+
+    def _track(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+
+    async def _start_upload(self, files, overwrite, prefix):
+        # Waiting for the concurrency limit and a free connection here is what holds back the earlier stages
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < self.controller.limit)
+            self._in_flight += 1
+        await asyncio.sleep(self.controller.reserve(sum(self.hashes[str(path)][0] for path in files)))
+        conn = await self.pool.acquire()
+        self._batch_count += 1
+        batch_dir = self.batch_root / f"batch_{self._batch_count:05d}"
+        self._track(self._upload(conn, files, batch_dir, overwrite, prefix))
+
+    async def _retry(self, files, overwrite, prefix, delay):
+        # Sleeps without holding a connection, so fresh batches keep uploading meanwhile
+        await asyncio.sleep(delay)
+        await self._start_upload(files, overwrite, prefix)
+
+    async def _upload(self, conn, files, batch_dir, overwrite, prefix):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self._put_executor, upload_batch, conn, files, batch_dir, self.stage_name, self.parallel, overwrite,
+                prefix, self.telemetry
+            )
+        finally:
+            self.pool.release(conn)
+            shutil.rmtree(batch_dir, ignore_errors=True)
+            seconds = time.perf_counter() - started
+            self._in_flight -= 1
+
+        retry, done = [], []
+        for path in files:
+            self._attempts[path.name] = attempts = self._attempts.get(path.name, 0) + 1
+            status, message = results[path.name]
+            if status == 'FAILED' and should_retry(message, attempts, self.max_attempts):
+                retry.append(path)
+            else:
+                done.append(path)
+                self.results[path.name] = (status, final_message(message, attempts) if status == 'FAILED' else message)
+                if status == 'FAILED' and self.stage_files.get(path.name) == self.hashes[str(path)]:
+                    del self.stage_files[path.name]
+        record_results(self.ledger, self.stage_name, done, self.hashes, self.results, self.prefixes)
+        uploaded = [path for path in files if results[path.name][0] == 'UPLOADED']
+        self.controller.record(seconds, sum(self.hashes[str(path)][0] for path in uploaded), len(retry))
+        async with self._slots:
+            self._slots.notify_all()
+        if self.refresher:
+            self.refresher.add([prefix or ''] * len(uploaded))
+
+        statuses = [status for status, _ in results.values()]
+        target = f" to {prefix}/" if prefix else ''
+        line = (f"  Batch {batch_dir.name[6:]}{target}{' (OVERWRITE)' if overwrite else ''}: {len(statuses)} file(s) - "
+                f"✓ {statuses.count('UPLOADED')} uploaded, "
+                f"⊘ {statuses.count('SKIPPED')} skipped, "
+                f"✗ {statuses.count('FAILED') - len(retry)} failed")
+        if retry:
+            delay = backoff_delay(max(self._attempts[path.name] for path in retry))
+            self._track(self._retry(retry, overwrite, prefix, delay))
+            if self.telemetry:
+                self.telemetry.record_retry(len(retry), delay)
+            line += f", ↻ {len(retry)} retrying in {delay:.1f}s"
+        if self.controller.adaptive:
+            line += f" [{self.controller.limit} in flight]"
+        print(line)
+
+    async def run(self, source):
+        """
+        Run all stages until the source is exhausted and every batch is uploaded.
+
+        Args:
+            source: Async iterable of local file paths
+        """
+        try:
+            await asyncio.gather(self.scan(source), self.hash_stage(), self.upload_stage())
+        finally:
+            self._hash_executor.shutdown()
+            self._put_executor.shutdown()
+            self.ledger.record(self.stage_name, duplicate_entries(
+                self.stage_name, self.plan['duplicate'], self.hashes, self.results,
+                self.ledger.stage_paths(self.stage_name)
+            ))
+            self.ledger.save_hash_cache(self.hash_cache, self.hashes)
+
+
+async def _run_pipeline(config, ledger, receipts_dir, stage_name, stage_files, concurrency, parallel,
+                        batch_size, hash_workers, flush_seconds, watch, max_attempts, dead_letters, partition_by,
+                        telemetry, refresher, controller):
+    pool = ConnectionPool(config, concurrency, keep_alive=watch, telemetry=telemetry)
+    await pool.open()
+    try:
+        with tempfile.TemporaryDirectory(prefix='.put_batches_', dir=receipts_dir) as tmp:
+            pipeline = UploadPipeline(pool, ledger, stage_name, stage_files, ledger.load_hash_cache(), tmp,
+                                      hash_workers, batch_size, parallel, flush_seconds,
+                                      max_attempts=max_attempts, dead_letters=dead_letters,
+                                      partition_by=partition_by, telemetry=telemetry, refresher=refresher,
+                                      controller=controller)
+            await pipeline.run(watch_directory(receipts_dir) if watch else scan_directory(receipts_dir))
+    finally:
+        pool.close()
+    return pipeline
+
+
+def run_pipeline(config, ledger, receipts_dir, stage_name, stage_files, concurrency=DEFAULT_CONCURRENCY,
+                 parallel=DEFAULT_PARALLEL, batch_size=DEFAULT_PIPELINE_BATCH_SIZE,
+                 hash_workers=DEFAULT_HASH_WORKERS, flush_seconds=DEFAULT_FLUSH_SECONDS, watch=False,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, dead_letters=None, partition_by='none', telemetry=None,
+                 refresher=None, controller=None):
+    """
+    Upload the new and changed receipts of a directory through the asyncio pipeline.
+
+    Args:
+        config: Connection configuration (config.json)
+        ledger: UploadLedger; results are recorded as each batch finishes
+        receipts_dir: Directory containing receipt PDFs
+        stage_name: Target stage
+        stage_files: Dictionary name -> (size, md5) of the files on the stage (from the ledger)
+        concurrency: Pooled connections, i.e. PUT statements in flight
+        parallel: PUT PARALLEL setting
+        batch_size: Files per PUT
+        hash_workers: Number of hashing threads
+        flush_seconds: Upload a partial batch after this long without new files
+        watch: Keep uploading receipts as they are finished until SIGINT/SIGTERM (see watch_directory)
+        max_attempts: Attempts per file before a transient failure is given up for this run
+        dead_letters: Dead-lettered files from the ledger (UploadLedger.dead_letters), skipped unless changed
+        partition_by: Stage prefix scheme of new files (see upload_receipts.partition_prefix)
+        telemetry: UploadTelemetry the connections, PUTs and retries are recorded in, or None
+        refresher: StageRefresher the prefixes of uploaded files are queued in, or None
+        controller: ConcurrencyController limiting the PUTs in flight (at most concurrency), or None
+
+    Returns:
+        Tuple (plan, results, seconds): plan as from upload_receipts.plan_changes,
+        results a dictionary file name -> (status, message)
+    """
+    print(f"\nRunning upload pipeline ({concurrency} pooled connections, {hash_workers} hash threads, "
+          f"{batch_size} files per PUT, PARALLEL={parallel})...")
+    start = time.perf_counter()
+    pipeline = asyncio.run(_run_pipeline(config, ledger, receipts_dir, stage_name, stage_files,
+                                         concurrency, parallel, batch_size, hash_workers, flush_seconds, watch,
+                                         max_attempts, dead_letters, partition_by, telemetry, refresher,
+                                         controller))
+    elapsed = max(time.perf_counter() - start, 1e-6)
+
+    plan = pipeline.plan
+    print(f"\n✓ Scanned {len(pipeline.hashes)} file(s), hashed {pipeline.hashed_count} "
+          f"({len(pipeline.hashes) - pipeline.hashed_count} unchanged since the last run, from cache)")
+    print(f"  {len(plan['new'])} new, {len(plan['changed'])} changed; "
+          f"{len(plan['unchanged'])} unchanged, {len(plan['duplicate'])} duplicate content, "
+          f"{len(plan['dead_letter'])} dead-lettered")
+    return plan, pipeline.results, elapsed
@@ -1,16 +1,41 @@
 """
 Upload receipt files from local receipts/ folder to Snowflake stage.
-Only uploads files that haven't been uploaded yet.
+Only uploads files that are new or changed (compared by size and MD5) according
+to a local SQLite upload ledger that is reconciled with LIST @stage only
+occasionally, in size-balanced batches with several wildcard PUT statements in
+flight. Files whose content is already on the stage under another name are skipped.
+Files can be written to partitioned stage prefixes (yyyy/mm/dd/ or v1/, v2/, ...)
+so listings, directory scans and refreshes can be limited to recent data.
+The directory table of the prefixes written is refreshed as batches finish,
+so RECEIPTS_STREAM sees new receipts seconds after their PUT.
 """
 import os
 import sys
+import functools
 import json
 import glob
+import time
+import heapq
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 import snowflake.connector
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import serialization
 
+from file_hashes import DEFAULT_HASH_WORKERS, hash_files
+from upload_ledger import UploadLedger, STATUS_FAILED, STATUS_DUPLICATE
+from upload_telemetry import UPLOAD_RUNS_TABLE, UploadTelemetry
+from stage_refresh import StageRefresher
+from upload_concurrency import DEFAULT_MAX_CONCURRENCY, ConcurrencyController
+from upload_retry import (
+    DEFAULT_MAX_ATTEMPTS, PERMANENT, STATEMENT_ERROR_PREFIX, backoff_delay, classify_failure, final_message,
+    should_retry
+)
+
 
 # Path to the config file (relative to this script)
 CONFIG_PATH = Path(__file__).parent / 'config.json'
@@ -18,6 +43,39 @@ CONFIG_PATH = Path(__file__).parent / 'config.json'
 # Path to the private key file (relative to this script)
 PRIVATE_KEY_PATH = Path(__file__).parent.parent / 'rsa_key.p8'
 
+# Local SQLite ledger of uploaded files (relative to this script)
+LEDGER_PATH = Path(__file__).parent / 'upload_ledger.db'
+
+# The ledger is reconciled with a full LIST when its last reconciliation is older than this
+DEFAULT_RECONCILE_HOURS = 24
+
+# Rows fetched per page while reading a LIST result
+LIST_PAGE_SIZE = 10000
+
+# Concurrent PUT statements, each on its own cursor
+DEFAULT_CONCURRENCY = 4
+
+# PUT PARALLEL option: upload threads per PUT statement (Snowflake allows 1-99)
+DEFAULT_PARALLEL = 8
+
+# Files per wildcard PUT batch above which more batches are planned
+DEFAULT_BATCH_SIZE = 500
+
+# Stage prefix schemes (--partition-by): the stage root, the file's UTC date (yyyy/mm/dd) or its receipt family
+PARTITION_SCHEMES = ('none', 'date', 'family')
+
+# With --partition-by date, the periodic reconciliation lists only the partitions of this many recent days
+DEFAULT_RECONCILE_DAYS = 2
+
+# Local receipt classifier and text-layer parser used by --classify and --local-parse
+EXTRACTION_DIR = Path(__file__).parent.parent / 'receipts.extraction'
+
+# Table the upload-time classifications are recorded in (same schema as the stage)
+CLASSIFICATIONS_TABLE = 'RECEIPT_CLASSIFICATIONS'
+
+# Temporary table the --local-parse JSONL is copied into before it is merged into parsed_receipts
+LOCAL_PARSE_TABLE = 'LOCAL_PARSED_RECEIPTS'
+
 
 def load_config(config_path):
     """Load configuration from config.json."""
@@ -33,8 +91,9 @@ def load_config(config_path):
         sys.exit(1)
 
 
+@functools.lru_cache(maxsize=None)
 def load_private_key(private_key_path):
-    """Load and parse the private key file."""
+    """Load and parse the private key file (once per process; later connections reuse it)."""
     try:
         with open(private_key_path, 'rb') as key_file:
             private_key = serialization.load_pem_private_key(
@@ -58,9 +117,28 @@ def load_private_key(private_key_path):
         sys.exit(1)
 
 
-def connect_to_snowflake(config):
-    """Connect to Snowflake using service account with key-pair authentication."""
-    print("Connecting to Snowflake...")
+def connect_to_snowflake(config, keep_alive=False, quiet=False):
+    """
+    Connect to Snowflake using service account with key-pair authentication.
+
+    A config with a "local_stage" section connects to the offline stand-in
+    of local_stage.py instead (benchmarks and tests without an account).
+
+    Args:
+        config: Connection configuration (config.json)
+        keep_alive: Keep the session alive while idle (long-running watch mode)
+        quiet: Skip the status lines (connections opened concurrently report once); errors are still printed
+    """
+    if config.get('local_stage'):
+        from local_stage import connect
+
+        conn = connect(**config['local_stage'])
+        if not quiet:
+            print(f"✓ Connected to local stage {config['local_stage']['root']}")
+        return conn
+
+    if not quiet:
+        print("Connecting to Snowflake...")
     
     # Load private key
     private_key = load_private_key(PRIVATE_KEY_PATH)
@@ -73,39 +151,200 @@ def connect_to_snowflake(config):
             warehouse=config.get('warehouse'),
             database=config.get('database'),
             schema=config.get('schema'),
-            role=config.get('role')
+            role=config.get('role'),
+            client_session_keep_alive=keep_alive
         )
-        print(f"✓ Connected as {config['user']} using key-pair authentication")
+        if not quiet:
+            print(f"✓ Connected as {config['user']} using key-pair authentication")
         return conn
     except Exception as e:
         print(f"Error connecting to Snowflake: {e}")
         sys.exit(1)
 
 
-def get_stage_files(conn, stage_name):
-    """Get list of files already in the Snowflake stage."""
-    print(f"\nChecking files in stage {stage_name}...")
-    
+def list_stage_files(conn, stage_name, page_size=LIST_PAGE_SIZE, prefix=None):
+    """
+    List the files in a Snowflake stage (or one prefix of it), page by page.
+
+    The LIST result is fetched in pages of page_size rows, so the ledger can
+    be reconciled without holding the whole listing in memory.
+
+    Args:
+        conn: Snowflake connection
+        stage_name: Stage to list
+        page_size: Rows per page
+        prefix: Path prefix in the stage to list (e.g. "2026/10/19"), or None for the whole stage
+
+    Yields:
+        Lists of LIST rows (name, size, md5, last_modified)
+    """
+    cursor = conn.cursor()
     try:
-        cursor = conn.cursor()
-        # List files in the stage
-        cursor.execute(f"LIST @{stage_name}")
-        
-        stage_files = set()
-        for row in cursor.fetchall():
-            # Row format: (name, size, md5, last_modified)
-            file_path = row[0]  # Full path in stage
-            # Extract just the filename
-            filename = file_path.split('/')[-1]
-            stage_files.add(filename)
-        
+        cursor.execute(f"LIST @{stage_target(stage_name, prefix)}")
+        while True:
+            page = cursor.fetchmany(page_size)
+            if not page:
+                break
+            yield page
+    finally:
         cursor.close()
-        print(f"✓ Found {len(stage_files)} file(s) in stage")
-        return stage_files
+
+
+def stage_target(stage_name, prefix=None):
+    """Stage location of a prefix: "<stage>" or "<stage>/<prefix>/"."""
+    return f"{stage_name}/{prefix.strip('/')}/" if prefix else stage_name
+
+
+def recent_date_prefixes(days=DEFAULT_RECONCILE_DAYS):
+    """Date partitions (yyyy/mm/dd, UTC) of the last days, newest first."""
+    today = datetime.now(timezone.utc).date()
+    return [(today - timedelta(days=n)).strftime('%Y/%m/%d') for n in range(days)]
+
+
+def reconcile_ledger(conn, ledger, stage_name, prefixes=None):
+    """
+    Reconcile the upload ledger with a LIST of the stage.
+
+    Args:
+        conn: Snowflake connection
+        ledger: UploadLedger
+        stage_name: Stage to list
+        prefixes: Path prefixes to list one by one (cost proportional to recent data), or None for a full LIST
+
+    Returns:
+        True if the ledger was reconciled, False if the stage could not be listed
+    """
+    targets = [f"@{stage_target(stage_name, prefix)}" for prefix in prefixes] if prefixes else [f"@{stage_name}"]
+    print(f"\nReconciling upload ledger with LIST {', '.join(targets)}...")
+    try:
+        listed = missing = 0
+        for prefix in prefixes or [None]:
+            counts = ledger.reconcile(stage_name, list_stage_files(conn, stage_name, prefix=prefix), prefix)
+            listed += counts[0]
+            missing += counts[1]
     except Exception as e:
         print(f"Warning: Could not list stage files: {e}")
-        print("Assuming stage is empty...")
-        return set()
+        print("Using the upload ledger as is (PUT still skips files already in the stage)")
+        return False
+    print(f"✓ Found {listed} file(s) in {'the listed partitions' if prefixes else 'stage'}")
+    if missing:
+        print(f"  {missing} file(s) recorded in the ledger are no longer in the stage and will be uploaded again")
+    return True
+
+
+def _known_md5(md5):
+    """Whether a stage MD5 is a plain content digest (multipart uploads report '<etag>-<parts>')."""
+    return bool(md5) and '-' not in md5
+
+
+def md5_index(stage_files):
+    """Map the plain MD5s of the files on a stage to their names (see plan_changes)."""
+    return {md5: name for name, (_, md5) in stage_files.items() if _known_md5(md5)}
+
+
+def classify_change(path, size, md5, stage_files, by_md5, dead_letters=None):
+    """
+    Compare one local file with the files on the stage (see plan_changes).
+
+    Args:
+        path: Local file path
+        size: File size in bytes
+        md5: File MD5 hex digest
+        stage_files: Dictionary name -> (size, md5) from the upload ledger
+        by_md5: md5_index() of the stage; new files are added as they are classified
+        dead_letters: Dictionary name -> (md5, reason, failed_at) from the upload ledger
+
+    Returns:
+        Tuple (kind, original): kind is 'new', 'changed', 'unchanged', 'duplicate' or
+        'dead_letter', original the name of the file with the same content for duplicates (else None)
+    """
+    if dead_letters and path.name in dead_letters and dead_letters[path.name][0] == md5:
+        return 'dead_letter', None
+    if path.name in stage_files:
+        stage_size, stage_md5 = stage_files[path.name]
+        if _known_md5(stage_md5):
+            same = stage_md5 == md5
+        else:
+            same = stage_size is None or stage_size == size
+        return ('unchanged' if same else 'changed'), None
+    if md5 in by_md5:
+        return 'duplicate', by_md5[md5]
+    by_md5[md5] = path.name
+    return 'new', None
+
+
+def plan_changes(local_files, hashes, stage_files, dead_letters=None):
+    """
+    Compare local files with the files on the stage by name, size and MD5.
+
+    A file whose name is on the stage is unchanged when its MD5 matches (or,
+    when the stage MD5 is unknown, its size matches) and changed otherwise. A
+    file whose name is not on the stage is a duplicate when identical content
+    is on the stage, or earlier in this run, under another name, and new otherwise.
+    Dead-lettered files are skipped until their content changes.
+
+    Args:
+        local_files: Local file paths
+        hashes: Dictionary path string -> (size, md5) from file_hashes.hash_files
+        stage_files: Dictionary name -> (size, md5) from the upload ledger
+        dead_letters: Dictionary name -> (md5, reason, failed_at) from the upload ledger
+
+    Returns:
+        Dictionary with lists 'new', 'changed', 'unchanged', 'dead_letter' (paths) and
+        'duplicate' ((path, name of the file with the same content) pairs)
+    """
+    plan = {'new': [], 'changed': [], 'unchanged': [], 'duplicate': [], 'dead_letter': []}
+    by_md5 = md5_index(stage_files)
+    for path in local_files:
+        kind, original = classify_change(path, *hashes[str(path)], stage_files, by_md5, dead_letters)
+        plan[kind].append((path, original) if kind == 'duplicate' else path)
+    return plan
+
+
+def record_results(ledger, stage_name, files, hashes, results, prefixes=None):
+    """
+    Record upload results in the ledger.
+
+    Failed files are not present and are retried on the next run, except
+    files that failed permanently (upload_retry.classify_failure), which are
+    dead-lettered with their reason. A SKIPPED file was already on the stage
+    under its name, with content unknown until the next reconcile.
+
+    Args:
+        prefixes: Dictionary file name -> stage prefix the file was uploaded to (default: the stage root)
+
+    Returns:
+        Number of dead-lettered files
+    """
+    dead = [f for f in files if results[f.name][0] == 'FAILED' and classify_failure(results[f.name][1]) == PERMANENT]
+    ledger.record(stage_name, [
+        (f.name, *(hashes[str(f)] if results[f.name][0] == 'UPLOADED' else (None, None)), results[f.name][0],
+         f"@{stage_name}/{stage_relative_path(f, prefixes)}")
+        for f in files if f not in dead
+    ])
+    ledger.dead_letter(stage_name, [(f.name, *hashes[str(f)], results[f.name][1]) for f in dead])
+    return len(dead)
+
+
+def duplicate_entries(stage_name, duplicates, hashes, results, stage_paths=None):
+    """
+    Ledger entries of skipped duplicates; duplicates of a file that failed to upload are retried with it.
+
+    Args:
+        stage_name: Target stage
+        duplicates: List of (path, name of the file with the same content) from plan_changes
+        hashes: Dictionary path string -> (size, md5)
+        results: Upload results of this run
+        stage_paths: Dictionary name -> stage path from the upload ledger, read after this run's uploads
+            were recorded, so each entry points at its original's partition (default: the stage root)
+    """
+    stage_paths = stage_paths or {}
+    return [
+        (path.name, *hashes[str(path)],
+         STATUS_FAILED if results.get(original, ('SKIPPED',))[0] == STATUS_FAILED else STATUS_DUPLICATE,
+         stage_paths.get(original) or f"@{stage_name}/{original}")
+        for path, original in duplicates
+    ]
 
 
 def get_local_receipts(receipts_dir='../receipts'):
@@ -123,107 +362,635 @@ def get_local_receipts(receipts_dir='../receipts'):
     return pdf_files
 
 
-def upload_file(conn, local_file, stage_name):
-    """Upload a single file to the Snowflake stage."""
+def plan_batches(files, batch_count, max_batch_files=DEFAULT_BATCH_SIZE):
+    """
+    Split files into batches of about equal total size.
+
+    Files are placed largest first into the batch with the fewest bytes so far,
+    so concurrent PUTs finish at about the same time.
+
+    Args:
+        files: Local file paths
+        batch_count: Minimum number of batches (usually the number of concurrent PUTs)
+        max_batch_files: Files per batch above which more batches are planned
+
+    Returns:
+        List of non-empty lists of paths
+    """
+    if not files:
+        return []
+    count = min(len(files), max(batch_count, -(-len(files) // max_batch_files)))
+    sizes = {path: os.path.getsize(path) for path in files}
+    bins = [(0, 0, i) for i in range(count)]  # (bytes, files, batch index)
+    batches = [[] for _ in range(count)]
+
+    for path in sorted(files, key=lambda p: sizes[p], reverse=True):
+        total, n, i = heapq.heappop(bins)
+        batches[i].append(path)
+        heapq.heappush(bins, (total + sizes[path], n + 1, i))
+    return batches
+
+
+def _stage_batch_directory(batch, batch_dir):
+    """
+    Link (or copy, across file systems) a batch of files into its own directory for one wildcard PUT.
+
+    Returns:
+        Dictionary file name -> error message of the files that could not be staged
+    """
+    batch_dir.mkdir()
+    errors = {}
+    for path in batch:
+        try:
+            os.link(path, batch_dir / path.name)
+        except OSError:
+            try:
+                shutil.copy2(path, batch_dir / path.name)
+            except OSError as e:
+                errors[path.name] = f"{type(e).__name__}: {e}"
+    return errors
+
+
+def upload_batch(conn, batch, batch_dir, stage_name, parallel=DEFAULT_PARALLEL, overwrite=False, prefix=None,
+                 telemetry=None):
+    """
+    Upload a batch of files with a single wildcard PUT on its own cursor.
+
+    Args:
+        conn: Snowflake connection (shared; each batch uses its own cursor)
+        batch: Local file paths
+        batch_dir: Empty directory path to stage the batch in
+        stage_name: Target stage
+        parallel: PUT PARALLEL setting (threads per PUT, 1-99)
+        overwrite: PUT OVERWRITE setting (True replaces changed files already on the stage)
+        prefix: Path prefix in the stage to upload to (e.g. "2026/10/19"), or None for the stage root
+        telemetry: UploadTelemetry the PUT is recorded in, or None
+
+    Returns:
+        Dictionary file name -> (status, message), status being
+        'UPLOADED', 'SKIPPED' or 'FAILED' (see upload_retry.classify_failure)
+    """
+    started = time.perf_counter()
+    results = {path.name: ('FAILED', 'no PUT result row') for path in batch}
     try:
+        errors = _stage_batch_directory(batch, batch_dir)
+        results.update((name, ('FAILED', message)) for name, message in errors.items())
+        if len(errors) == len(batch):
+            return results
         cursor = conn.cursor()
-        
-        # Convert to absolute path for PUT command
-        abs_path = os.path.abspath(local_file)
-        
-        # PUT command to upload file
-        put_sql = f"PUT file://{abs_path} @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=FALSE"
-        
-        cursor.execute(put_sql)
-        result = cursor.fetchone()
-        cursor.close()
-        
-        # Check result status
-        if result and 'UPLOADED' in str(result[6]).upper():
-            return True
-        elif result and 'SKIPPED' in str(result[6]).upper():
-            return 'SKIPPED'
-        else:
-            return False
-            
+        try:
+            cursor.execute(
+                f"PUT 'file://{batch_dir.as_posix()}/*' @{stage_target(stage_name, prefix)} "
+                f"AUTO_COMPRESS=FALSE OVERWRITE={'TRUE' if overwrite else 'FALSE'} PARALLEL={parallel}"
+            )
+            # Row format: (source, target, source_size, target_size, source_compression,
+            #              target_compression, status, message)
+            for row in cursor.fetchall():
+                status = str(row[6]).upper()
+                status = status if status in ('UPLOADED', 'SKIPPED') else 'FAILED'
+                results[row[0]] = (status, row[7] if len(row) > 7 else '')
+        finally:
+            cursor.close()
     except Exception as e:
-        print(f"  Error uploading {local_file.name}: {e}")
-        return False
+        results = {path.name: ('FAILED', f"{STATEMENT_ERROR_PREFIX}{type(e).__name__}: {e}") for path in batch}
+    if telemetry:
+        telemetry.record_batch(batch, results, started, time.perf_counter())
+    return results
+
+
+def upload_files(conn, files, stage_name, concurrency=DEFAULT_CONCURRENCY, parallel=DEFAULT_PARALLEL,
+                 batch_size=DEFAULT_BATCH_SIZE, overwrite=False, max_attempts=DEFAULT_MAX_ATTEMPTS, prefixes=None,
+                 telemetry=None, refresher=None, controller=None):
+    """
+    Upload files as size-balanced batches with concurrent wildcard PUTs.
+
+    Each batch is hard-linked into its own directory under a temporary
+    directory next to the files and uploaded with one
+    PUT 'file://<batch>/*' ... PARALLEL=<parallel> on its own cursor;
+    up to <concurrency> batches run at once, or as many as the concurrency
+    controller allows (upload_concurrency.py), which adapts the limit to the
+    PUT latency and failures and paces PUTs to a bandwidth cap. Files that
+    fail transiently are retried as new batches after an exponential backoff
+    with jitter, while the other batches keep uploading. Files going to
+    different stage prefixes are planned into separate batches. The prefixes
+    of each finished batch are handed to the refresher, so they appear in
+    the directory table while later batches upload.
+
+    Args:
+        conn: Snowflake connection
+        files: Local file paths (Path objects)
+        stage_name: Target stage
+        concurrency: Number of PUT statements in flight (without a controller)
+        parallel: PUT PARALLEL setting
+        batch_size: Files per batch above which more batches are planned
+        overwrite: PUT OVERWRITE setting
+        max_attempts: Attempts per file before a transient failure is given up for this run
+        prefixes: Dictionary file name -> stage prefix (see assign_prefixes; default: the stage root)
+        telemetry: UploadTelemetry the PUTs and retries are recorded in, or None
+        refresher: StageRefresher the prefixes of uploaded files are queued in, or None
+        controller: ConcurrencyController limiting the PUTs in flight, or None for a fixed <concurrency>
+
+    Returns:
+        Dictionary file name -> (status, message)
+    """
+    prefixes = prefixes or {}
+    controller = controller or ConcurrencyController(concurrency)
+    sizes = {path.name: path.stat().st_size for path in files}
+    by_prefix = {}
+    for path in files:
+        by_prefix.setdefault(prefixes.get(path.name, ''), []).append(path)
+    batches = deque(
+        batch for group in by_prefix.values()
+        for batch in plan_batches(group, max(1, controller.maximum * len(group) // len(files)), batch_size)
+    )
+    results = {}
+    attempts = {path.name: 0 for path in files}
+    retries = []  # heap of (time the retry is due, retry number, files)
+    batch_count = retry_count = 0
+    in_flight = (f"adaptive {controller.limit}-{controller.maximum}" if controller.adaptive
+                 else str(controller.limit))
+    print(f"Uploading {len(files)} {'changed' if overwrite else 'new'} file(s) in {len(batches)} batch(es) "
+          f"({in_flight} concurrent PUTs, PARALLEL={parallel}, OVERWRITE={'TRUE' if overwrite else 'FALSE'})...")
+
+    def put(batch, batch_dir, delay):
+        # Waits out the bandwidth cap, then PUTs; returns the results and the PUT's wall time
+        time.sleep(delay)
+        started = time.perf_counter()
+        batch_results = upload_batch(conn, batch, batch_dir, stage_name, parallel, overwrite,
+                                     prefixes.get(batch[0].name), telemetry)
+        return batch_results, time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory(prefix='.put_batches_', dir=files[0].parent) as tmp, \
+            ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        def submit(batch):
+            nonlocal batch_count
+            batch_count += 1
+            batch_dir = Path(tmp) / f"batch_{batch_count:05d}"
+            delay = controller.reserve(sum(sizes[path.name] for path in batch))
+            return executor.submit(put, batch, batch_dir, delay)
+
+        futures = {}
+        while batches or futures or retries:
+            # Retries go first, then fresh batches, as far as the current limit allows
+            while retries and retries[0][0] <= time.monotonic():
+                batches.appendleft(heapq.heappop(retries)[2])
+            while batches and len(futures) < controller.limit:
+                batch = batches.popleft()
+                futures[submit(batch)] = batch
+            timeout = max(retries[0][0] - time.monotonic(), 0) if retries else None
+            if not futures:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = futures.pop(future)
+                batch_results, seconds = future.result()
+                retry = []
+                for path in batch:
+                    attempts[path.name] += 1
+                    status, message = batch_results[path.name]
+                    if status == 'FAILED' and should_retry(message, attempts[path.name], max_attempts):
+                        retry.append(path)
+                    else:
+                        results[path.name] = (status, final_message(message, attempts[path.name])
+                                              if status == 'FAILED' else message)
+                uploaded = [name for name, (status, _) in batch_results.items() if status == 'UPLOADED']
+                controller.record(seconds, sum(sizes[name] for name in uploaded), len(retry))
+                if refresher:
+                    refresher.add([prefixes.get(name, '') for name in uploaded])
+                statuses = [status for status, _ in batch_results.values()]
+                line = (f"  Batch ({len(results)}/{len(files)} files done): {len(statuses)} file(s) - "
+                        f"✓ {statuses.count('UPLOADED')} uploaded, "
+                        f"⊘ {statuses.count('SKIPPED')} skipped, "
+                        f"✗ {statuses.count('FAILED') - len(retry)} failed")
+                if retry:
+                    delay = backoff_delay(max(attempts[path.name] for path in retry))
+                    retry_count += 1
+                    heapq.heappush(retries, (time.monotonic() + delay, retry_count, retry))
+                    if telemetry:
+                        telemetry.record_retry(len(retry), delay)
+                    line += f", ↻ {len(retry)} retrying in {delay:.1f}s"
+                if controller.adaptive:
+                    line += f" [{controller.limit} in flight]"
+                print(line)
+    return results
+
+
+def _extraction_modules():
+    """Make receipts.extraction importable (its modules need pymupdf)."""
+    if str(EXTRACTION_DIR) not in sys.path:
+        sys.path.append(str(EXTRACTION_DIR))
+
+
+def _schema_prefix(stage_name):
+    """Database and schema of a stage name as a prefix for table names ("DB.SCHEMA." or "")."""
+    return stage_name.rsplit('.', 1)[0] + '.' if '.' in stage_name else ''
+
+
+def stage_relative_path(path, prefixes=None):
+    """Path of an uploaded file in the stage (DIRECTORY relative_path): "<prefix>/<name>" or "<name>"."""
+    prefix = (prefixes or {}).get(path.name)
+    return f"{prefix}/{path.name}" if prefix else path.name
+
+
+def _family_prefix(path):
+    _extraction_modules()
+    from classifier import classify_pdf
+
+    return classify_pdf(str(path), path.name)[0]['family']
+
+
+def partition_prefix(path, scheme, upload_date=None):
+    """
+    Stage prefix a new file is uploaded to.
+
+    Date partitions follow the upload, not the file's modification time, so a
+    late-uploaded or restored receipt lands in a recent partition, where the
+    --reconcile-days listing and the recent_days refresh and scans look.
+
+    Args:
+        path: Local file path
+        scheme: 'none', 'date' (the upload date in UTC, yyyy/mm/dd)
+            or 'family' (v1, v2 or unknown, from the first page; requires pymupdf)
+        upload_date: UTC datetime of the upload plan (default: now)
+
+    Returns:
+        Prefix without slashes at the ends, '' for the stage root
+    """
+    if scheme == 'date':
+        return (upload_date or datetime.now(timezone.utc)).strftime('%Y/%m/%d')
+    if scheme == 'family':
+        return _family_prefix(path)
+    return ''
+
+
+def existing_prefix(stage_name, stage_path):
+    """Prefix of a file already on the stage, from its ledger stage path (None when unknown)."""
+    if not stage_path or not stage_path.startswith(f"@{stage_name}/"):
+        return None
+    return stage_path[len(stage_name) + 2:].rpartition('/')[0]
+
+
+def assign_prefixes(files, scheme, stage_name, stage_paths):
+    """
+    Stage prefixes of files to upload; changed files stay in the partition they are in.
+
+    New files of one plan share its UTC date as their date partition. The
+    prefixes become the files' stage paths in the ledger (record_results), so
+    a prefix-scoped reconcile finds each file under the partition it was
+    uploaded to.
+
+    Args:
+        files: Local file paths
+        scheme: Partition scheme (see partition_prefix)
+        stage_name: Target stage
+        stage_paths: Dictionary name -> stage path from the upload ledger
 
+    Returns:
+        Dictionary file name -> prefix ('' for the stage root)
+    """
+    upload_date = datetime.now(timezone.utc)
+    prefixes = {}
+    for path in files:
+        prefix = existing_prefix(stage_name, stage_paths.get(path.name))
+        prefixes[path.name] = prefix if prefix is not None else partition_prefix(path, scheme, upload_date)
+    return prefixes
 
-def upload_receipts(config, receipts_dir='../receipts', stage_name='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS'):
+
+def record_classifications(conn, files, stage_name, prefixes=None):
+    """
+    Classify uploaded receipts locally and record them for the extraction step.
+
+    Each page is tagged v1, v2 or unknown (with its vendor where known), so the
+    parse_and_complete pipeline can send it to the matching prompt and schema
+    without waiting for CLASSIFY_RECEIPT to run on the parsed text.
+
+    Args:
+        conn: Snowflake connection
+        files: Local paths of the uploaded PDFs
+        stage_name: Stage the files were uploaded to (the table is created in its schema)
+        prefixes: Dictionary file name -> stage prefix (see assign_prefixes)
+
+    Returns:
+        Dictionary of page counts per family
+    """
+    _extraction_modules()
+    from classifier import classify_pdf
+
+    table = f"{_schema_prefix(stage_name)}{CLASSIFICATIONS_TABLE}"
+
+    rows = []
+    counts = {}
+    for file_path in files:
+        for record in classify_pdf(str(file_path), stage_relative_path(file_path, prefixes)):
+            rows.append((record['relative_path'], record['family'], record['vendor_name']))
+            counts[record['family']] = counts.get(record['family'], 0) + 1
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                relative_path STRING,
+                family STRING,
+                vendor_name STRING,
+                classified_by STRING,
+                classified_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            )
+        """)
+        cursor.executemany(
+            f"INSERT INTO {table} (relative_path, family, vendor_name, classified_by) "
+            f"VALUES (%s, %s, %s, 'upload')",
+            rows
+        )
+    finally:
+        cursor.close()
+    return counts
+
+
+def load_local_parse(conn, files, stage_name, workers=None, prefixes=None):
+    """
+    Parse uploaded receipts from their text layer and bulk-load them into parsed_receipts.
+
+    The layout-preserving text is rendered in a process pool
+    (receipts.extraction/layout_text.py), written to one JSONL file and loaded
+    with a single PUT + COPY INTO, so the parse_and_complete pipeline skips
+    AI_PARSE_DOCUMENT for these receipts. Pages without a text layer are left
+    for AI_PARSE_DOCUMENT; receipts already in parsed_receipts are not loaded
+    again (a NOT EXISTS probe per path, as in the pipeline's parse step).
+
+    Args:
+        conn: Snowflake connection
+        files: Local paths of the uploaded PDFs
+        stage_name: Stage the files were uploaded to (parsed_receipts lives in its schema)
+        workers: Number of parser processes (default: CPU count)
+        prefixes: Dictionary file name -> stage prefix (see assign_prefixes)
+
+    Returns:
+        Tuple (rows inserted, seconds spent parsing locally)
+    """
+    _extraction_modules()
+    from layout_text import parse_files
+
+    start = time.perf_counter()
+    records = parse_files([(str(file_path), stage_relative_path(file_path, prefixes)) for file_path in files], workers)
+    elapsed = time.perf_counter() - start
+    if not records:
+        return 0, elapsed
+
+    schema = _schema_prefix(stage_name)
+    staging = f"{schema}{LOCAL_PARSE_TABLE}"
+    table_stage = f"@{schema}%{LOCAL_PARSE_TABLE}"
+    cursor = conn.cursor()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            jsonl_path = Path(tmp) / 'parsed_receipts.jsonl'
+            with open(jsonl_path, 'w') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {schema}parsed_receipts (
+                    relative_path STRING,
+                    content STRING
+                )
+            """)
+            cursor.execute(f"CREATE OR REPLACE TEMPORARY TABLE {staging} (record VARIANT)")
+            cursor.execute(f"PUT file://{jsonl_path.as_posix()} {table_stage} AUTO_COMPRESS=TRUE")
+            cursor.execute(f"COPY INTO {staging} FROM {table_stage} FILE_FORMAT = (TYPE = JSON)")
+        cursor.execute(f"""
+            INSERT INTO {schema}parsed_receipts (relative_path, content)
+            SELECT t.record:relative_path::STRING, t.record:content::STRING
+            FROM {staging} t
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {schema}parsed_receipts p WHERE p.relative_path = t.record:relative_path::STRING
+            )
+        """)
+        inserted = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    finally:
+        cursor.close()
+    return inserted, elapsed
+
+
+def write_telemetry(telemetry, conn, stage_name, report_path=None, prometheus_path=None, record_run=False):
+    """
+    Write the run report of an upload run; failures are reported as warnings.
+
+    Args:
+        telemetry: UploadTelemetry of the run (finished here if it is not yet)
+        conn: Snowflake connection, for record_run
+        stage_name: Target stage (the runs table is created in its schema)
+        report_path: JSON report file, or None
+        prometheus_path: Prometheus textfile, or None
+        record_run: Insert a summary row into UPLOAD_RUNS
+    """
+    if telemetry.finished_at is None:
+        telemetry.finish()
+    outputs = [
+        (report_path, lambda: telemetry.write_json(report_path), f"run report to {report_path}"),
+        (prometheus_path, lambda: telemetry.write_prometheus(prometheus_path), f"metrics to {prometheus_path}"),
+        (record_run, lambda: telemetry.insert_run(conn, f"{_schema_prefix(stage_name)}{UPLOAD_RUNS_TABLE}"),
+         f"run summary to {UPLOAD_RUNS_TABLE}"),
+    ]
+    for enabled, write, description in outputs:
+        if not enabled:
+            continue
+        try:
+            write()
+            print(f"✓ Wrote {description}")
+        except Exception as e:
+            print(f"Warning: Could not write {description}: {e}")
+
+
+def upload_receipts(config, receipts_dir='../receipts', stage_name='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS',
+                    classify=False, local_parse=False, workers=None,
+                    concurrency=DEFAULT_CONCURRENCY, parallel=DEFAULT_PARALLEL, batch_size=None,
+                    ledger_path=LEDGER_PATH, reconcile=False, reconcile_hours=DEFAULT_RECONCILE_HOURS,
+                    hash_workers=DEFAULT_HASH_WORKERS, pipeline=False,
+                    watch=False, flush_seconds=None, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_dead_letters=False,
+                    partition_by='none', reconcile_days=DEFAULT_RECONCILE_DAYS,
+                    report_path=None, prometheus_path=None, record_run=False, refresh=True,
+                    adaptive=False, max_concurrency=DEFAULT_MAX_CONCURRENCY, max_bandwidth=None):
     """Main function to upload receipts to Snowflake stage."""
     print("=" * 70)
     print("Receipt Uploader - Snowflake Stage")
     print("=" * 70)
     
     # Connect to Snowflake
-    conn = connect_to_snowflake(config)
+    telemetry = UploadTelemetry(stage_name, 'watch' if watch else 'pipeline' if pipeline else 'batch')
+    start = time.perf_counter()
+    conn = connect_to_snowflake(config, keep_alive=watch)
+    telemetry.record_connect(time.perf_counter() - start)
+    ledger = UploadLedger(ledger_path)
+    
+    # Refresh the directory table of the prefixes written as each batch finishes, so the stream sees new files
+    refresher = StageRefresher(conn, stage_name, telemetry) if refresh else None
+    
+    # PUTs in flight: -c, or adapted between 1 and --max-concurrency (the pool size with --pipeline/--watch)
+    controller = ConcurrencyController(
+        concurrency, adaptive, concurrency if pipeline or watch else max_concurrency,
+        max_bytes_per_sec=max_bandwidth * 1024 * 1024 if max_bandwidth else None, telemetry=telemetry
+    )
     
     try:
-        # Get local receipt files
-        local_files = get_local_receipts(receipts_dir)
-        
-        if not local_files:
-            print("\nNo receipt files found to upload.")
-            return
-        
-        # Get files already in stage
-        stage_files = get_stage_files(conn, stage_name)
+        # Reconcile the ledger with LIST on demand, on first use and when it is stale; with date
+        # partitions a stale ledger only lists the recent days' prefixes
+        if reconcile or ledger.last_reconciled(stage_name) is None:
+            reconcile_ledger(conn, ledger, stage_name)
+        elif ledger.needs_reconcile(stage_name, reconcile_hours):
+            reconcile_ledger(conn, ledger, stage_name,
+                             recent_date_prefixes(reconcile_days) if partition_by == 'date' else None)
         
-        # Determine which files need to be uploaded
-        files_to_upload = []
-        for local_file in local_files:
-            if local_file.name not in stage_files:
-                files_to_upload.append(local_file)
+        # Get files already in stage (from the ledger, not LIST)
+        stage_files = ledger.present_files(stage_name)
+        print(f"\n✓ Upload ledger records {len(stage_files)} file(s) in stage {stage_name}")
         
-        print(f"\n{'=' * 70}")
-        print(f"Files to upload: {len(files_to_upload)} of {len(local_files)}")
-        print(f"{'=' * 70}\n")
-        
-        if not files_to_upload:
-            print("✓ All files are already uploaded to the stage!")
-            return
+        # Files that failed permanently are skipped until their content changes
+        if retry_dead_letters:
+            print(f"✓ Cleared {ledger.clear_dead_letters(stage_name)} dead-lettered file(s); uploading them again")
+        dead_letters = ledger.dead_letters(stage_name)
+        if dead_letters:
+            print(f"  {len(dead_letters)} dead-lettered file(s) are skipped unless changed "
+                  f"(--retry-dead-letters to upload them again)")
         
-        # Upload files
-        uploaded_count = 0
-        skipped_count = 0
-        failed_count = 0
-        
-        for i, file_path in enumerate(files_to_upload, 1):
-            print(f"Uploading ({i}/{len(files_to_upload)}): {file_path.name}...", end=' ')
+        if pipeline or watch:
+            # Scan, hash and upload concurrently; results are recorded as each batch finishes
+            from upload_pipeline import DEFAULT_PIPELINE_BATCH_SIZE, DEFAULT_FLUSH_SECONDS, run_pipeline
+            
+            if not Path(receipts_dir).exists():
+                print(f"Error: Receipts directory not found: {receipts_dir}")
+                return
+            plan, results, elapsed = run_pipeline(config, ledger, receipts_dir, stage_name, stage_files,
+                                                  concurrency, parallel, batch_size or DEFAULT_PIPELINE_BATCH_SIZE,
+                                                  hash_workers, flush_seconds or DEFAULT_FLUSH_SECONDS, watch,
+                                                  max_attempts, dead_letters, partition_by, telemetry, refresher,
+                                                  controller)
+            files_to_upload = plan['new'] + plan['changed']
+            if not files_to_upload:
+                print("\n✓ All files are already uploaded to the stage!")
+                return
+        else:
+            # Get local receipt files
+            local_files = get_local_receipts(receipts_dir)
+            
+            if not local_files:
+                print("\nNo receipt files found to upload.")
+                return
+            
+            # Hash local files (unchanged files are served from the ledger's hash cache)
+            hash_cache = ledger.load_hash_cache()
+            start = time.perf_counter()
+            hashes, hashed_count = hash_files(local_files, hash_cache, hash_workers)
+            ledger.save_hash_cache(hash_cache, local_files)
+            print(f"✓ Hashed {hashed_count} file(s) in {time.perf_counter() - start:.1f}s "
+                  f"({len(local_files) - hashed_count} unchanged since the last run, from cache)")
             
-            result = upload_file(conn, file_path, stage_name)
+            # Determine which files need to be uploaded
+            plan = plan_changes(local_files, hashes, stage_files, dead_letters)
+            files_to_upload = plan['new'] + plan['changed']
             
-            if result is True:
-                print("✓ UPLOADED")
-                uploaded_count += 1
-            elif result == 'SKIPPED':
-                print("⊘ SKIPPED (already exists)")
-                skipped_count += 1
-            else:
-                print("✗ FAILED")
-                failed_count += 1
+            print(f"\n{'=' * 70}")
+            print(f"Files to upload: {len(files_to_upload)} of {len(local_files)} "
+                  f"({len(plan['new'])} new, {len(plan['changed'])} changed; "
+                  f"{len(plan['unchanged'])} unchanged, {len(plan['duplicate'])} duplicate content, "
+                  f"{len(plan['dead_letter'])} dead-lettered)")
+            print(f"{'=' * 70}\n")
+            
+            if not files_to_upload:
+                ledger.record(stage_name, duplicate_entries(stage_name, plan['duplicate'], hashes, {},
+                                                            ledger.stage_paths(stage_name)))
+                print("✓ All files are already uploaded to the stage!")
+                return
+            
+            # Upload files in size-balanced batches, several PUTs at a time; changed files replace the staged ones
+            # in their partition, new files go to the prefix of the --partition-by scheme
+            batch_size = batch_size or DEFAULT_BATCH_SIZE
+            start = time.perf_counter()
+            prefixes = assign_prefixes(files_to_upload, partition_by, stage_name, ledger.stage_paths(stage_name))
+            results = {}
+            if plan['new']:
+                results.update(upload_files(conn, plan['new'], stage_name, concurrency, parallel, batch_size,
+                                            max_attempts=max_attempts, prefixes=prefixes, telemetry=telemetry,
+                                            refresher=refresher, controller=controller))
+            if plan['changed']:
+                results.update(upload_files(conn, plan['changed'], stage_name, concurrency, parallel, batch_size,
+                                            overwrite=True, max_attempts=max_attempts, prefixes=prefixes,
+                                            telemetry=telemetry, refresher=refresher, controller=controller))
+            elapsed = max(time.perf_counter() - start, 1e-6)
+            
+            # Record the results; failed files are retried on the next run, permanent failures dead-lettered
+            record_results(ledger, stage_name, files_to_upload, hashes, results, prefixes)
+            ledger.record(stage_name, duplicate_entries(stage_name, plan['duplicate'], hashes, results,
+                                                        ledger.stage_paths(stage_name)))
+        
+        if refresher:
+            refresher.close()
+        uploaded_files = [f for f in files_to_upload if results[f.name][0] == 'UPLOADED']
+        uploaded_count = len(uploaded_files)
+        skipped_count = sum(1 for status, _ in results.values() if status == 'SKIPPED')
+        failed = {name: classify_failure(message) for name, (status, message) in results.items() if status == 'FAILED'}
+        failed_count = len(failed)
+        dead_lettered_count = sum(1 for kind in failed.values() if kind == PERMANENT)
+        uploaded_mb = sum(f.stat().st_size for f in uploaded_files) / (1024 * 1024)
+        stage_paths = ledger.stage_paths(stage_name)
+        prefixes = {f.name: existing_prefix(stage_name, stage_paths.get(f.name)) for f in uploaded_files}
+        partitions = sorted({prefix for prefix in prefixes.values() if prefix})
+        
+        for name, kind in sorted(failed.items()):
+            print(f"  ✗ FAILED ({kind}) {name}: {results[name][1]}")
         
         # Summary
         print(f"\n{'=' * 70}")
         print("Upload Summary:")
         print(f"  Uploaded: {uploaded_count}")
         print(f"  Skipped:  {skipped_count}")
-        print(f"  Failed:   {failed_count}")
+        print(f"  Failed:   {failed_count} ({dead_lettered_count} dead-lettered, "
+              f"{failed_count - dead_lettered_count} retried next run)")
+        print(f"  Changed:  {len(plan['changed'])} (re-uploaded with OVERWRITE=TRUE)")
+        print(f"  Duplicate content skipped: {len(plan['duplicate'])}")
+        if partitions:
+            print(f"  Partitions: {', '.join(partitions)}")
+        if refresher and (refresher.refreshes or refresher.failures):
+            print(f"  Refreshed: {refresher.refreshes} directory refresh(es), {refresher.failures} failed "
+                  f"(the REFRESH_RECEIPTS_STAGE task picks up the rest)")
         print(f"  Total:    {len(files_to_upload)}")
+        print(f"  Time:     {elapsed:.1f}s ({uploaded_count / elapsed:.1f} files/sec, "
+              f"{uploaded_mb / elapsed:.2f} MB/sec)")
+        telemetry.finish()
+        telemetry.print_summary()
         print(f"{'=' * 70}")
         
         # Verify upload
         if uploaded_count > 0:
-            print("\nVerifying stage contents...")
-            cursor = conn.cursor()
-            cursor.execute(f"LIST @{stage_name}")
-            total_in_stage = len(cursor.fetchall())
-            cursor.close()
-            print(f"✓ Total files in stage: {total_in_stage}")
+            print(f"\n✓ Total files in stage (upload ledger): {len(ledger.present_names(stage_name))}")
+        
+        # Tag the new receipts v1/v2/unknown so extraction can pick the right prompt
+        if classify and uploaded_files:
+            print("\nClassifying uploaded receipts...")
+            try:
+                counts = record_classifications(conn, uploaded_files, stage_name, prefixes)
+                summary = ', '.join(f"{family}: {count}" for family, count in sorted(counts.items()))
+                print(f"✓ Recorded {sum(counts.values())} classification(s) ({summary})")
+            except Exception as e:
+                print(f"Warning: Could not record classifications: {e}")
+                print("RUN_RECEIPTS_EXTRACTION will classify these receipts with CLASSIFY_RECEIPT instead")
+        
+        # Load the text layer as parsed_receipts rows so the extraction run skips AI_PARSE_DOCUMENT for them
+        if local_parse and uploaded_files:
+            print("\nParsing uploaded receipts locally...")
+            try:
+                inserted, elapsed = load_local_parse(conn, uploaded_files, stage_name, workers, prefixes)
+                print(f"✓ Loaded {inserted} parsed receipt(s) into parsed_receipts "
+                      f"(parsed locally in {elapsed:.1f}s)")
+            except Exception as e:
+                print(f"Warning: Could not load locally parsed receipts: {e}")
+                print("RUN_RECEIPTS_EXTRACTION will parse these receipts with AI_PARSE_DOCUMENT instead")
         
     finally:
+        if refresher:
+            refresher.close()
+        write_telemetry(telemetry, conn, stage_name, report_path, prometheus_path, record_run)
+        ledger.close()
         conn.close()
         print("\n✓ Connection closed")
 
@@ -235,6 +1002,13 @@ def main():
     parser = argparse.ArgumentParser(
         description="Upload receipt PDFs from local folder to Snowflake stage"
     )
+    parser.add_argument(
+        '--config',
+        type=str,
+        default=str(CONFIG_PATH),
+        help='Connection configuration (default: config.json next to this script; '
+             'see config.local.template.json for the offline local stage)'
+    )
     parser.add_argument(
         '-d', '--directory',
         type=str,
@@ -247,29 +1021,178 @@ def main():
         default='RECEIPTS_PROCESSING_DB.RAW.RECEIPTS',
         help='Snowflake stage name (default: RECEIPTS_PROCESSING_DB.RAW.RECEIPTS)'
     )
+    parser.add_argument(
+        '-c', '--concurrency',
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f'Number of concurrent PUT statements (default: {DEFAULT_CONCURRENCY})'
+    )
+    parser.add_argument(
+        '-p', '--parallel',
+        type=int,
+        default=DEFAULT_PARALLEL,
+        help=f'PUT PARALLEL setting, upload threads per PUT, 1-99 (default: {DEFAULT_PARALLEL})'
+    )
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='Adapt the number of concurrent PUTs to the observed latency and failures (AIMD), starting at -c '
+             'and up to --max-concurrency (with --pipeline/--watch, up to -c)'
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f'Highest number of concurrent PUTs with --adaptive (default: {DEFAULT_MAX_CONCURRENCY})'
+    )
+    parser.add_argument(
+        '--max-bandwidth',
+        type=float,
+        help='Cap the upload bandwidth at this many MB/s by pacing PUTs (default: no cap)'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        help=f'Files per PUT batch above which more batches are used (default: {DEFAULT_BATCH_SIZE}; '
+             f'with --pipeline, files per PUT, default 50)'
+    )
+    parser.add_argument(
+        '--ledger',
+        type=str,
+        default=str(LEDGER_PATH),
+        help='SQLite upload ledger (default: upload_ledger.db next to this script)'
+    )
+    parser.add_argument(
+        '--reconcile',
+        action='store_true',
+        help='Run a full LIST of the stage and reconcile the upload ledger before uploading'
+    )
+    parser.add_argument(
+        '--partition-by',
+        choices=PARTITION_SCHEMES,
+        default='none',
+        help='Upload new files to stage prefixes: date (yyyy/mm/dd/, the UTC upload date), '
+             'family (v1/, v2/, unknown/; requires pymupdf) or none (stage root, default)'
+    )
+    parser.add_argument(
+        '--reconcile-days',
+        type=int,
+        default=DEFAULT_RECONCILE_DAYS,
+        help=f'With --partition-by date, the periodic reconciliation lists only the partitions of this many '
+             f'recent days (default: {DEFAULT_RECONCILE_DAYS}; --reconcile lists the whole stage)'
+    )
+    parser.add_argument(
+        '--reconcile-hours',
+        type=float,
+        default=DEFAULT_RECONCILE_HOURS,
+        help=f'Reconcile automatically when the last reconciliation is older than this '
+             f'(default: {DEFAULT_RECONCILE_HOURS})'
+    )
+    parser.add_argument(
+        '--classify',
+        action='store_true',
+        help='Classify uploaded receipts as v1/v2/unknown and record them in RECEIPT_CLASSIFICATIONS '
+             '(requires pymupdf)'
+    )
+    parser.add_argument(
+        '--local-parse',
+        action='store_true',
+        help='Parse uploaded receipts from their text layer and load them into parsed_receipts, '
+             'skipping AI_PARSE_DOCUMENT (requires pymupdf)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of local parser processes for --local-parse (default: CPU count)'
+    )
+    parser.add_argument(
+        '--hash-workers',
+        type=int,
+        default=DEFAULT_HASH_WORKERS,
+        help=f'Number of threads hashing local files for change detection (default: {DEFAULT_HASH_WORKERS})'
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='Scan, hash and upload concurrently (asyncio pipeline over a pool of -c connections) '
+             'instead of hashing everything before the first PUT'
+    )
+    parser.add_argument(
+        '--max-attempts',
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help=f'Attempts per file for transient errors (network, throttling), with exponential backoff '
+             f'(default: {DEFAULT_MAX_ATTEMPTS})'
+    )
+    parser.add_argument(
+        '--retry-dead-letters',
+        action='store_true',
+        help='Upload files that failed permanently in earlier runs again'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Keep running and upload receipts as soon as they are finished (inotify, requires watchdog); '
+             'stop with Ctrl+C or SIGTERM, which uploads what is pending first'
+    )
+    parser.add_argument(
+        '--report',
+        type=str,
+        help='Write a JSON run report (per-file latency, bytes, batch sizes, connection setup, retries) to this file'
+    )
+    parser.add_argument(
+        '--prometheus',
+        type=str,
+        help='Write the run metrics to this Prometheus textfile (e.g. for the node exporter textfile collector)'
+    )
+    parser.add_argument(
+        '--record-run',
+        action='store_true',
+        help=f'Insert a summary row of the run into {UPLOAD_RUNS_TABLE} (in the stage\'s schema) '
+             f'for the cost dashboard'
+    )
+    parser.add_argument(
+        '--no-refresh',
+        action='store_true',
+        help='Do not refresh the stage directory after uploading (new files then wait for the hourly '
+             'REFRESH_RECEIPTS_STAGE task, or RUN_RECEIPTS_EXTRACTION(..., refresh => TRUE), before '
+             'RECEIPTS_STREAM sees them)'
+    )
+    parser.add_argument(
+        '--flush-seconds',
+        type=float,
+        help='With --pipeline/--watch, PUT a partial batch after this many seconds without new files '
+             '(default: 2)'
+    )
     
     args = parser.parse_args()
     
-    # Check if private key file exists
-    if not PRIVATE_KEY_PATH.exists():
-        print(f"Error: Private key file not found at {PRIVATE_KEY_PATH}")
-        print("Please ensure rsa_key.p8 exists in the parent directory")
-        sys.exit(1)
-    
     # Load configuration
-    print("Loading configuration from config.json...")
-    config = load_config(CONFIG_PATH)
+    print(f"Loading configuration from {Path(args.config).name}...")
+    config = load_config(args.config)
     
-    # Check if account is configured
-    if config.get('account') == 'YOUR_ACCOUNT_IDENTIFIER':
-        print("Error: Please update the 'account' value in config.json")
-        print("Replace 'YOUR_ACCOUNT_IDENTIFIER' with your actual Snowflake account identifier")
-        sys.exit(1)
+    if not config.get('local_stage'):
+        # Check if private key file exists
+        if not PRIVATE_KEY_PATH.exists():
+            print(f"Error: Private key file not found at {PRIVATE_KEY_PATH}")
+            print("Please ensure rsa_key.p8 exists in the parent directory")
+            sys.exit(1)
+        
+        # Check if account is configured
+        if config.get('account') == 'YOUR_ACCOUNT_IDENTIFIER':
+            print("Error: Please update the 'account' value in config.json")
+            print("Replace 'YOUR_ACCOUNT_IDENTIFIER' with your actual Snowflake account identifier")
+            sys.exit(1)
     
     print("✓ Configuration loaded successfully\n")
     
     # Upload receipts
-    upload_receipts(config, args.directory, args.stage)
+    upload_receipts(config, args.directory, args.stage, args.classify, args.local_parse, args.workers,
+                    args.concurrency, args.parallel, args.batch_size,
+                    args.ledger, args.reconcile, args.reconcile_hours, args.hash_workers,
+                    args.pipeline, args.watch, args.flush_seconds, args.max_attempts, args.retry_dead_letters,
+                    args.partition_by, args.reconcile_days, args.report, args.prometheus, args.record_run,
+                    not args.no_refresh, args.adaptive, args.max_concurrency, args.max_bandwidth)
 
 
 if __name__ == "__main__":
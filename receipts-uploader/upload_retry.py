@@ -0,0 +1,82 @@
+"""
+Retry policy for failed receipt uploads.
+
+Failures are classified from their message (PUT result rows carry a message,
+exceptions are recorded as "<ExceptionClass>: <message>"):
+
+- transient: network errors, timeouts and throttling; retried with
+  exponential backoff and full jitter, concurrently with fresh uploads
+- statement: a whole PUT statement failed for another reason (for example a
+  missing stage or privilege); the files stay FAILED and are retried on the
+  next run
+- permanent: one file was rejected or could not be read; it goes to the
+  ledger's dead-letter table with the reason and is skipped until its
+  content changes (or upload_receipts.py --retry-dead-letters)
+"""
+import random
+
+
+# Attempts per file, including the first, before a transient failure is given up for this run
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Backoff before retry n is drawn uniformly from [0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (n - 1))]
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Failure classes
+TRANSIENT = 'transient'
+STATEMENT = 'statement'
+PERMANENT = 'permanent'
+
+# Prefix of the message of files whose whole PUT statement raised
+STATEMENT_ERROR_PREFIX = 'PUT failed: '
+
+# Lower-case message fragments of transient failures (connector exception classes included)
+TRANSIENT_MARKERS = (
+    'operationalerror', 'serviceunavailableerror', 'gatewaytimeouterror',
+    'badgatewayerror', 'otherhttpretryableerror', 'requesttimeouterror', 'requestexceedmaxretryerror',
+    'presignedurlexpirederror', 'timeout', 'timed out', 'connection', 'reset by peer', 'broken pipe',
+    'throttl', 'too many requests', 'slow down', 'temporarily', 'unavailable', 'try again',
+    'no put result row',
+)
+
+
+def classify_failure(message):
+    """
+    Classify the message of a failed upload.
+
+    Args:
+        message: Failure message from upload_batch
+
+    Returns:
+        TRANSIENT, STATEMENT or PERMANENT
+    """
+    text = (message or '').lower()
+    if any(marker in text for marker in TRANSIENT_MARKERS):
+        return TRANSIENT
+    if (message or '').startswith(STATEMENT_ERROR_PREFIX):
+        return STATEMENT
+    return PERMANENT
+
+
+def should_retry(message, attempts, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Whether a failed file is retried in this run after the given number of attempts."""
+    return attempts < max_attempts and classify_failure(message) == TRANSIENT
+
+
+def backoff_delay(attempt):
+    """
+    Seconds to wait before a retry (exponential backoff with full jitter).
+
+    Args:
+        attempt: Number of the retry, 1 for the first
+
+    Returns:
+        Delay in seconds
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+def final_message(message, attempts):
+    """Failure message, noting the number of attempts when the file was retried."""
+    return message if attempts <= 1 else f"{message} (after {attempts} attempts)"
@@ -0,0 +1,378 @@
+"""
+Telemetry of one upload run: per-file latency, bytes, batch sizes, connection setup, retries and refreshes.
+
+upload_batch reports every PUT it runs (files, bytes, wall time, statuses)
+and the uploaders report connection setup times and scheduled retries. A
+file's latency runs from the start of its first PUT to the end of its last
+one, so it includes backoff and retries; a wildcard PUT returns the results
+of all its files at once, so files of one batch share the batch's time.
+The stage refresher (stage_refresh.py) reports every directory refresh and
+the time from each file's PUT to the refresh that made it visible, and the
+concurrency controller (upload_concurrency.py) every change of the number of
+PUTs in flight together with the throughput at that moment.
+
+At the end of a run the telemetry is summarized as histograms, written as a
+JSON report (--report) and a Prometheus textfile (--prometheus, for the node
+exporter's textfile collector), and optionally inserted as a row of the
+UPLOAD_RUNS table (--record-run), which the cost dashboard charts next to
+the Cortex costs.
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime, timezone
+
+
+# Table (in the stage's schema) that --record-run inserts one summary row per run into
+UPLOAD_RUNS_TABLE = 'UPLOAD_RUNS'
+
+# Concurrency changes kept in the run report's timeline (the latest ones)
+MAX_CONCURRENCY_SAMPLES = 500
+
+# Upper bounds of the histogram buckets (Prometheus "le"); the last bucket is +Inf
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BATCH_FILES_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+BANDWIDTH_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100)  # MB/s of one PUT
+CONNECT_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 30)
+
+
+class Histogram:
+    """Fixed-bucket histogram that also keeps its observations for percentiles."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+    @property
+    def count(self):
+        return len(self.values)
+
+    @property
+    def total(self):
+        return sum(self.values)
+
+    def percentile(self, q):
+        """Value below which a share q (0-1) of the observations fall (nearest rank), or None."""
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+    def bucket_counts(self):
+        """Cumulative counts per bucket: [(upper bound, count)], ending with (inf, count)."""
+        return [(bound, sum(1 for v in self.values if v <= bound)) for bound in self.buckets] + \
+            [(float('inf'), self.count)]
+
+    def summary(self):
+        """Dictionary with count, sum, min, p50, p95, p99, max and the cumulative buckets."""
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': min(self.values, default=None),
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': max(self.values, default=None),
+            'buckets': {('+Inf' if bound == float('inf') else str(bound)): count
+                        for bound, count in self.bucket_counts()},
+        }
+
+
+class UploadTelemetry:
+    """Thread-safe collector of the measurements of one upload run."""
+
+    def __init__(self, stage_name, mode):
+        """
+        Args:
+            stage_name: Target stage
+            mode: 'batch', 'pipeline', 'watch', 'stream' (generate_and_upload.py) or 'daemon' (upload_daemon.py)
+        """
+        self.run_id = str(uuid.uuid4())
+        self.stage_name = stage_name
+        self.mode = mode
+        self.started_at = datetime.now(timezone.utc)
+        self.finished_at = None
+        self.file_latency = Histogram(LATENCY_BUCKETS)
+        self.put_seconds = Histogram(LATENCY_BUCKETS)
+        self.batch_files = Histogram(BATCH_FILES_BUCKETS)
+        self.put_bandwidth = Histogram(BANDWIDTH_BUCKETS)
+        self.connect_seconds = Histogram(CONNECT_BUCKETS)
+        self.refresh_seconds = Histogram(LATENCY_BUCKETS)
+        self.visibility_latency = Histogram(LATENCY_BUCKETS)
+        self.concurrency = []  # (seconds since start, PUT limit, MB/s at the time) per limit change
+        self.retries = 0
+        self.retry_delay_seconds = 0.0
+        self.puts = 0
+        self.statuses = {}
+        self._files = {}  # name -> [first PUT start, last PUT end, bytes, attempts, last status]
+        self._start = time.perf_counter()
+        self._elapsed = None
+        self._lock = threading.Lock()
+
+    def record_connect(self, seconds):
+        """Record the setup time of one Snowflake connection."""
+        with self._lock:
+            self.connect_seconds.observe(seconds)
+
+    def record_refresh(self, seconds, latencies):
+        """Record one directory refresh and, per file it made visible, the seconds since the file's PUT ended."""
+        with self._lock:
+            self.refresh_seconds.observe(seconds)
+            for latency in latencies:
+                self.visibility_latency.observe(latency)
+
+    def record_concurrency(self, limit, bytes_per_sec):
+        """Record a new limit of the PUTs in flight and the current throughput."""
+        with self._lock:
+            self.concurrency.append((time.perf_counter() - self._start, limit, bytes_per_sec / (1024 * 1024)))
+            del self.concurrency[:-MAX_CONCURRENCY_SAMPLES]
+
+    def record_retry(self, files, delay):
+        """Record that a number of files are retried after a backoff delay."""
+        with self._lock:
+            self.retries += files
+            self.retry_delay_seconds += delay
+
+    def record_batch(self, batch, results, started, finished, sizes=None):
+        """
+        Record one PUT.
+
+        Args:
+            batch: Local file paths of the batch
+            results: Dictionary file name -> (status, message) from upload_batch
+            started: time.perf_counter() before the batch was staged
+            finished: time.perf_counter() after the PUT returned
+            sizes: Dictionary file name -> bytes, for files uploaded from memory (default: from the files)
+        """
+        sizes = dict(sizes or {})
+        for path in batch:
+            if path.name in sizes:
+                continue
+            try:
+                sizes[path.name] = path.stat().st_size
+            except OSError:
+                sizes[path.name] = 0
+        seconds = finished - started
+        uploaded_bytes = sum(sizes[name] for name, (status, _) in results.items() if status == 'UPLOADED')
+        with self._lock:
+            self.puts += 1
+            self.put_seconds.observe(seconds)
+            self.batch_files.observe(len(batch))
+            if uploaded_bytes and seconds > 0:
+                self.put_bandwidth.observe(uploaded_bytes / (1024 * 1024) / seconds)
+            for path in batch:
+                entry = self._files.setdefault(path.name, [started, finished, sizes[path.name], 0, None])
+                entry[1] = finished
+                entry[3] += 1
+                entry[4] = results[path.name][0]
+
+    def finish(self):
+        """Close the run: file latencies and final statuses are computed from the recorded PUTs."""
+        with self._lock:
+            self.finished_at = datetime.now(timezone.utc)
+            self._elapsed = time.perf_counter() - self._start
+            self.statuses = {}
+            for first, last, _, _, status in self._files.values():
+                self.file_latency.observe(last - first)
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    @property
+    def elapsed(self):
+        return self._elapsed if self._elapsed is not None else time.perf_counter() - self._start
+
+    @property
+    def uploaded_bytes(self):
+        return sum(entry[2] for entry in self._files.values() if entry[4] == 'UPLOADED')
+
+    def report(self):
+        """Machine-readable run report (the JSON written by --report)."""
+        uploaded = self.statuses.get('UPLOADED', 0)
+        elapsed = max(self.elapsed, 1e-6)
+        return {
+            'run_id': self.run_id,
+            'stage': self.stage_name,
+            'mode': self.mode,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'finished_at': self.finished_at.isoformat(timespec='seconds') if self.finished_at else None,
+            'seconds': round(self.elapsed, 3),
+            'files': {
+                'uploaded': uploaded,
+                'skipped': self.statuses.get('SKIPPED', 0),
+                'failed': self.statuses.get('FAILED', 0),
+            },
+            'bytes_uploaded': self.uploaded_bytes,
+            'files_per_sec': round(uploaded / elapsed, 3),
+            'mb_per_sec': round(self.uploaded_bytes / (1024 * 1024) / elapsed, 3),
+            'puts': self.puts,
+            'retries': self.retries,
+            'retry_delay_seconds': round(self.retry_delay_seconds, 3),
+            'concurrency': self._concurrency_summary(),
+            'histograms': {
+                'file_latency_seconds': self.file_latency.summary(),
+                'put_seconds': self.put_seconds.summary(),
+                'batch_files': self.batch_files.summary(),
+                'put_bandwidth_mb_per_sec': self.put_bandwidth.summary(),
+                'connect_seconds': self.connect_seconds.summary(),
+                'refresh_seconds': self.refresh_seconds.summary(),
+                'visibility_latency_seconds': self.visibility_latency.summary(),
+            },
+        }
+
+    def _concurrency_summary(self):
+        limits = [limit for _, limit, _ in self.concurrency]
+        return {
+            'initial': limits[0] if limits else None,
+            'final': limits[-1] if limits else None,
+            'min': min(limits, default=None),
+            'max': max(limits, default=None),
+            'changes': max(0, len(limits) - 1),
+            'timeline': [{'seconds': round(seconds, 3), 'limit': limit, 'mb_per_sec': round(mb_per_sec, 3)}
+                         for seconds, limit, mb_per_sec in self.concurrency],
+        }
+
+    def print_summary(self):
+        """Print the latency, batch size, bandwidth, connection setup and refresh distributions."""
+        rows = [
+            ('File latency (s)', self.file_latency),
+            ('PUT time (s)', self.put_seconds),
+            ('Files per PUT', self.batch_files),
+            ('PUT bandwidth (MB/s)', self.put_bandwidth),
+            ('Connection setup (s)', self.connect_seconds),
+            ('Refresh time (s)', self.refresh_seconds),
+            ('PUT to visible (s)', self.visibility_latency),
+        ]
+        print(f"\n{'Telemetry':<22} {'count':>7} {'p50':>9} {'p95':>9} {'max':>9}")
+        for label, histogram in rows:
+            if histogram.count:
+                print(f"  {label:<20} {histogram.count:>7} {histogram.percentile(0.5):>9.2f} "
+                      f"{histogram.percentile(0.95):>9.2f} {max(histogram.values):>9.2f}")
+        print(f"  Retries: {self.retries} file(s), {self.retry_delay_seconds:.1f}s of backoff")
+        if len(self.concurrency) > 1:
+            summary = self._concurrency_summary()
+            print(f"  Concurrency: {summary['initial']} -> {summary['final']} PUTs in flight "
+                  f"(range {summary['min']}-{summary['max']}, {summary['changes']} change(s))")
+
+        if self.file_latency.count:
+            print("  File latency histogram:")
+            cumulative = self.file_latency.bucket_counts()
+            buckets = [(bound, count - previous)
+                       for (bound, count), (_, previous) in zip(cumulative, [(0, 0)] + cumulative)]
+            last = max(i for i, (_, count) in enumerate(buckets) if count)
+            width = max(count for _, count in buckets)
+            for bound, count in buckets[:last + 1]:
+                label = '+Inf' if bound == float('inf') else f"<= {bound}s"
+                print(f"    {label:>9} {count:>6} {'#' * round(40 * count / width)}")
+
+    def write_json(self, path):
+        """Write the run report as JSON."""
+        _write_atomic(path, json.dumps(self.report(), indent=2) + '\n')
+
+    def write_prometheus(self, path):
+        """Write the run's metrics in the Prometheus text format (textfile collector)."""
+        labels = f'stage="{self.stage_name}",mode="{self.mode}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        def histogram(name, help_text, hist):
+            samples = [
+                f'{name}_bucket{{{labels},le="{"+Inf" if bound == float("inf") else bound}"}} {count}'
+                for bound, count in hist.bucket_counts()
+            ]
+            samples += [f"{name}_sum{{{labels}}} {hist.total:.6f}", f"{name}_count{{{labels}}} {hist.count}"]
+            metric(name, 'histogram', help_text, samples)
+
+        metric('receipt_upload_files', 'gauge', 'Files of the last upload run by final status',
+               [f'receipt_upload_files{{{labels},status="{status.lower()}"}} {self.statuses.get(status, 0)}'
+                for status in ('UPLOADED', 'SKIPPED', 'FAILED')])
+        metric('receipt_upload_bytes', 'gauge', 'Bytes uploaded by the last upload run',
+               [f"receipt_upload_bytes{{{labels}}} {self.uploaded_bytes}"])
+        metric('receipt_upload_retries', 'gauge', 'File retries of the last upload run',
+               [f"receipt_upload_retries{{{labels}}} {self.retries}"])
+        summary = self._concurrency_summary()
+        if summary['final'] is not None:
+            metric('receipt_upload_concurrency', 'gauge', 'Limit of the PUTs in flight at the end of the last run',
+                   [f"receipt_upload_concurrency{{{labels}}} {summary['final']}"])
+        metric('receipt_upload_throughput_mb_per_second', 'gauge', 'Average upload throughput of the last run',
+               [f"receipt_upload_throughput_mb_per_second{{{labels}}} "
+                f"{self.uploaded_bytes / (1024 * 1024) / max(self.elapsed, 1e-6):.3f}"])
+        metric('receipt_upload_duration_seconds', 'gauge', 'Wall time of the last upload run',
+               [f"receipt_upload_duration_seconds{{{labels}}} {self.elapsed:.3f}"])
+        metric('receipt_upload_last_run_timestamp_seconds', 'gauge', 'End time of the last upload run',
+               [f"receipt_upload_last_run_timestamp_seconds{{{labels}}} "
+                f"{(self.finished_at or datetime.now(timezone.utc)).timestamp():.0f}"])
+        histogram('receipt_upload_file_latency_seconds', 'Time from first PUT to final result per file',
+                  self.file_latency)
+        histogram('receipt_upload_put_seconds', 'Wall time per PUT statement', self.put_seconds)
+        histogram('receipt_upload_batch_files', 'Files per PUT statement', self.batch_files)
+        histogram('receipt_upload_put_bandwidth_mb_per_second', 'Upload bandwidth per PUT statement',
+                  self.put_bandwidth)
+        histogram('receipt_upload_connect_seconds', 'Snowflake connection setup time', self.connect_seconds)
+        histogram('receipt_upload_refresh_seconds', 'Wall time per directory refresh (ALTER STAGE ... REFRESH)',
+                  self.refresh_seconds)
+        histogram('receipt_upload_visibility_latency_seconds',
+                  "Time from the end of a file's PUT to the directory refresh that made it visible",
+                  self.visibility_latency)
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+    def insert_run(self, conn, table):
+        """
+        Insert the run summary into an upload runs table, creating the table if needed.
+
+        Args:
+            conn: Snowflake connection
+            table: Fully qualified table name
+        """
+        report = self.report()
+        latency = report['histograms']['file_latency_seconds']
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    run_id STRING,
+                    stage STRING,
+                    mode STRING,
+                    started_at TIMESTAMP_LTZ,
+                    finished_at TIMESTAMP_LTZ,
+                    seconds FLOAT,
+                    files_uploaded INTEGER,
+                    files_skipped INTEGER,
+                    files_failed INTEGER,
+                    bytes_uploaded INTEGER,
+                    files_per_sec FLOAT,
+                    mb_per_sec FLOAT,
+                    puts INTEGER,
+                    retries INTEGER,
+                    latency_p50 FLOAT,
+                    latency_p95 FLOAT,
+                    connect_seconds FLOAT,
+                    report VARIANT
+                )
+            """)
+            cursor.execute(
+                f"INSERT INTO {table} SELECT %s, %s, %s, TO_TIMESTAMP_LTZ(%s), TO_TIMESTAMP_LTZ(%s), %s, %s, %s, %s, "
+                f"%s, %s, %s, %s, %s, %s, %s, %s, PARSE_JSON(%s)",
+                (report['run_id'], report['stage'], report['mode'], report['started_at'], report['finished_at'],
+                 report['seconds'], report['files']['uploaded'], report['files']['skipped'],
+                 report['files']['failed'], report['bytes_uploaded'], report['files_per_sec'],
+                 report['mb_per_sec'], report['puts'], report['retries'], latency['p50'], latency['p95'],
+                 self.connect_seconds.total, json.dumps(report))
+            )
+        finally:
+            cursor.close()
+
+
+def _write_atomic(path, text):
+    # Write next to the target and rename, so collectors never read a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -0,0 +1,186 @@
+"""
+Tag receipts as v1, v2 or unknown, and name the vendor where possible.
+
+The classifier reads any text rendering of a receipt: the PDF text layer at
+upload time, or the AI_PARSE_DOCUMENT layout content in Snowflake. Text is
+compacted to lower-case letters and digits, so "Minimum (USD)", "MINIMUM (USD)"
+and "| Minimum (USD) |" all read "minimumusd", and headers split over several
+lines ("CLICK" / "VELOCITY") still read "clickvelocity".
+
+- family: v2 receipts have pricing tables (Market | Minimum (USD) | Reach), v1
+  receipts have line items (Description | Qty | Unit Price | Total). Receipts
+  with neither fall back to the family of their vendor, else "unknown".
+- vendor: the known vendor name (or template alias) appearing first.
+
+classify_text() only uses the standard library, so this module is also the
+handler of the CLASSIFY_RECEIPT SQL function (receipts-processor/setup.sql).
+"""
+import json
+import re
+
+
+# Column headers that identify each family, checked in this order
+FAMILY_MARKERS = (
+    ('v2', ('minimumusd', 'reach')),
+    ('v1', ('qty', 'unitprice')),
+)
+
+# Family returned when a receipt matches no markers and no vendor
+UNKNOWN = 'unknown'
+
+# Vendors of the known templates (receipts.synthesis VENDOR_NAMES, receipts.synthesis_v2 VENDOR_NAMES_V2)
+VENDOR_FAMILIES = {
+    'TechAds Pro': 'v1',
+    'AdMaster Global': 'v1',
+    'Creative Campaigns': 'v1',
+    'Digital Reach': 'v1',
+    'Apex Media': 'v1',
+    'Social Boost': 'v1',
+    'Prime Ads': 'v1',
+    'Click Velocity': 'v1',
+    'Brand Builders': 'v1',
+    'Viral Marketing': 'v1',
+    'Metric Masters': 'v1',
+    'Ad Genius': 'v1',
+    'Campaign Central': 'v1',
+    'Pixel Perfect': 'v1',
+    'Impact Ads': 'v1',
+    'Growth Engine': 'v1',
+    'Ad Lab': 'v1',
+    'Market Movers': 'v1',
+    'Conversion Kings': 'v1',
+    'Ad Wave': 'v1',
+    'Strategy Sphere': 'v1',
+    'Performance Plus': 'v1',
+    'Premium Ad Solutions': 'v2',
+    'Global Media Partners': 'v2',
+    'Impact Advertising': 'v2',
+}
+
+# Templates that do not print their full vendor name
+VENDOR_ALIASES = {
+    'Impact Ads': ('maximumimpactminimumwaste',),  # header reads "IMPACT" above the tagline
+}
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def compact(text):
+    """Lower-case a text and drop everything but letters and digits."""
+    return _NON_ALNUM.sub('', text.lower())
+
+
+_VENDOR_KEYS = sorted(
+    ((key, name) for name in VENDOR_FAMILIES for key in (compact(name),) + VENDOR_ALIASES.get(name, ())),
+    key=lambda item: -len(item[0]),
+)
+
+
+def find_vendor(text):
+    """
+    Find the known vendor a receipt text names first.
+
+    Args:
+        text: Receipt text, already compacted
+
+    Returns:
+        Vendor name or None
+    """
+    best = None
+    for key, name in _VENDOR_KEYS:
+        position = text.find(key)
+        # Earliest mention wins (the header); longer keys were checked first, so ties keep them
+        if position != -1 and (best is None or position < best[0]):
+            best = (position, name)
+    return best[1] if best else None
+
+
+def classify_text(text):
+    """
+    Classify the text of one receipt.
+
+    Args:
+        text: PDF text layer or AI_PARSE_DOCUMENT content (None is unknown)
+
+    Returns:
+        Dictionary {'family': 'v1' | 'v2' | 'unknown', 'vendor_name': str or None}
+    """
+    text = compact(text or '')
+    vendor_name = find_vendor(text)
+    family = next(
+        (family for family, markers in FAMILY_MARKERS if all(marker in text for marker in markers)),
+        VENDOR_FAMILIES.get(vendor_name, UNKNOWN),
+    )
+    return {'family': family, 'vendor_name': vendor_name}
+
+
+def classify_pdf(source, relative_path):
+    """
+    Classify every page of a PDF.
+
+    Single-page PDFs keep relative_path; pages of multi-page PDFs (bundles)
+    are named "<relative_path>#page=N", matching parsed_receipts.
+
+    Args:
+        source: PDF file path or PDF bytes
+        relative_path: Stage path of the PDF
+
+    Returns:
+        List of {'relative_path', 'family', 'vendor_name'} dictionaries
+    """
+    import pymupdf  # only needed for PDFs, not inside the SQL function
+
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            doc = pymupdf.open(stream=source, filetype='pdf')
+        else:
+            doc = pymupdf.open(source)
+        with doc:
+            texts = [page.get_text() for page in doc]
+    except Exception:
+        return [{'relative_path': relative_path, 'family': UNKNOWN, 'vendor_name': None}]
+
+    return [
+        {'relative_path': relative_path if len(texts) == 1 else f"{relative_path}#page={number}",
+         **classify_text(text)}
+        for number, text in enumerate(texts, 1)
+    ]
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+    from text_layer import find_pdfs
+
+    parser = argparse.ArgumentParser(
+        description="Classify receipt PDFs as v1, v2 or unknown and name their vendor"
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        help='Receipt PDFs or directories of PDFs'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default='classifications.jsonl',
+        help='Output JSONL file, one record per receipt page (default: classifications.jsonl)'
+    )
+
+    args = parser.parse_args()
+
+    counts = {}
+    with open(args.output, 'w') as output:
+        for path, relative_path in find_pdfs(args.inputs):
+            for record in classify_pdf(path, relative_path):
+                counts[record['family']] = counts.get(record['family'], 0) + 1
+                output.write(json.dumps(record) + '\n')
+
+    print(f"✓ Classified {sum(counts.values())} receipt page(s)")
+    for family, count in sorted(counts.items()):
+        print(f"   {family}: {count}")
+    print(f"   Output: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Template-aware local receipt extractor.
+
+Reads the PDF text layer, fingerprints which of the 25 known templates produced
+each page, and applies that template's learned rules (template_profiles.py) to
+build the same JSON shape AI_COMPLETE returns for AI_COMPLETE_SCHEMA_V1 (v1)
+and AI_COMPLETE_SCHEMA_V2 (v2) of receipts_engine.schemas. Pages from unknown
+templates, or pages whose extraction is incomplete or inconsistent, are routed
+to Cortex.
+"""
+import os
+import json
+import time
+from multiprocessing import Pool
+
+from template_profiles import build_profiles
+from text_layer import find_pdfs, read_pages
+
+
+# Pages scoring below this fraction of a template's constant texts are unknown
+MIN_FINGERPRINT_SCORE = 0.8
+
+# Pages with a lower confidence are routed to Cortex
+DEFAULT_THRESHOLD = 0.9
+
+# Ground-truth fields that feed the response schemas, per family (used to score coverage)
+SCHEMA_FIELDS = {
+    'v1': frozenset([
+        'transaction_id', 'date', 'payment_method', 'customer_name', 'company_name', 'campaign_name',
+        'line_items[*].description', 'line_items[*].quantity', 'line_items[*].unit_price', 'line_items[*].total',
+        'subtotal', 'tax', 'total',
+    ] + [f"campaign_details.{key}" for key in (
+        'content_types', 'display_formats', 'video_formats', 'campaign_start_date', 'campaign_end_date',
+        'daily_budget', 'total_budget', 'target_impressions', 'target_clicks', 'target_conversions',
+        'pricing_model', 'cpm', 'ctr', 'bounce_rate', 'geo_targets', 'age_range', 'devices',
+    )]),
+    'v2': frozenset([
+        'transaction_id', 'date', 'payment_method', 'customer_name', 'company_name', 'campaign_name',
+        'pricing_tables[*].name', 'pricing_tables[*].markets[*].market',
+        'pricing_tables[*].markets[*].min_value_usd', 'pricing_tables[*].markets[*].reach',
+        'subtotal', 'tax', 'total',
+    ]),
+}
+
+# Routes written to the output records
+ROUTE_LOCAL = 'local'
+ROUTE_CORTEX = 'cortex'
+
+
+def _number(raw, kind):
+    """Convert a rendered number ("$1,574.32", "5.3%", "3,821,892") to int/float."""
+    value = float(raw.replace('$', '').replace(',', '').replace('%', '').strip())
+    return int(value) if kind is int else value
+
+
+def _assign(fields, path, value):
+    """
+    Set a generalized field path in a nested dictionary.
+
+    "[*]" segments address the last element of a list; a leaf that is already
+    set there starts a new element of the innermost list (the next table row).
+    """
+    parts = path.split('.')
+    node = fields
+    innermost = None
+    for part in parts[:-1]:
+        if part.endswith('[*]'):
+            innermost = node.setdefault(part[:-3], [])
+            if not innermost:
+                innermost.append({})
+            node = innermost[-1]
+        else:
+            node = node.setdefault(part, {})
+
+    leaf = parts[-1]
+    if leaf in node:
+        if innermost is None:
+            return  # scalar shown twice: keep the first
+        innermost.append({})
+        node = innermost[-1]
+    node[leaf] = value
+
+
+def consistency_checks(family, fields):
+    """
+    Cross-check extracted amounts against each other.
+
+    Returns:
+        List of (check name, passed) for every check the extracted fields allow
+    """
+    checks = []
+    close = lambda a, b: abs(a - b) <= 0.05  # amounts are rendered rounded to cents
+
+    if family == 'v1':
+        items = fields.get('line_items', [])
+        for n, item in enumerate(items):
+            if {'quantity', 'unit_price', 'total'} <= item.keys():
+                checks.append((f"line_items[{n}]", close(item['quantity'] * item['unit_price'], item['total'])))
+        line_total = sum(item.get('total', 0) for item in items)
+        if 'subtotal' in fields:
+            checks.append(('subtotal', close(line_total, fields['subtotal'])))
+        elif items and 'total' in fields:
+            checks.append(('total>=items', fields['total'] + 0.01 >= line_total))
+    else:
+        markets = [m for table in fields.get('pricing_tables', []) for m in table.get('markets', [])]
+        if 'subtotal' in fields:
+            checks.append(('subtotal', close(sum(m.get('min_value_usd', 0) for m in markets), fields['subtotal'])))
+
+    # Every template shows a total; a page without one is truncated or misread
+    checks.append(('total found', 'total' in fields))
+    if {'subtotal', 'tax', 'total'} <= fields.keys():
+        checks.append(('total', close(fields['subtotal'] + fields['tax'], fields['total'])))
+    return checks
+
+
+def _money(value):
+    return '' if value is None else f"{value:.2f}"
+
+
+def to_response(family, vendor_name, fields):
+    """
+    Shape extracted fields like the AI_COMPLETE response for the family's schema.
+
+    v1 follows AI_COMPLETE_SCHEMA_V1, v2 follows AI_COMPLETE_SCHEMA_V2. Missing fields are
+    empty strings/arrays, as the extraction prompts instruct.
+    """
+    get = lambda key: fields.get(key, '')
+
+    if family == 'v2':
+        return {
+            'vendor': {'vendor_name': vendor_name},
+            'transaction': {'transaction_id': get('transaction_id'), 'date': get('date'),
+                            'payment_method': get('payment_method')},
+            'customer': {'customer_name': get('customer_name'), 'company_name': get('company_name')},
+            'campaign': {'name': get('campaign_name')},
+            'pricing_tables': [
+                {
+                    'table_name': table.get('name', ''),
+                    'markets': [
+                        {
+                            'market': m.get('market', ''),
+                            'minimum_usd': f"${m['min_value_usd']:,}" if 'min_value_usd' in m else '',
+                            'reach': f"{m['reach']:,}" if 'reach' in m else '',
+                        }
+                        for m in table.get('markets', [])
+                    ],
+                }
+                for table in fields.get('pricing_tables', [])
+            ],
+            'financials': {key: _money(fields.get(key)) for key in ('subtotal', 'tax', 'total')},
+        }
+
+    details = fields.get('campaign_details', {})
+    detail = lambda key: details.get(key, '')
+    formats = [
+        f for key in ('display_formats', 'video_formats')
+        for f in str(details.get(key, '')).split(', ') if f and f != 'N/A'
+    ]
+    return {
+        'vendor': {'vendor_name': vendor_name},
+        'transaction': {'receipt_id': get('transaction_id'), 'date': get('date'),
+                        'payment_method': get('payment_method')},
+        'customer': {'customer_name': get('customer_name'), 'company_name': get('company_name')},
+        'campaign': {
+            'name': get('campaign_name'),
+            'content_types': detail('content_types'),
+            'ad_formats': formats,
+            'period_startdate': detail('campaign_start_date'),
+            'period_enddate': detail('campaign_end_date'),
+            'budget': details.get('total_budget', ''),
+        },
+        'financials': {
+            'line_items': fields.get('line_items', []),
+            'subtotal': fields.get('subtotal', ''),
+            'tax': fields.get('tax', ''),
+            'total': fields.get('total', ''),
+        },
+        'metrics': {
+            'cpm': str(detail('cpm')),
+            'ctr': str(detail('ctr')),
+            'bounce_rate': str(detail('bounce_rate')),
+            'targets': {key: details[f"target_{key}"] for key in ('impressions', 'clicks', 'conversions')
+                        if f"target_{key}" in details},
+            'pricing_model': detail('pricing_model'),
+        },
+        'budget': {'daily_budget': str(detail('daily_budget')), 'total_budget': str(detail('total_budget'))},
+        'targeting': {
+            'geography': [g for g in str(detail('geo_targets')).split(', ') if g],
+            'demographics': '',
+            'age_range': detail('age_range'),
+            'devices': detail('devices'),
+        },
+    }
+
+
+class FastExtractor:
+    """Extract receipts locally with per-template rules, routing the rest to Cortex."""
+
+    def __init__(self, profiles=None, threshold=DEFAULT_THRESHOLD):
+        """
+        Initialize the extractor.
+
+        Args:
+            profiles: TemplateProfile list (default: learned with build_profiles())
+            threshold: Minimum confidence for a page to be extracted locally
+        """
+        self.profiles = profiles if profiles is not None else build_profiles()
+        self.threshold = threshold
+
+    def identify(self, spans):
+        """
+        Fingerprint the template that produced a page.
+
+        Returns:
+            Tuple (TemplateProfile or None, fingerprint score)
+        """
+        texts = {span[0] for span in spans}
+        best, best_score = None, 0.0
+        for profile in self.profiles:
+            score = profile.fingerprint_score(texts)
+            if score > best_score:
+                best, best_score = profile, score
+        if best_score < MIN_FINGERPRINT_SCORE:
+            return None, best_score
+        return best, best_score
+
+    def extract_fields(self, profile, spans):
+        """
+        Apply a template's rules to the spans of a page.
+
+        Returns:
+            Tuple (nested ground-truth-shaped field dictionary, number of unparsable values)
+        """
+        fields = {}
+        failures = 0
+        anchor = None
+        ordinal = 0
+        for text, x0, _, x1, _ in spans:
+            if text in profile.constants:
+                anchor = text
+                ordinal = 0
+                continue
+            matched = profile.match(anchor, ordinal, text, x0, x1)
+            ordinal += 1
+            if matched is None:
+                continue
+            for path, raw in zip(*matched):
+                kind = profile.field_types.get(path, str)
+                try:
+                    value = _number(raw, kind) if kind in (int, float) else raw
+                except ValueError:
+                    failures += 1
+                    continue
+                _assign(fields, path, value)
+        return fields, failures
+
+    def extract_page(self, spans):
+        """
+        Extract one receipt page.
+
+        Returns:
+            Dictionary with route, family, vendor_name, confidence, checks and
+            extracted_data (None when the template is unknown)
+        """
+        profile, score = self.identify(spans)
+        if profile is None:
+            return {'route': ROUTE_CORTEX, 'family': None, 'vendor_name': None,
+                    'confidence': 0.0, 'reason': 'unknown template', 'extracted_data': None}
+
+        fields, failures = self.extract_fields(profile, spans)
+        expected = [path for path in profile.expected_fields if path in SCHEMA_FIELDS[profile.family]]
+        found = sum(1 for path in expected if _has_path(fields, path))
+        coverage = found / len(expected) if expected else 0.0
+        checks = consistency_checks(profile.family, fields)
+        passed = sum(1 for _, ok in checks if ok)
+        consistency = passed / len(checks) if checks else 1.0
+        confidence = round(score * coverage * consistency * (0.5 if failures else 1.0), 4)
+
+        record = {
+            'route': ROUTE_LOCAL if confidence >= self.threshold else ROUTE_CORTEX,
+            'family': profile.family,
+            'vendor_name': profile.vendor_name,
+            'confidence': confidence,
+            'extracted_data': to_response(profile.family, profile.vendor_name, fields),
+        }
+        failed = [name for name, ok in checks if not ok]
+        if failed:
+            record['failed_checks'] = failed
+        return record
+
+    def extract_pdf(self, source, relative_path):
+        """
+        Extract every page of a PDF.
+
+        Single-page PDFs keep relative_path; pages of multi-page PDFs (bundles)
+        are named "<relative_path>#page=N", matching parsed_receipts.
+
+        Returns:
+            List of page records
+        """
+        try:
+            pages = read_pages(source)
+        except Exception as e:
+            return [{'relative_path': relative_path, 'route': ROUTE_CORTEX, 'family': None,
+                     'vendor_name': None, 'confidence': 0.0, 'reason': f"unreadable: {e}",
+                     'extracted_data': None}]
+
+        records = []
+        for number, spans in enumerate(pages, 1):
+            record = self.extract_page(spans) if spans else {
+                'route': ROUTE_CORTEX, 'family': None, 'vendor_name': None,
+                'confidence': 0.0, 'reason': 'no text layer', 'extracted_data': None}
+            path = relative_path if len(pages) == 1 else f"{relative_path}#page={number}"
+            records.append({'relative_path': path, **record})
+        return records
+
+
+def _has_path(fields, path):
+    """True if a generalized path is set (for lists: in at least one element)."""
+    node = [fields]
+    for part in path.split('.'):
+        key = part[:-3] if part.endswith('[*]') else part
+        node = [n[key] for n in node if isinstance(n, dict) and key in n]
+        if part.endswith('[*]'):
+            node = [item for items in node for item in items]
+        if not node:
+            return False
+    return True
+
+
+# Per-process extractor, created once by _init_worker so profiles are not re-learned per file
+_worker_state = {}
+
+
+def _init_worker(profiles, threshold):
+    _worker_state['extractor'] = FastExtractor(profiles, threshold)
+
+
+def _extract_file(task):
+    path, relative_path = task
+    return _worker_state['extractor'].extract_pdf(path, relative_path)
+
+
+def extract_files(tasks, output_path, workers=None, threshold=DEFAULT_THRESHOLD, profiles=None):
+    """
+    Extract PDFs in a process pool and write one JSON line per receipt page.
+
+    Args:
+        tasks: (path, relative path) pairs from find_pdfs()
+        output_path: JSONL file to write
+        workers: Number of worker processes (default: CPU count)
+        threshold: Minimum confidence for local extraction
+        profiles: TemplateProfile list (default: learned once here and shared with the workers)
+
+    Returns:
+        Dictionary of route counts
+    """
+    profiles = profiles if profiles is not None else build_profiles()
+    workers = workers or os.cpu_count() or 1
+    counts = {ROUTE_LOCAL: 0, ROUTE_CORTEX: 0}
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+
+    with open(output_path, 'w') as output, \
+            Pool(workers, initializer=_init_worker, initargs=(profiles, threshold)) as pool:
+        for records in pool.imap(_extract_file, tasks, chunksize=chunksize):
+            for record in records:
+                counts[record['route']] += 1
+                output.write(json.dumps(record) + '\n')
+    return counts
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Extract known-template receipts locally and route the rest to Cortex"
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        help='Receipt PDFs or directories of PDFs'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default='extractions.jsonl',
+        help='Output JSONL file, one record per receipt page (default: extractions.jsonl)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of worker processes (default: CPU count)'
+    )
+    parser.add_argument(
+        '-t', '--threshold',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f'Minimum confidence for local extraction (default: {DEFAULT_THRESHOLD})'
+    )
+
+    args = parser.parse_args()
+
+    tasks = find_pdfs(args.inputs)
+    if not tasks:
+        print("✗ No PDF files found")
+        return
+
+    print("Learning template profiles...")
+    start = time.perf_counter()
+    profiles = build_profiles()
+    print(f"✓ Learned {len(profiles)} template profiles in {time.perf_counter() - start:.1f}s")
+
+    print(f"Extracting {len(tasks)} PDFs...")
+    start = time.perf_counter()
+    counts = extract_files(tasks, args.output, args.workers, args.threshold, profiles)
+    elapsed = time.perf_counter() - start
+
+    total = sum(counts.values())
+    print(f"✓ Extracted {total} receipts in {elapsed:.1f}s ({total / elapsed:.0f} receipts/sec)")
+    print(f"   Local:  {counts[ROUTE_LOCAL]}")
+    print(f"   Cortex: {counts[ROUTE_CORTEX]} (unknown template or confidence < {args.threshold})")
+    print(f"   Output: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Layout-preserving text renditions of receipt PDFs, produced locally.
+
+Every generated receipt already has a clean text layer, so the text that
+AI_PARSE_DOCUMENT(..., {'mode': 'layout'}) would return can be rebuilt from the
+positioned spans instead: spans sharing a baseline form one line, each span is
+indented to its x position (from the page margin) on a fixed character grid, so
+table columns stay aligned, and large vertical gaps become blank lines, so
+sections stay apart.
+
+The records match parsed_receipts: single-page PDFs keep their relative path,
+pages of multi-page PDFs (bundles) are named "<relative_path>#page=N".
+"""
+import os
+import json
+import time
+from multiprocessing import Pool
+
+from text_layer import find_pdfs, read_pages
+
+
+# Width of one output character column, in PDF points (about one 10pt Helvetica character)
+COLUMN_WIDTH = 5.0
+
+# Spans whose vertical centres are closer than this fraction of their height share a line
+LINE_OVERLAP = 0.5
+
+# A vertical gap larger than this many line heights starts a new paragraph (blank line)
+PARAGRAPH_GAP = 1.5
+
+
+def _lines(spans):
+    """Group spans into lines, top to bottom, each sorted left to right."""
+    lines = []
+    for span in sorted(spans, key=lambda s: ((s[2] + s[4]) / 2, s[1])):
+        _, _, y0, _, y1 = span
+        centre = (y0 + y1) / 2
+        if lines:
+            line = lines[-1]
+            if abs(centre - line['centre']) <= LINE_OVERLAP * min(y1 - y0, line['height']):
+                line['spans'].append(span)
+                continue
+        lines.append({'centre': centre, 'height': y1 - y0, 'top': y0, 'bottom': y1, 'spans': [span]})
+    for line in lines:
+        line['spans'].sort(key=lambda s: s[1])
+    return lines
+
+
+def layout_text(spans):
+    """
+    Render a page's spans as layout-preserving plain text.
+
+    Args:
+        spans: Span list of one page (text_layer.page_spans)
+
+    Returns:
+        Page text, one output line per visual line
+    """
+    output = []
+    previous_bottom = None
+    margin = min((span[1] for span in spans), default=0.0)
+    for line in _lines(spans):
+        if previous_bottom is not None and line['top'] - previous_bottom > PARAGRAPH_GAP * line['height']:
+            output.append('')
+        text = ''
+        for span_text, x0, _, _, _ in line['spans']:
+            column = int(round((x0 - margin) / COLUMN_WIDTH))
+            # Always keep at least one space between spans, even when a wide font overruns the grid
+            text += ' ' * max(column - len(text), 1 if text else 0) + span_text
+        output.append(text)
+        previous_bottom = line['bottom']
+    return '\n'.join(output)
+
+
+def parse_pdf(source, relative_path):
+    """
+    Produce the parsed_receipts rows of one PDF.
+
+    Args:
+        source: PDF file path or PDF bytes
+        relative_path: Stage path of the PDF
+
+    Returns:
+        List of {'relative_path', 'content'} dictionaries. Pages without a text
+        layer (and unreadable PDFs) are left out, so they are still parsed by
+        AI_PARSE_DOCUMENT.
+    """
+    try:
+        pages = read_pages(source)
+    except Exception:
+        return []
+    return [
+        {'relative_path': relative_path if len(pages) == 1 else f"{relative_path}#page={number}",
+         'content': layout_text(spans)}
+        for number, spans in enumerate(pages, 1)
+        if spans
+    ]
+
+
+def _parse_file(task):
+    path, relative_path = task
+    return parse_pdf(path, relative_path)
+
+
+def parse_files(tasks, workers=None):
+    """
+    Parse PDFs in a process pool.
+
+    Args:
+        tasks: (path, relative path) pairs from find_pdfs()
+        workers: Number of worker processes (default: CPU count)
+
+    Returns:
+        List of parsed_receipts records, in task order
+    """
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+    records = []
+    with Pool(workers) as pool:
+        for rows in pool.imap(_parse_file, tasks, chunksize=chunksize):
+            records.extend(rows)
+    return records
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Render layout-preserving text of receipt PDFs locally (parsed_receipts rows)"
+    )
+    parser.add_argument(
+        'inputs',
+        nargs='+',
+        help='Receipt PDFs or directories of PDFs'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default='parsed_receipts.jsonl',
+        help='Output JSONL file, one record per receipt page (default: parsed_receipts.jsonl)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of worker processes (default: CPU count)'
+    )
+
+    args = parser.parse_args()
+
+    tasks = find_pdfs(args.inputs)
+    if not tasks:
+        print("✗ No PDF files found")
+        return
+
+    start = time.perf_counter()
+    records = parse_files(tasks, args.workers)
+    elapsed = time.perf_counter() - start
+
+    with open(args.output, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+    print(f"✓ Parsed {len(records)} receipt page(s) from {len(tasks)} PDF(s) in {elapsed:.1f}s "
+          f"({len(records) / elapsed:.0f} pages/sec)")
+    print(f"   Output: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
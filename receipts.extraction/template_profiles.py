@@ -0,0 +1,320 @@
+"""
+Per-template extraction rules learned from the receipt templates themselves.
+
+Each of the 25 templates (22 v1, 3 v2) is rendered a few times with known,
+seeded data. Its text layer is read back exactly as it will be at extraction
+time, and every span is labelled with the ground-truth fields it shows
+(display_list.match_field_spans). From these samples, each template gets:
+
+- constants: span texts (nearly) every sample shows and that carry no field, such as
+  headers, taglines and labels. These fingerprint the template and anchor the
+  rules.
+- rules: for each span shape that carries fields, a regular expression with one
+  group per field, the constant label drawn before it, its place among the
+  spans that follow that label, and the x position (left, right or centre
+  edge) it is always drawn at. Table cells are told apart by position.
+
+Field paths are generalized over list indices ("line_items[*].total"), so a
+rule fills one table row per matching span.
+"""
+import io
+import random
+import re
+import sys
+from pathlib import Path
+
+# The templates and the display-list labelling live in the synthesis directories
+ROOT = Path(__file__).resolve().parent.parent
+for directory in ('receipts.synthesis', 'receipts.synthesis_v2'):
+    if str(ROOT / directory) not in sys.path:
+        sys.path.append(str(ROOT / directory))
+
+from workload_generator import TEMPLATE_FAMILIES, render_receipt
+from display_list import build_field_index, match_field_spans
+from text_layer import read_pages
+
+
+# Samples rendered per template when learning its profile
+PROFILE_SAMPLES = 8
+
+# An edge is "fixed" if it moves less than this across samples (points)
+STABLE_SPREAD = 1.0
+
+# How far a span edge may be from a rule's fixed edge at extraction time (points)
+POSITION_TOLERANCE = 3.0
+
+_LIST_INDEX = re.compile(r'\[\d+\]')
+_DIGITS = re.compile(r'\d[\d.,]*')
+
+
+def generalize(path):
+    """Replace list indices in a field path with [*] ("line_items[2].total" -> "line_items[*].total")."""
+    return _LIST_INDEX.sub('[*]', path)
+
+
+def _signature(text, matches):
+    """
+    Split a span into a rule signature and regular expression.
+
+    Literal digits that are not a field (e.g. "117 days" where the duration is
+    not labelled) are generalized so they do not pin the rule to one sample.
+
+    Returns:
+        Tuple (signature, regex source, field paths, literal character count)
+    """
+    signature = []
+    pattern = ['^']
+    paths = []
+    literal = 0
+    position = 0
+
+    for start, end, path in matches + [(len(text), len(text), None)]:
+        chunk = text[position:start]
+        literal += len(_DIGITS.sub('', chunk))
+        signature.append(_DIGITS.sub('#', chunk))
+        pattern.append(''.join(
+            r'[\d.,]+' if part and part[0].isdigit() else re.escape(part)
+            for part in re.split(r'(\d[\d.,]*)', chunk)
+        ))
+        if path is not None:
+            path = generalize(path)
+            signature.append('{' + path + '}')
+            pattern.append('(.+?)')
+            paths.append(path)
+        position = end
+
+    pattern.append('$')
+    return ''.join(signature), ''.join(pattern), tuple(paths), literal
+
+
+def _fit_groups(pattern, occurrences):
+    """
+    Choose greedy or lazy matching per group so the pattern reproduces the labelled values.
+
+    Lazy groups split "Japan, France, Canada, 18-34" at the first comma; a list
+    field followed by a comma needs a greedy group instead.
+
+    Args:
+        pattern: Regex source with "(.+?)" groups
+        occurrences: List of (span text, labelled values) seen while learning
+
+    Returns:
+        Compiled regex
+    """
+    parts = pattern.split('(.+?)')
+    greedy = [False] * (len(parts) - 1)
+
+    def build():
+        return re.compile(parts[0] + ''.join(
+            ('(.+)' if g else '(.+?)') + rest for g, rest in zip(greedy, parts[1:])
+        ))
+
+    def score(regex):
+        return sum(1 for text, values in occurrences if (m := regex.match(text)) and m.groups() == values)
+
+    best = score(build())
+    for group in range(len(greedy)):
+        if best == len(occurrences):
+            break
+        greedy[group] = True
+        candidate = score(build())
+        if candidate > best:
+            best = candidate
+        else:
+            greedy[group] = False
+    return build()
+
+
+def _leaf_types(data, path=''):
+    """Map every generalized leaf path of receipt data to the Python type of its value."""
+    types = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            types.update(_leaf_types(value, f"{path}.{key}" if path else key))
+    elif isinstance(data, list):
+        for value in data:
+            types.update(_leaf_types(value, f"{path}[*]"))
+    else:
+        types[path] = type(data)
+    return types
+
+
+class TemplateProfile:
+    """Fingerprint and field rules of one vendor template."""
+
+    def __init__(self, family, vendor_index, vendor_name):
+        self.family = family
+        self.vendor_index = vendor_index
+        self.vendor_name = vendor_name
+        self.constants = frozenset()
+        self.rules = {}
+        self.field_types = {}
+        self.expected_fields = ()
+
+    def fingerprint_score(self, texts):
+        """Fraction of this template's constant texts present in a set of span texts."""
+        if not self.constants:
+            return 0.0
+        return len(self.constants & texts) / len(self.constants)
+
+    def match(self, anchor, ordinal, text, x0, x1):
+        """
+        Find the rule that explains a span.
+
+        Args:
+            anchor: Last constant text seen before the span
+            ordinal: Number of non-constant spans between the anchor and this span
+            text: Span text
+            x0, x1: Span left and right edges
+
+        Returns:
+            Tuple (field paths, raw values) or None
+        """
+        edges = (x0, x1, (x0 + x1) / 2)
+        for regex, paths, fixed, rule_ordinal in self.rules.get(anchor, ()):
+            if rule_ordinal is not None and rule_ordinal != ordinal:
+                continue
+            if fixed and not any(abs(edges[axis] - value) <= POSITION_TOLERANCE for axis, value in fixed):
+                continue
+            match = regex.match(text)
+            if match:
+                return paths, match.groups()
+        return None
+
+
+def _render_samples(family, vendor_index, samples):
+    """Render a template with seeded data and read each sample back through the text layer."""
+    generator_class, templates, _, _ = TEMPLATE_FAMILIES[family]
+    generator = generator_class()
+    state = random.getstate()
+    rendered = []
+
+    try:
+        for sample in range(samples):
+            seed = f"profile-{family}-{vendor_index}-{sample}"
+            random.seed(seed)
+            generator.generic.reseed(seed)
+            data = generator.generate_receipt_data()
+            buffer = io.BytesIO()
+            render_receipt(templates[vendor_index], data, buffer)
+            rendered.append((data, read_pages(buffer.getvalue())[0]))
+    finally:
+        random.setstate(state)
+
+    return rendered
+
+
+def learn_profile(family, vendor_index, samples=PROFILE_SAMPLES):
+    """
+    Learn the fingerprint and field rules of one template.
+
+    Args:
+        family: Template family tag ('v1' or 'v2')
+        vendor_index: Index of the template within its family
+        samples: Number of seeded samples to render
+
+    Returns:
+        TemplateProfile
+    """
+    profile = TemplateProfile(family, vendor_index, TEMPLATE_FAMILIES[family][2][vendor_index])
+    rendered = _render_samples(family, vendor_index, samples)
+
+    # Pass 1: label every span and find the texts that are constant across samples
+    labelled = []
+    fieldless = {}
+    with_fields = set()
+    for data, spans in rendered:
+        index = build_field_index(data)
+        owners = {rendering: {generalize(path) for path in paths} for rendering, paths in index}
+        previous = ''
+        near = None
+        sample_spans = []
+        for text, x0, _, x1, _ in spans:
+            matches = match_field_spans(text, index, previous, near)
+            # A value shared by several fields (unit price == total when qty is 1) may get the wrong label
+            ambiguous = any(len(owners[text[start:end]]) > 1 for start, end, _ in matches)
+            sample_spans.append((text, x0, x1, matches, ambiguous))
+            previous = text
+            near = matches[-1][2] if matches else near
+        labelled.append(sample_spans)
+
+        for text in {text for text, _, _, matches, _ in sample_spans if not matches}:
+            fieldless[text] = fieldless.get(text, 0) + 1
+        with_fields.update(text for text, _, _, matches, _ in sample_spans if matches)
+        profile.field_types.update(_leaf_types(data))
+
+    # Labels below long tables can fall off the page, so "constant" means most samples, not all
+    profile.constants = frozenset(
+        text for text, count in fieldless.items()
+        if count * 4 >= samples * 3 and text not in with_fields
+    )
+
+    # Pass 2: collect span shapes per anchor label, with where and how they were seen
+    observed = {}
+    for sample, sample_spans in enumerate(labelled):
+        anchor = None
+        ordinal = 0
+        for text, x0, x1, matches, ambiguous in sample_spans:
+            if text in profile.constants:
+                anchor = text
+                ordinal = 0
+                continue
+            ordinal += 1
+            if not matches:
+                continue
+            signature, pattern, paths, literal = _signature(text, matches)
+            if ambiguous and literal == 0:
+                continue  # a bare value shared by several fields may be labelled with the wrong one
+            entry = observed.setdefault((anchor, signature), {
+                'pattern': pattern, 'paths': paths, 'literal': literal,
+                'samples': set(), 'edges': [], 'ordinals': set(), 'occurrences': [],
+            })
+            entry['samples'].add(sample)
+            entry['edges'].append((x0, x1, (x0 + x1) / 2))
+            entry['ordinals'].add(ordinal - 1)
+            entry['occurrences'].append((text, tuple(text[start:end] for start, end, _ in matches)))
+
+    # Keep shapes seen in at least half the samples; pin each to the edges that never move
+    candidates = {}
+    expected = set()
+    for (anchor, _), entry in observed.items():
+        support = len(entry['samples'])
+        if support * 2 < samples:
+            continue
+        fixed = []
+        for axis in range(3):
+            values = [edges[axis] for edges in entry['edges']]
+            if max(values) - min(values) <= STABLE_SPREAD:
+                fixed.append((axis, sum(values) / len(values)))
+        if not fixed and entry['literal'] == 0:
+            continue  # a bare value with no label text or fixed position cannot be told apart
+        # Scalar fields always sit at the same place after their label; table cells repeat per row
+        repeated = any('[*]' in path for path in entry['paths'])
+        ordinal = None if repeated or len(entry['ordinals']) > 1 else next(iter(entry['ordinals']))
+        candidates.setdefault(anchor, []).append(
+            ((-entry['literal'], not fixed, -len(entry['paths']), -support),
+             (_fit_groups(entry['pattern'], entry['occurrences']), entry['paths'], tuple(fixed), ordinal))
+        )
+        expected.update(entry['paths'])
+
+    # Most specific rules (more label text, pinned position, more fields, more support) are tried first
+    profile.rules = {
+        anchor: [rule for _, rule in sorted(rules, key=lambda r: r[0])]
+        for anchor, rules in candidates.items()
+    }
+    profile.expected_fields = tuple(sorted(expected))
+    return profile
+
+
+def build_profiles(samples=PROFILE_SAMPLES):
+    """
+    Learn the profiles of every template in every family.
+
+    Returns:
+        List of TemplateProfile, v1 templates first
+    """
+    return [
+        learn_profile(family, vendor_index, samples)
+        for family, (_, templates, _, _) in TEMPLATE_FAMILIES.items()
+        for vendor_index in range(len(templates))
+    ]
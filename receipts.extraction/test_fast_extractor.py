@@ -0,0 +1,158 @@
+"""Quick test script to verify the local fast extractor against generated ground truth."""
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from reportlab.pdfgen import canvas
+
+from classifier import VENDOR_FAMILIES, classify_pdf, classify_text
+from fast_extractor import FastExtractor, extract_files, find_pdfs, ROUTE_LOCAL, ROUTE_CORTEX
+from layout_text import parse_pdf
+from template_profiles import build_profiles
+from text_layer import read_pages
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'receipts.synthesis'))
+from workload_generator import TEMPLATE_FAMILIES, WorkloadGenerator, render_receipt
+from display_list import build_field_index
+
+
+def test_fast_extractor():
+    """Extract a generated mixed workload and compare local results with the manifest."""
+    print("Testing Fast Extractor...")
+    print("="*60)
+
+    output_dir = "../receipts_test_extraction"
+    records = WorkloadGenerator(output_dir=output_dir, workers=2, seed=11).generate(count=50)
+    truth = {record['filename']: record for record in records}
+
+    profiles = build_profiles()
+    print(f"\n✓ Learned {len(profiles)} template profiles")
+
+    output_path = os.path.join(output_dir, 'extractions.jsonl')
+    counts = extract_files(find_pdfs([output_dir]), output_path, workers=2, profiles=profiles)
+
+    wrong = []
+    with open(output_path) as f:
+        for line in f:
+            result = json.loads(line)
+            record = truth.get(result['relative_path'])
+            if record is None or result['route'] != ROUTE_LOCAL:
+                continue
+            extracted = result['extracted_data']
+            transaction = extracted['transaction']
+            if (result['vendor_name'] != record['vendor_name']
+                    or transaction.get('receipt_id', transaction.get('transaction_id')) != record['data']['transaction_id']
+                    or abs(float(extracted['financials']['total']) - record['data']['total']) > 0.01):
+                wrong.append(result['relative_path'])
+
+    # A document from no known template must be routed to Cortex
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    c.drawString(72, 720, "Handwritten invoice #42 - total $99.00")
+    c.save()
+    unknown = FastExtractor(profiles).extract_pdf(buffer.getvalue(), 'unknown.pdf')[0]
+
+    print("\n" + "="*60)
+    if wrong:
+        print(f"✗ {len(wrong)} locally extracted receipts disagree with ground truth: {wrong[:3]}")
+        return False
+    if counts[ROUTE_LOCAL] < 0.8 * len(records):
+        print(f"✗ Only {counts[ROUTE_LOCAL]}/{len(records)} receipts were extracted locally")
+        return False
+    if unknown['route'] != ROUTE_CORTEX:
+        print("✗ A document from an unknown template was not routed to Cortex")
+        return False
+
+    print(f"✓ {counts[ROUTE_LOCAL]} receipts extracted locally, {counts[ROUTE_CORTEX]} routed to Cortex")
+    print("✓ Local extractions match ground truth (vendor, transaction ID, total)")
+    print("✓ Unknown template routed to Cortex")
+    return True
+
+
+def test_classifier():
+    """Classify one receipt per template, parsed-text content and an unknown document."""
+    print("\nTesting Receipt Classifier...")
+    print("="*60)
+
+    known = {name: family for family, (_, _, names, _) in TEMPLATE_FAMILIES.items() for name in names}
+    if known != VENDOR_FAMILIES:
+        print("✗ VENDOR_FAMILIES does not match the template vendor names")
+        return False
+
+    wrong = []
+    for family, (generator_class, templates, names, _) in TEMPLATE_FAMILIES.items():
+        generator = generator_class()
+        for template, vendor_name in zip(templates, names):
+            buffer = io.BytesIO()
+            render_receipt(template, generator.generate_receipt_data(), buffer)
+            result = classify_pdf(buffer.getvalue(), 'receipt.pdf')[0]
+            if (result['family'], result['vendor_name']) != (family, vendor_name):
+                wrong.append(f"{vendor_name}: {result}")
+
+    # AI_PARSE_DOCUMENT layout content renders tables as markdown
+    parsed = classify_text("# GLOBAL MEDIA PARTNERS\n| Market | Minimum (USD) | Reach |\n|---|---|---|")
+    unknown = classify_text("Handwritten invoice #42 - total $99.00")
+
+    print("\n" + "="*60)
+    if wrong:
+        print(f"✗ {len(wrong)} templates misclassified: {wrong[:3]}")
+        return False
+    if parsed != {'family': 'v2', 'vendor_name': 'Global Media Partners'}:
+        print(f"✗ Parsed v2 content misclassified: {parsed}")
+        return False
+    if unknown['family'] != 'unknown':
+        print(f"✗ Unknown document classified as {unknown['family']}")
+        return False
+
+    print(f"✓ All {len(known)} templates classified with the right family and vendor")
+    print("✓ Parsed markdown content classified")
+    print("✓ Unknown document classified as unknown")
+    return True
+
+
+def test_layout_text():
+    """Render every template's text layer as layout text and check no printed value is lost."""
+    print("\nTesting Layout Text Parser...")
+    print("="*60)
+
+    lost = []
+    misaligned = []
+    for family, (generator_class, templates, names, _) in TEMPLATE_FAMILIES.items():
+        generator = generator_class()
+        for template, vendor_name in zip(templates, names):
+            data = generator.generate_receipt_data()
+            buffer = io.BytesIO()
+            render_receipt(template, data, buffer)
+            spans = [span[0] for span in read_pages(buffer.getvalue())[0]]
+            content = parse_pdf(buffer.getvalue(), 'receipt.pdf')[0]['content']
+
+            # Values drawn within one span must survive line grouping and column padding
+            flat = ' '.join(content.split())
+            missing = [
+                rendering for rendering, _ in build_field_index(data, vendor_name)
+                if any(rendering in span for span in spans) and rendering not in flat
+            ]
+            if missing:
+                lost.append(f"{vendor_name}: {missing[:3]}")
+            # Table headers drawn on one row stay on one line
+            header = ('Market', 'Reach') if family == 'v2' else ('Description', 'Qty')
+            if not any(all(h in line for h in header) for line in content.splitlines()):
+                misaligned.append(vendor_name)
+
+    print("\n" + "="*60)
+    if lost:
+        print(f"✗ Printed values missing from layout text: {lost[:3]}")
+        return False
+    if misaligned:
+        print(f"✗ Table header split across lines: {misaligned[:3]}")
+        return False
+
+    print("✓ Every printed value of every template is in the layout text")
+    print("✓ Table headers keep their row")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_fast_extractor() and test_classifier() and test_layout_text()
+    exit(0 if success else 1)
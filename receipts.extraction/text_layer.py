@@ -0,0 +1,65 @@
+"""Read the text layer of receipt PDFs as positioned text spans."""
+import os
+
+import pymupdf
+
+
+# Plain span extraction: no ligature/whitespace preservation or image blocks (the fastest mode)
+TEXT_FLAGS = 0
+
+
+def page_spans(page):
+    """
+    Return the text spans of a PyMuPDF page in content-stream order.
+
+    Args:
+        page: pymupdf.Page
+
+    Returns:
+        List of (text, x0, y0, x1, y1) tuples with whitespace runs collapsed.
+        Coordinates are PDF points with the origin at the top-left of the page
+        (PyMuPDF convention).
+    """
+    spans = []
+    for block in page.get_text('dict', flags=TEXT_FLAGS)['blocks']:
+        for line in block.get('lines', ()):
+            for span in line['spans']:
+                # Collapse padding ("$ {:>6}") so labels read the same whatever the value width
+                text = ' '.join(span['text'].split())
+                if text:
+                    x0, y0, x1, y1 = span['bbox']
+                    spans.append((text, x0, y0, x1, y1))
+    return spans
+
+
+def read_pages(source):
+    """
+    Read the spans of every page of a PDF.
+
+    Args:
+        source: PDF file path or PDF bytes
+
+    Returns:
+        List with one span list (see page_spans) per page
+    """
+    if isinstance(source, (bytes, bytearray)):
+        doc = pymupdf.open(stream=source, filetype='pdf')
+    else:
+        doc = pymupdf.open(source)
+    with doc:
+        return [page_spans(page) for page in doc]
+
+
+def find_pdfs(inputs):
+    """Expand files and directories into (path, relative path) pairs for every PDF."""
+    tasks = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if name.lower().endswith('.pdf'):
+                        path = os.path.join(root, name)
+                        tasks.append((path, os.path.relpath(path, item).replace(os.sep, '/')))
+        elif item.lower().endswith('.pdf'):
+            tasks.append((item, os.path.basename(item)))
+    return tasks
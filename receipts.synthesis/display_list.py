@@ -0,0 +1,239 @@
+"""Record the display list of a rendered receipt and tie it to ground-truth fields."""
+import json
+import os
+from reportlab.pdfbase.pdfmetrics import getAscentDescent, stringWidth
+from reportlab.pdfgen import canvas
+
+
+class RecordingCanvas(canvas.Canvas):
+    """
+    reportlab canvas that records every drawString / drawRightString /
+    drawCentredString call, including the cells drawn by platypus Tables.
+
+    Recording only appends a tuple per call; text widths, bounding boxes and
+    field labels are computed afterwards by display_list_entries(). Text flowed
+    through Paragraphs (the TechAds Pro campaign summary) is not recorded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.display_list = []
+        self.page_sizes = {}
+
+    def _record(self, x, y, text, align):
+        self.display_list.append(
+            (self._pageNumber, text, x, y, align, self._fontname, self._fontsize, self._currentMatrix)
+        )
+
+    def showPage(self):
+        self.page_sizes[self._pageNumber] = tuple(self._pagesize)
+        super().showPage()
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        self._record(x, y, text, 'left')
+        super().drawString(x, y, text, *args, **kwargs)
+
+    def drawRightString(self, x, y, text, *args, **kwargs):
+        self._record(x, y, text, 'right')
+        super().drawRightString(x, y, text, *args, **kwargs)
+
+    def drawCentredString(self, x, y, text, *args, **kwargs):
+        self._record(x, y, text, 'centre')
+        super().drawCentredString(x, y, text, *args, **kwargs)
+
+
+def _bbox(x, y, text, align, font_name, font_size, matrix):
+    """Axis-aligned bounding box (x0, y0, x1, y1) of a drawn string in page coordinates."""
+    width = stringWidth(text, font_name, font_size)
+    if align == 'right':
+        x -= width
+    elif align == 'centre':
+        x -= width / 2
+    ascent, descent = getAscentDescent(font_name, font_size)
+
+    a, b, c, d, e, f = matrix
+    corners = [
+        (a * px + c * py + e, b * px + d * py + f)
+        for px, py in ((x, y + descent), (x + width, y + descent), (x, y + ascent), (x + width, y + ascent))
+    ]
+    xs = [p[0] for p in corners]
+    ys = [p[1] for p in corners]
+    return [round(min(xs), 2), round(min(ys), 2), round(max(xs), 2), round(max(ys), 2)]
+
+
+def _renderings(value):
+    """The ways a template may format a ground-truth value."""
+    if isinstance(value, bool):
+        return []
+    if isinstance(value, int):
+        return [f"{value:,}", str(value)]
+    if isinstance(value, float):
+        return [f"{value:,.2f}", f"{value:.2f}", f"{value:.1f}", f"{value:,.0f}", f"{value:.0f}", str(value)]
+    if isinstance(value, str) and value:
+        return [value, value.upper()]
+    return []
+
+
+def _flatten(data, path=''):
+    """Yield (field path, value) for every leaf of a receipt data dictionary."""
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _flatten(value, f"{path}.{key}" if path else key)
+    elif isinstance(data, list):
+        for i, value in enumerate(data):
+            yield from _flatten(value, f"{path}[{i}]")
+    else:
+        yield path, data
+
+
+def build_field_index(data, vendor_name=None):
+    """
+    Map every rendering of every ground-truth value to the fields that hold it.
+
+    Args:
+        data: Receipt data dictionary
+        vendor_name: Template vendor name, indexed as the 'vendor_name' field
+
+    Returns:
+        List of (rendering, [field paths]) pairs, longest rendering first
+    """
+    leaves = list(_flatten(data))
+    if vendor_name:
+        # Some headers split the vendor name over several lines ("CLICK" / "VELOCITY")
+        leaves[:0] = [('vendor_name', part) for part in [vendor_name] + vendor_name.split()]
+
+    index = {}
+    for path, value in leaves:
+        for rendering in _renderings(value):
+            paths = index.setdefault(rendering, [])
+            if path not in paths:
+                paths.append(path)
+    return sorted(index.items(), key=lambda item: -len(item[0]))
+
+
+def _leaf_name(path):
+    """Last key of a field path, as it would read in a label ("line_items[0].unit_price" -> "unit price")."""
+    return path.rsplit('.', 1)[-1].split('[')[0].replace('_', ' ')
+
+
+def _shared_prefix(a, b):
+    return len(os.path.commonprefix([a, b]))
+
+
+def _pick(paths, label, near):
+    """
+    Choose among fields sharing a value (e.g. subtotal == total): prefer a field
+    named in the nearby label text, then the field closest to the previously
+    matched one (the same table row), then the first.
+    """
+    if len(paths) == 1:
+        return paths[0]
+    label = label.lower()
+    named = [path for path in paths if _leaf_name(path) in label]
+    if named:
+        return max(named, key=lambda path: len(_leaf_name(path)))
+    if near:
+        return max(paths, key=lambda path: _shared_prefix(path, near))
+    return paths[0]
+
+
+def match_field_spans(text, field_index, context='', near=None):
+    """
+    Locate the ground-truth fields a drawn string shows.
+
+    A string equal to a rendering (ignoring "$", "%" and surrounding space) is
+    that field; otherwise non-overlapping renderings of at least 3 characters
+    (or decimals such as "7.0") found between word boundaries are matched,
+    longest first. Labels and decoration match nothing.
+
+    Args:
+        text: Drawn string
+        field_index: Result of build_field_index()
+        context: Text drawn just before (usually the label of a value)
+        near: Field matched by the previous string, used to break ties
+
+    Returns:
+        List of (start, end, field path) in reading order
+    """
+    bare = text.strip().strip('$%').strip()
+    for rendering, paths in field_index:
+        if bare == rendering:
+            start = text.find(rendering)
+            return [(start, start + len(rendering), _pick(paths, f"{context} {text}", near))]
+
+    matches = []
+    for rendering, paths in field_index:
+        if len(rendering) < 3 and '.' not in rendering:
+            continue
+        start = text.find(rendering)
+        while start != -1:
+            end = start + len(rendering)
+            bounded = (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+            if bounded and not any(start < e and s < end for s, e, _ in matches):
+                matches.append((start, end, _pick(paths, f"{context} {text[:start]}", near)))
+            start = text.find(rendering, end)
+
+    return sorted(matches)
+
+
+def match_fields(text, field_index, context='', near=None):
+    """Return the ground-truth fields a drawn string shows, in reading order (see match_field_spans)."""
+    return [path for _, _, path in match_field_spans(text, field_index, context, near)]
+
+
+def display_list_entries(recorded, receipts):
+    """
+    Convert recorded draw calls to labelled display-list entries.
+
+    Args:
+        recorded: RecordingCanvas.display_list
+        receipts: List of (page_start, page_end, data, vendor_name) for the receipts drawn on the canvas
+
+    Returns:
+        List of {'field', 'text', 'bbox', 'page'} dictionaries (bbox in PDF points,
+        origin at the bottom-left of the page). 'field' is the first field shown by
+        the string; strings showing several fields also list them all in 'fields'.
+    """
+    indexes = [
+        (page_start, page_end, build_field_index(data, vendor_name))
+        for page_start, page_end, data, vendor_name in receipts
+    ]
+    entries = []
+    previous = ''
+    near = None
+
+    for page, text, x, y, align, font_name, font_size, matrix in recorded:
+        text = str(text)
+        field_index = next((index for start, end, index in indexes if start <= page <= end), [])
+        fields = match_fields(text, field_index, previous, near)
+        entry = {
+            'field': fields[0] if fields else None,
+            'text': text,
+            'bbox': _bbox(x, y, text, align, font_name, font_size, matrix),
+            'page': page,
+        }
+        if len(fields) > 1:
+            entry['fields'] = fields
+        entries.append(entry)
+        previous = text
+        near = fields[-1] if fields else near
+
+    return entries
+
+
+def write_display_list(path, filename, c, receipts):
+    """
+    Write the display list of a saved RecordingCanvas as a JSON sidecar file.
+
+    Args:
+        path: Output path (conventionally "<pdf>.layout.json")
+        filename: PDF filename the display list belongs to
+        c: RecordingCanvas the receipts were drawn on (after save())
+        receipts: List of (page_start, page_end, data, vendor_name) for the receipts drawn on the canvas
+    """
+    with open(path, 'w') as f:
+        json.dump({
+            'filename': filename,
+            'page_sizes': {str(page): list(size) for page, size in c.page_sizes.items()},
+            'entries': display_list_entries(c.display_list, receipts),
+        }, f)
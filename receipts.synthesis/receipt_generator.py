@@ -1,4 +1,5 @@
 """Main receipt generator script for creating synthetic ad-campaign receipts."""
+import io
 import os
 import random
 from datetime import datetime
@@ -26,17 +27,8 @@ class ReceiptGenerator:
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
     
-    def generate_single_receipt(self, vendor_index=None, filename=None):
-        """
-        Generate a single receipt PDF.
-        
-        Args:
-            vendor_index: Index of the vendor template to use (0-21). If None, random.
-            filename: Custom filename for the PDF. If None, auto-generated.
-        
-        Returns:
-            Path to the generated PDF file
-        """
+    def _prepare_receipt(self, vendor_index=None, filename=None):
+        """Pick the template, generate the data and name the file of one receipt."""
         # Select vendor template
         if vendor_index is None:
             vendor_index = random.randint(0, len(self.templates) - 1)
@@ -59,6 +51,20 @@ class ReceiptGenerator:
         if not filename.endswith('.pdf'):
             filename += '.pdf'
         
+        return template, data, filename
+    
+    def generate_single_receipt(self, vendor_index=None, filename=None):
+        """
+        Generate a single receipt PDF.
+        
+        Args:
+            vendor_index: Index of the vendor template to use (0-21). If None, random.
+            filename: Custom filename for the PDF. If None, auto-generated.
+        
+        Returns:
+            Path to the generated PDF file
+        """
+        template, data, filename = self._prepare_receipt(vendor_index, filename)
         filepath = os.path.join(self.output_dir, filename)
         
         # Create PDF
@@ -68,6 +74,26 @@ class ReceiptGenerator:
         
         return filepath
     
+    def render_single_receipt(self, vendor_index=None, filename=None):
+        """
+        Render a single receipt PDF in memory, without writing it to the output directory.
+        
+        Args:
+            vendor_index: Index of the vendor template to use (0-21). If None, random.
+            filename: Custom filename for the PDF. If None, auto-generated.
+        
+        Returns:
+            Tuple (filename, PDF bytes)
+        """
+        template, data, filename = self._prepare_receipt(vendor_index, filename)
+        buffer = io.BytesIO()
+        
+        c = canvas.Canvas(buffer)
+        template(c, data)
+        c.save()
+        
+        return filename, buffer.getvalue()
+    
     def generate_batch(self, count=10, vendor_index=None):
         """
         Generate a batch of receipts.
@@ -0,0 +1,69 @@
+"""Quick test script to verify the mixed v1/v2 workload generator works correctly."""
+from workload_generator import WorkloadGenerator, parse_weights, MANIFEST_NAME
+import json
+import os
+
+
+def test_workload_generator():
+    """Test a small mixed run that exercises both template families."""
+    print("Testing Workload Generator...")
+    print("="*60)
+
+    generator = WorkloadGenerator(
+        output_dir="../receipts_test_workload",
+        weights=parse_weights("v1=0.5,v2=0.5"),
+        workers=2,
+        seed=42
+    )
+
+    print(f"\n✓ Generator initialized with {len(generator.slots)} templates and {generator.workers} workers")
+
+    records = generator.generate(count=20)
+    families = {record['family'] for record in records}
+    missing = [r['filename'] for r in records if not os.path.exists(os.path.join(generator.output_dir, r['filename']))]
+
+    with open(os.path.join(generator.output_dir, MANIFEST_NAME)) as f:
+        manifest_families = {json.loads(line)['family'] for line in f}
+
+    print("\n" + "="*60)
+    if len(records) != 20 or missing:
+        print(f"✗ Expected 20 receipts, got {len(records)} ({len(missing)} missing on disk)")
+        return False
+    if families != {'v1', 'v2'} or not families <= manifest_families:
+        print(f"✗ Expected both families in the run and manifest, got {sorted(families)}")
+        return False
+
+    print(f"✓ Generated {len(records)} receipts across families: {', '.join(sorted(families))}")
+    print(f"✓ Receipts saved to: {generator.output_dir}/")
+    return True
+
+
+
+def test_display_list():
+    """Test that --display-list writes a labelled layout sidecar per PDF."""
+    print("\nTesting display-list capture...")
+    print("="*60)
+
+    generator = WorkloadGenerator(
+        output_dir="../receipts_test_workload",
+        workers=2,
+        seed=7,
+        display_list=True
+    )
+    records = generator.generate(count=6)
+
+    for record in records:
+        with open(os.path.join(generator.output_dir, record['layout'])) as f:
+            layout = json.load(f)
+        fields = {entry['field'] for entry in layout['entries']}
+        if 'transaction_id' not in fields or 'total' not in fields:
+            print(f"✗ {record['layout']} is missing transaction_id/total entries")
+            return False
+
+    print(f"✓ Wrote {len(records)} display lists with labelled field bounding boxes")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_workload_generator() and test_display_list()
+    exit(0 if success else 1)
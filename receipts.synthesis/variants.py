@@ -0,0 +1,179 @@
+"""Near-duplicate and re-render variants of existing ground-truth receipts."""
+import copy
+import json
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+
+# Variant kinds:
+#   duplicate  - byte-identical copy of an existing receipt PDF
+#   retemplate - same ground-truth data rendered through a different vendor template
+#   mutate     - same template with one or two small field mutations
+VARIANT_KINDS = ('duplicate', 'retemplate', 'mutate')
+
+
+def data_hash(data):
+    """Return a stable hash of receipt ground-truth data (independent of the template)."""
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def parse_variant_ratios(spec):
+    """
+    Parse a variant ratio specification string.
+
+    Args:
+        spec: Comma-separated ratios, e.g. "duplicate=0.1,retemplate=0.05,mutate=0.05".
+              Ratios are fractions of the generated stream; the remainder is fresh receipts.
+
+    Returns:
+        Dictionary mapping variant kinds to float ratios
+    """
+    ratios = {}
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        kind, _, value = part.partition('=')
+        if kind not in VARIANT_KINDS:
+            raise ValueError(f"Unknown variant kind '{kind}' (expected one of {', '.join(VARIANT_KINDS)})")
+        ratios[kind] = float(value)
+
+    if sum(ratios.values()) > 1.0 + 1e-9:
+        raise ValueError(f"Variant ratios in '{spec}' add up to more than 1")
+    return ratios
+
+
+def load_manifest(manifest_path):
+    """
+    Load ground-truth records from a manifest.jsonl file.
+
+    Each record gets a 'source_dir' key pointing at the directory holding its PDF.
+
+    Returns:
+        List of manifest records (empty if the manifest does not exist)
+    """
+    if not os.path.exists(manifest_path):
+        return []
+
+    source_dir = os.path.dirname(os.path.abspath(manifest_path))
+    records = []
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if 'data' in record:
+                record['source_dir'] = source_dir
+                records.append(record)
+    return records
+
+
+def _shift_date(value, days):
+    """Shift a YYYY-MM-DD string by a number of days."""
+    try:
+        return (datetime.strptime(value, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return value
+
+
+def _mutate_transaction_id(data, rng):
+    """Change one or two digits of the transaction number (never its leading digit)."""
+    prefix, _, number = data['transaction_id'].partition('-')
+    digits = list(number)
+    for i in rng.sample(range(1, len(digits)), min(rng.randint(1, 2), len(digits) - 1)):
+        digits[i] = rng.choice([d for d in '0123456789' if d != digits[i]])
+    data['transaction_id'] = f"{prefix}-{''.join(digits)}"
+
+
+def _mutate_date(data, rng):
+    data['date'] = _shift_date(data['date'], rng.choice([-2, -1, 1, 2]))
+
+
+def _mutate_campaign_name(data, rng):
+    words = data['campaign_name'].split(' ')
+    words[-1] = rng.choice([w for w in ['Q1', 'Q2', 'Q3', 'Q4', '2024', '2025', '2026'] if w != words[-1]])
+    data['campaign_name'] = ' '.join(words)
+
+
+def _mutate_line_item(data, rng):
+    """Change one v1 line item quantity and recompute the totals."""
+    item = rng.choice(data['line_items'])
+    item['quantity'] = max(1, item['quantity'] + rng.choice([-1, 1]))
+    item['total'] = round(item['quantity'] * item['unit_price'], 2)
+    data['subtotal'] = sum(i['total'] for i in data['line_items'])
+    data['tax'] = round(data['subtotal'] * data['tax_rate'], 2)
+    data['total'] = data['subtotal'] + data['tax']
+
+
+def _mutate_market(data, rng):
+    """Change one v2 market minimum and recompute the totals."""
+    table = rng.choice(data['pricing_tables'])
+    market = rng.choice(table['markets'])
+    market['min_value_usd'] = max(500, market['min_value_usd'] + rng.choice([-500, -100, 100, 500]))
+    subtotal = sum(sum(m['min_value_usd'] for m in t['markets']) for t in data['pricing_tables'])
+    data['subtotal'] = subtotal
+    data['tax'] = subtotal * 0.08
+    data['total'] = subtotal * 1.08
+
+
+# Field mutations available per template family
+MUTATIONS = {
+    'v1': [_mutate_transaction_id, _mutate_date, _mutate_campaign_name, _mutate_line_item],
+    'v2': [_mutate_transaction_id, _mutate_date, _mutate_campaign_name, _mutate_market],
+}
+
+
+def mutate_receipt_data(data, family, rng, max_mutations=2):
+    """
+    Apply one or two small field mutations to a copy of receipt data.
+
+    Args:
+        data: Ground-truth receipt data from a manifest record
+        family: Template family tag ('v1' or 'v2')
+        rng: random.Random instance
+        max_mutations: Maximum number of fields to change
+
+    Returns:
+        Tuple (mutated data, list of mutated field names)
+    """
+    mutated = copy.deepcopy(data)
+    mutations = rng.sample(MUTATIONS[family], rng.randint(1, max_mutations))
+    for mutation in mutations:
+        mutation(mutated, rng)
+    return mutated, [m.__name__.replace('_mutate_', '') for m in mutations]
+
+
+def plan_variant(kind, source, template_count, rng):
+    """
+    Build the render specification for one variant of a source record.
+
+    Args:
+        kind: Variant kind (see VARIANT_KINDS)
+        source: Manifest record to derive the variant from
+        template_count: Number of templates in the source record's family
+        rng: random.Random instance
+
+    Returns:
+        Tuple (vendor_index, variant dict) or None if the variant cannot be built
+    """
+    vendor_index = source['vendor_index']
+    variant = {'kind': kind, 'source': source['filename'], 'data': source['data']}
+
+    if kind == 'duplicate':
+        # A receipt inside a bundle has no PDF of its own to copy
+        if 'page_start' in source:
+            return None
+        source_path = os.path.join(source.get('source_dir', ''), source['filename'])
+        if not os.path.exists(source_path):
+            return None
+        variant['source_path'] = source_path
+    elif kind == 'retemplate':
+        if template_count < 2:
+            return None
+        vendor_index = rng.choice([i for i in range(template_count) if i != source['vendor_index']])
+    elif kind == 'mutate':
+        variant['data'], variant['mutations'] = mutate_receipt_data(source['data'], source['family'], rng)
+
+    return vendor_index, variant
@@ -0,0 +1,507 @@
+"""Mixed workload generator that renders v1 and v2 receipts from a single worker pool."""
+import os
+import sys
+import json
+import random
+import shutil
+import time
+from datetime import datetime
+from multiprocessing import Pool
+from pathlib import Path
+from reportlab.pdfgen import canvas
+
+# The v2 templates live in the sibling receipts.synthesis_v2 directory
+V2_DIR = Path(__file__).resolve().parent.parent / 'receipts.synthesis_v2'
+if str(V2_DIR) not in sys.path:
+    sys.path.append(str(V2_DIR))
+
+from data_generator import DataGenerator
+from vendors import VENDOR_TEMPLATES, VENDOR_NAMES
+from data_generator_v2 import DataGeneratorV2
+from vendors_v2 import VENDOR_TEMPLATES_V2, VENDOR_NAMES_V2
+from variants import VARIANT_KINDS, data_hash, load_manifest, parse_variant_ratios, plan_variant
+from display_list import RecordingCanvas, write_display_list
+
+
+# Template families: tag -> (data generator class, templates, vendor names, filename prefix)
+TEMPLATE_FAMILIES = {
+    'v1': (DataGenerator, VENDOR_TEMPLATES, VENDOR_NAMES, 'receipt_'),
+    'v2': (DataGeneratorV2, VENDOR_TEMPLATES_V2, VENDOR_NAMES_V2, 'receipt_v2_'),
+}
+
+# Default family weights are proportional to template counts (uniform over all 25 templates)
+DEFAULT_WEIGHTS = {'v1': len(VENDOR_TEMPLATES), 'v2': len(VENDOR_TEMPLATES_V2)}
+
+# Name of the manifest written next to the generated PDFs
+MANIFEST_NAME = 'manifest.jsonl'
+
+# Filename prefix of multi-receipt bundle PDFs
+BUNDLE_PREFIX = 'bundle_'
+
+# Suffix of the display-list sidecar written next to a PDF ("<pdf>.layout.json")
+LAYOUT_SUFFIX = '.layout.json'
+
+
+def parse_weights(spec):
+    """
+    Parse a weight specification string.
+
+    Args:
+        spec: Comma-separated weights, e.g. "v1=0.8,v2=0.2". A key of the form
+              "v1:5" weights a single template of a family.
+
+    Returns:
+        Dictionary mapping family tags (or "family:index" keys) to float weights
+    """
+    weights = {}
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        key, _, value = part.partition('=')
+        family = key.split(':')[0]
+        if family not in TEMPLATE_FAMILIES:
+            raise ValueError(f"Unknown template family '{family}' in weights '{spec}'")
+        weights[key] = float(value)
+    return weights
+
+
+def build_template_mix(weights=None):
+    """
+    Expand family/template weights into a flat list of weighted template slots.
+
+    A family weight is split evenly across its templates; a "family:index"
+    weight replaces the share of that single template.
+
+    Args:
+        weights: Dictionary from parse_weights(). If None, DEFAULT_WEIGHTS is used.
+
+    Returns:
+        Tuple (slots, slot_weights) where slots is a list of (family, vendor_index)
+    """
+    weights = weights or DEFAULT_WEIGHTS
+    slots = []
+    slot_weights = []
+
+    for family, (_, templates, _, _) in TEMPLATE_FAMILIES.items():
+        family_weight = weights.get(family, 0.0)
+        for index in range(len(templates)):
+            weight = weights.get(f"{family}:{index}", family_weight / len(templates))
+            if weight > 0:
+                slots.append((family, index))
+                slot_weights.append(weight)
+
+    if not slots:
+        raise ValueError("Template weights select no templates")
+
+    return slots, slot_weights
+
+
+def render_receipt(template, data, target, canvas_class=canvas.Canvas):
+    """
+    Render receipt data through a vendor template.
+
+    Args:
+        template: Vendor template function taking (canvas, data)
+        data: Receipt data dictionary
+        target: File path or writable binary file object
+        canvas_class: Canvas class to draw on (RecordingCanvas to capture the display list)
+
+    Returns:
+        The saved canvas
+    """
+    c = canvas_class(target)
+    template(c, data)
+    c.save()
+    return c
+
+
+def render_pages(c, template, data):
+    """
+    Render one receipt onto the next page(s) of a shared multi-page canvas.
+
+    Args:
+        c: reportlab canvas positioned at the start of a fresh page
+        template: Vendor template function taking (canvas, data)
+        data: Receipt data dictionary
+
+    Returns:
+        Tuple (page_start, page_end) of 1-based page numbers used by the receipt
+    """
+    page_start = c.getPageNumber()
+    template(c, data)
+    # v1 templates leave their page open, v2 templates finish it with showPage()
+    if c.getPageNumber() == page_start:
+        c.showPage()
+    return page_start, c.getPageNumber() - 1
+
+
+# Per-process state, created once by _init_worker so mimesis providers are not rebuilt per receipt
+_worker_state = {}
+
+
+def _init_worker(output_dir, seed, display_list=False):
+    """Initialize data generators for every template family in a worker process."""
+    _worker_state['output_dir'] = output_dir
+    _worker_state['seed'] = seed
+    _worker_state['canvas_class'] = RecordingCanvas if display_list else canvas.Canvas
+    _worker_state['generators'] = {
+        family: generator_class()
+        for family, (generator_class, _, _, _) in TEMPLATE_FAMILIES.items()
+    }
+
+
+def _receipt_data(seq, family, variant):
+    """Return the ground-truth data for a task: fresh data, or the variant's data."""
+    if variant is not None:
+        return variant['data']
+
+    data_generator = _worker_state['generators'][family]
+
+    # Seed per receipt so a seeded run is reproducible regardless of worker scheduling
+    if _worker_state['seed'] is not None:
+        random.seed(f"{_worker_state['seed']}-{seq}")
+        data_generator.generic.reseed(f"{_worker_state['seed']}-{seq}")
+
+    return data_generator.generate_receipt_data()
+
+
+def _write_layout(filepath, c, receipts):
+    """Write the display-list sidecar of a saved canvas if it was recorded; return its filename."""
+    if not isinstance(c, RecordingCanvas):
+        return None
+    write_display_list(filepath + LAYOUT_SUFFIX, os.path.basename(filepath), c, receipts)
+    return os.path.basename(filepath) + LAYOUT_SUFFIX
+
+
+def _manifest_record(filename, family, vendor_index, data, variant):
+    """Build the manifest record for one rendered receipt."""
+    record = {
+        'filename': filename,
+        'family': family,
+        'vendor_index': vendor_index,
+        'vendor_name': TEMPLATE_FAMILIES[family][2][vendor_index],
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'data_hash': data_hash(data),
+        'data': data,
+    }
+    if variant is not None:
+        record['variant'] = variant['kind']
+        record['variant_of'] = variant['source']
+        if 'mutations' in variant:
+            record['mutations'] = variant['mutations']
+    return record
+
+
+def _render_task(task):
+    """
+    Render one (sequence, family, vendor_index, variant) task to its own PDF.
+
+    Fresh tasks (variant is None) generate new data; variant tasks re-render or
+    copy the ground-truth data of an existing receipt.
+
+    Returns:
+        List with the task's manifest record (or an error record)
+    """
+    seq, family, vendor_index, variant = task
+    _, templates, vendor_names, prefix = TEMPLATE_FAMILIES[family]
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    safe_vendor_name = vendor_names[vendor_index].replace(" ", "_").replace("/", "_")
+    filename = f"{prefix}{safe_vendor_name}_{timestamp}_{seq:06d}.pdf"
+    filepath = os.path.join(_worker_state['output_dir'], filename)
+
+    try:
+        data = _receipt_data(seq, family, variant)
+        layout = None
+        if variant is not None and variant['kind'] == 'duplicate':
+            shutil.copyfile(variant['source_path'], filepath)
+            if os.path.exists(variant['source_path'] + LAYOUT_SUFFIX):
+                shutil.copyfile(variant['source_path'] + LAYOUT_SUFFIX, filepath + LAYOUT_SUFFIX)
+                layout = filename + LAYOUT_SUFFIX
+        else:
+            c = render_receipt(templates[vendor_index], data, filepath, _worker_state['canvas_class'])
+            layout = _write_layout(filepath, c, [(1, c.getPageNumber(), data, vendor_names[vendor_index])])
+    except Exception as e:
+        return [{'seq': seq, 'family': family, 'error': str(e)}]
+
+    record = _manifest_record(filename, family, vendor_index, data, variant)
+    if layout:
+        record['layout'] = layout
+    return [record]
+
+
+def _render_bundle_task(bundle):
+    """
+    Render a (bundle_sequence, tasks) group as consecutive pages of one PDF.
+
+    Returns:
+        List of manifest records, one per receipt, with the bundle's page range
+    """
+    bundle_seq, tasks = bundle
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    filename = f"{BUNDLE_PREFIX}{timestamp}_{bundle_seq:06d}_k{len(tasks)}.pdf"
+    filepath = os.path.join(_worker_state['output_dir'], filename)
+
+    records = []
+    try:
+        c = _worker_state['canvas_class'](filepath)
+        for position, (seq, family, vendor_index, variant) in enumerate(tasks):
+            data = _receipt_data(seq, family, variant)
+            page_start, page_end = render_pages(c, TEMPLATE_FAMILIES[family][1][vendor_index], data)
+            record = _manifest_record(filename, family, vendor_index, data, variant)
+            record.update({'bundle_position': position, 'page_start': page_start, 'page_end': page_end})
+            records.append(record)
+        c.save()
+        layout = _write_layout(filepath, c, [
+            (r['page_start'], r['page_end'], r['data'], r['vendor_name']) for r in records
+        ])
+    except Exception as e:
+        return [{'seq': bundle_seq, 'family': 'bundle', 'error': str(e)}]
+
+    if layout:
+        for record in records:
+            record['layout'] = layout
+    return records
+
+
+class WorkloadGenerator:
+    """Generate a mixed stream of v1 and v2 receipts sampled by template weights."""
+
+    def __init__(self, output_dir="../receipts", weights=None, workers=None, seed=None, display_list=False):
+        """
+        Initialize the workload generator.
+
+        Args:
+            output_dir: Directory to save generated PDFs (default: ../receipts)
+            weights: Family/template weights (see parse_weights). If None, uniform over all templates.
+            workers: Number of worker processes (default: CPU count)
+            seed: Optional seed for a reproducible template mix and receipt data
+            display_list: Write a "<pdf>.layout.json" display list with field bounding boxes per PDF
+        """
+        self.output_dir = output_dir
+        self.weights = weights
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+        self.display_list = display_list
+        self.slots, self.slot_weights = build_template_mix(weights)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+
+        # Create output directory if it doesn't exist
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+    def plan(self, count):
+        """
+        Sample the template for each of the next `count` receipts.
+
+        Returns:
+            List of (sequence, family, vendor_index, None) tasks
+        """
+        rng = random.Random(self.seed)
+        picks = rng.choices(self.slots, weights=self.slot_weights, k=count)
+        return [(seq, family, index, None) for seq, (family, index) in enumerate(picks)]
+
+    def plan_variants(self, count, ratios, sources, first_seq=0):
+        """
+        Plan `count` variant tasks derived from existing ground-truth records.
+
+        Args:
+            count: Number of variants to plan
+            ratios: Dictionary mapping variant kinds to relative weights
+            sources: Manifest records to derive variants from
+            first_seq: Sequence number of the first planned task
+
+        Returns:
+            List of (sequence, family, vendor_index, variant) tasks
+        """
+        if not sources or count <= 0:
+            return []
+
+        rng = random.Random(None if self.seed is None else f"{self.seed}-variants")
+        kinds = [kind for kind in VARIANT_KINDS if ratios.get(kind, 0) > 0]
+        weights = [ratios[kind] for kind in kinds]
+        tasks = []
+
+        for kind in rng.choices(kinds, weights=weights, k=count):
+            source = rng.choice(sources)
+            template_count = len(TEMPLATE_FAMILIES[source['family']][1])
+            planned = plan_variant(kind, source, template_count, rng)
+            if planned is None:
+                print(f"Skipping {kind} variant of {source['filename']} (source unavailable)")
+                continue
+            vendor_index, variant = planned
+            tasks.append((first_seq + len(tasks), source['family'], vendor_index, variant))
+
+        return tasks
+
+    def _run(self, render, tasks, manifest, pool, records, total):
+        """Render tasks in the pool, appending successful records to the manifest."""
+        chunksize = max(1, min(32, len(tasks) // (self.workers * 4)))
+        for results in pool.imap_unordered(render, tasks, chunksize=chunksize):
+            for record in results:
+                if 'error' in record:
+                    print(f"Error generating receipt {record['seq'] + 1}: {record['error']}")
+                    continue
+                manifest.write(json.dumps(record) + '\n')
+                records.append(record)
+                tag = record['family'] if 'variant' not in record else f"{record['family']}, {record['variant']}"
+                if 'page_start' in record:
+                    tag += f", page {record['page_start']}"
+                print(f"Generated ({len(records)}/{total}) [{tag}]: {record['filename']}")
+
+    def generate(self, count=10, variant_ratios=None, variant_sources=None, bundle_size=None):
+        """
+        Generate `count` receipts in the worker pool and append them to the manifest.
+
+        With variant_ratios, that fraction of the stream is made of variants
+        (duplicates, re-rendered templates, small mutations) of earlier receipts:
+        the records in variant_sources plus the fresh receipts of this run.
+        Raises ValueError when the whole stream would be variants of nothing.
+
+        With bundle_size K > 1, fresh receipts are packed K at a time into
+        multi-page bundle PDFs; their manifest records carry the bundle filename,
+        bundle_position, page_start and page_end. Variants are always written as
+        single-receipt PDFs.
+
+        Args:
+            count: Number of receipts to generate
+            variant_ratios: Dictionary from parse_variant_ratios(), or None for unique receipts only
+            variant_sources: Manifest records to derive variants from (default: this output's manifest)
+            bundle_size: Number of receipts per bundle PDF (default: one receipt per PDF)
+
+        Returns:
+            List of manifest records for the generated receipts
+        """
+        variant_ratios = variant_ratios or {}
+        rng = random.Random(None if self.seed is None else f"{self.seed}-mix")
+        fresh_ratio = max(0.0, 1.0 - sum(variant_ratios.values()))
+        variant_count = sum(1 for _ in range(count) if rng.random() >= fresh_ratio) if variant_ratios else 0
+
+        if variant_count and variant_sources is None:
+            variant_sources = load_manifest(self.manifest_path)
+        if variant_count == count and count > 0 and not variant_sources:
+            raise ValueError("Variant ratios leave no fresh receipts and there are no earlier receipts to derive "
+                             "variants from (generate originals first, or pass variant_sources)")
+
+        tasks = self.plan(count - variant_count)
+        records = []
+        start = time.perf_counter()
+
+        with open(self.manifest_path, 'a') as manifest, \
+                Pool(self.workers, initializer=_init_worker, initargs=(self.output_dir, self.seed, self.display_list)) as pool:
+            if bundle_size and bundle_size > 1:
+                bundles = [
+                    (b, tasks[i:i + bundle_size])
+                    for b, i in enumerate(range(0, len(tasks), bundle_size))
+                ]
+                self._run(_render_bundle_task, bundles, manifest, pool, records, count)
+            else:
+                self._run(_render_task, tasks, manifest, pool, records, count)
+
+            if variant_count:
+                # Variants may come from earlier manifests or from this run's fresh receipts
+                sources = list(variant_sources or []) + [
+                    dict(record, source_dir=self.output_dir) for record in records
+                ]
+                manifest.flush()
+                variant_tasks = self.plan_variants(variant_count, variant_ratios, sources, first_seq=len(tasks))
+                self._run(_render_task, variant_tasks, manifest, pool, records, count)
+
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            print(f"\n✓ Rendered {len(records)} receipts in {elapsed:.1f}s "
+                  f"({len(records) / elapsed:.1f} receipts/sec, {self.workers} workers)")
+        return records
+
+
+def main():
+    """Main function for command-line usage."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Generate a mixed stream of v1 and v2 ad-campaign receipts in PDF format"
+    )
+    parser.add_argument(
+        '-n', '--count',
+        type=int,
+        default=10,
+        help='Number of receipts to generate (default: 10)'
+    )
+    parser.add_argument(
+        '-o', '--output',
+        type=str,
+        default='../receipts',
+        help='Output directory for generated PDFs (default: ../receipts)'
+    )
+    parser.add_argument(
+        '-w', '--weights',
+        type=str,
+        help='Template weights, e.g. "v1=0.8,v2=0.2" or "v1=1,v2:0=0.5" (default: uniform over all templates)'
+    )
+    parser.add_argument(
+        '-j', '--workers',
+        type=int,
+        help='Number of worker processes (default: CPU count)'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed for a reproducible template mix and receipt data'
+    )
+    parser.add_argument(
+        '--variants',
+        type=str,
+        help='Fraction of the stream made of variants, e.g. "duplicate=0.1,retemplate=0.05,mutate=0.05" '
+             '(the remainder is fresh receipts; ratios adding up to 1 re-render existing records only)'
+    )
+    parser.add_argument(
+        '--bundle',
+        type=int,
+        metavar='K',
+        help='Pack K receipts into each multi-page bundle PDF (page ranges are recorded in the manifest)'
+    )
+    parser.add_argument(
+        '--display-list',
+        action='store_true',
+        help='Record every drawn string with its ground-truth field and bounding box to <pdf>.layout.json'
+    )
+    parser.add_argument(
+        '--variants-from',
+        type=str,
+        help='Manifest with the ground-truth records to derive variants from (default: <output>/manifest.jsonl)'
+    )
+
+    args = parser.parse_args()
+
+    weights = parse_weights(args.weights) if args.weights else None
+    variant_ratios = parse_variant_ratios(args.variants) if args.variants else None
+    variant_sources = load_manifest(args.variants_from) if args.variants_from else None
+    generator = WorkloadGenerator(
+        output_dir=args.output, weights=weights, workers=args.workers, seed=args.seed,
+        display_list=args.display_list
+    )
+
+    print(f"Generating {args.count} receipts from {len(generator.slots)} templates "
+          f"with {generator.workers} workers...")
+    records = generator.generate(
+        count=args.count, variant_ratios=variant_ratios, variant_sources=variant_sources,
+        bundle_size=args.bundle
+    )
+
+    families = {}
+    for record in records:
+        families[record['family']] = families.get(record['family'], 0) + 1
+    mix = ', '.join(f"{family}: {n}" for family, n in sorted(families.items()))
+    print(f"✓ Successfully generated {len(records)} receipts ({mix}) in '{args.output}' directory")
+
+    if variant_ratios:
+        kinds = {}
+        for record in records:
+            kinds[record.get('variant', 'fresh')] = kinds.get(record.get('variant', 'fresh'), 0) + 1
+        print("   Variants: " + ', '.join(f"{kind}: {n}" for kind, n in sorted(kinds.items())))
+    print(f"   Manifest: {generator.manifest_path}")
+
+
+if __name__ == "__main__":
+    main()
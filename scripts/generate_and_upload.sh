@@ -20,31 +20,40 @@ log "========================================="
 log "Starting receipt generation and upload"
 log "========================================="
 
-# Step 1: Generate 250 receipts
-log "Step 1: Generating 250 receipts..."
-cd "$PROJECT_ROOT/receipts.synthesis"
-python receipt_generator.py -n 250 -o "$PROJECT_ROOT/receipts" >> "$LOG_FILE" 2>&1
+# Step 1: Generate 250 receipts and upload them from memory as they are rendered
+log "Step 1: Generating and uploading 250 receipts..."
+cd "$PROJECT_ROOT/receipts-uploader"
+source venv/bin/activate
+python generate_and_upload.py -n 250 --spill-dir "$PROJECT_ROOT/receipts" >> "$LOG_FILE" 2>&1
 
 if [ $? -eq 0 ]; then
-    log "✓ Successfully generated 250 receipts"
+    log "✓ Successfully generated and uploaded receipts to Snowflake"
 else
-    log "✗ Error generating receipts"
+    log "✗ Error generating or uploading receipts"
     exit 1
 fi
 
-# Step 2: Upload to Snowflake
-log "Step 2: Uploading receipts to Snowflake..."
-cd "$PROJECT_ROOT/receipts-uploader"
-source venv/bin/activate
-python upload_receipts.py >> "$LOG_FILE" 2>&1
+# Step 2: Upload receipts that could not be uploaded from memory (written to the receipts directory)
+log "Step 2: Uploading remaining receipts to Snowflake..."
+python upload_receipts.py -d "$PROJECT_ROOT/receipts" >> "$LOG_FILE" 2>&1
 
 if [ $? -eq 0 ]; then
-    log "✓ Successfully uploaded receipts to Snowflake"
+    log "✓ Successfully uploaded remaining receipts"
 else
-    log "✗ Error uploading receipts"
+    log "✗ Error uploading remaining receipts"
     exit 1
 fi
 
+# Step 3: Archive receipts uploaded more than a day ago and delete archives older than 90 days
+log "Step 3: Archiving uploaded receipts..."
+python receipt_retention.py -d "$PROJECT_ROOT/receipts" --archive-dir "$PROJECT_ROOT/receipts_archive" >> "$LOG_FILE" 2>&1
+
+if [ $? -eq 0 ]; then
+    log "✓ Archived uploaded receipts"
+else
+    log "✗ Error archiving uploaded receipts (they stay in the receipts directory)"
+fi
+
 log "========================================="
 log "Automation cycle complete"
 log "========================================="
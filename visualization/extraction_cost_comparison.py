@@ -57,13 +57,16 @@ with st.sidebar:
     - Cortex function usage
     - Document AI usage
     - Notebook execution history
+    - `RAW.UPLOAD_RUNS` (upload_receipts.py --record-run)
     """)
     
     st.markdown("---")
     st.caption("Built with Streamlit in Snowflake")
 
 # Tabs for different views
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Overview", "🏛️ Warehouse Costs", "🤖 Cortex Costs", "📈 Trends"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(
+    ["📊 Overview", "🏛️ Warehouse Costs", "🤖 Cortex Costs", "📈 Trends", "📤 Uploads"]
+)
 
 # ============================================================================
 # TAB 1: Overview
@@ -348,6 +351,74 @@ with tab4:
         - ✅ Lower latency
         """)
 
+# ============================================================================
+# TAB 5: Upload Throughput
+# ============================================================================
+with tab5:
+    st.header("Upload Throughput")
+    st.caption("Runs of upload_receipts.py --record-run, next to the Cortex credits of the same days")
+    
+    try:
+        upload_runs = session.sql(f"""
+        SELECT 
+            DATE_TRUNC('day', started_at) AS day,
+            COUNT(*) AS runs,
+            SUM(files_uploaded) AS files_uploaded,
+            SUM(files_failed) AS files_failed,
+            SUM(bytes_uploaded) / POWER(1024, 2) AS mb_uploaded,
+            SUM(files_uploaded) / NULLIF(SUM(seconds), 0) AS files_per_sec,
+            SUM(bytes_uploaded) / POWER(1024, 2) / NULLIF(SUM(seconds), 0) AS mb_per_sec,
+            MAX(latency_p95) AS max_latency_p95,
+            SUM(retries) AS retries
+        FROM RECEIPTS_PROCESSING_DB.RAW.UPLOAD_RUNS
+        WHERE started_at >= DATEADD('day', -{days_back}, CURRENT_TIMESTAMP())
+        GROUP BY DATE_TRUNC('day', started_at)
+        ORDER BY day DESC
+        """).to_pandas()
+    except Exception:
+        upload_runs = pd.DataFrame()
+    
+    if not upload_runs.empty:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Files Uploaded", f"{upload_runs['FILES_UPLOADED'].sum():,.0f}")
+        with col2:
+            st.metric("MB Uploaded", f"{upload_runs['MB_UPLOADED'].sum():,.1f}")
+        with col3:
+            st.metric("Avg Files/sec", f"{upload_runs['FILES_PER_SEC'].mean():.1f}")
+        with col4:
+            st.metric("Retries", f"{upload_runs['RETRIES'].sum():,.0f}")
+        
+        # Daily throughput next to the daily Cortex credits
+        daily_credits = session.sql(f"""
+        SELECT 
+            DATE_TRUNC('day', START_TIME) AS day,
+            SUM(TOKEN_CREDITS) AS cortex_credits
+        FROM SNOWFLAKE.ACCOUNT_USAGE.CORTEX_FUNCTIONS_USAGE_HISTORY
+        WHERE START_TIME >= DATEADD('day', -{days_back}, CURRENT_TIMESTAMP())
+        GROUP BY DATE_TRUNC('day', START_TIME)
+        """).to_pandas()
+        combined = upload_runs.merge(daily_credits, on='DAY', how='left').fillna({'CORTEX_CREDITS': 0})
+        
+        base = alt.Chart(combined).encode(x=alt.X('DAY:T', title='Date'))
+        throughput = base.mark_bar(opacity=0.6).encode(
+            y=alt.Y('FILES_UPLOADED:Q', title='Files Uploaded'),
+            tooltip=['DAY:T', 'FILES_UPLOADED:Q', 'MB_UPLOADED:Q', 'FILES_PER_SEC:Q', 'MAX_LATENCY_P95:Q']
+        )
+        credits = base.mark_line(point=True, color='orange').encode(
+            y=alt.Y('CORTEX_CREDITS:Q', title='Cortex Credits'),
+            tooltip=['DAY:T', 'CORTEX_CREDITS:Q']
+        )
+        st.altair_chart(
+            alt.layer(throughput, credits).resolve_scale(y='independent').properties(height=400),
+            use_container_width=True
+        )
+        
+        with st.expander("View Daily Upload Runs"):
+            st.dataframe(upload_runs, use_container_width=True)
+    else:
+        st.info("No upload runs recorded yet. Run upload_receipts.py with --record-run.")
+
 # Footer
 st.markdown("---")
 st.caption("💡 Tip: Run both notebooks to collect cost data, then view this dashboard to compare efficiency")